@@ -4,6 +4,7 @@ from treebeard.admin import TreeAdmin
 from treebeard.forms import movenodeform_factory
 
 from .models import Element, ElementImage, ElementTagValue, Family, Tag, TagValue
+from .versions import values_changed
 
 
 class TagValueInline(admin.TabularInline):
@@ -66,5 +67,16 @@ class ElementAdmin(LeafletGeoAdmin):
         ElementTagValueInline,
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # values deleted by inlines have no post_delete receiver
+        tag_ids = {
+            value.tag_id
+            for formset in formsets
+            if formset.model == ElementTagValue
+            for value in formset.deleted_objects
+        }
+        values_changed([form.instance.id], tag_ids)
+
 
 admin.site.register(Element, ElementAdmin)
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Element
+
+"""
+    Index of authors with number of public elements, cached until elements
+    are created, deleted or change visibility
+"""
+
+AUTHORS_PER_PAGE = getattr(settings, "DJEOTREE_AUTHORS_PER_PAGE", 50)
+AUTHORS_TIMEOUT = getattr(settings, "DJEOTREE_AUTHORS_TIMEOUT", 60 * 60 * 24)
+VERSION_KEY = "djeotree:authors:version"
+AUTHORS_KEY = "djeotree:authors:%(version)s"
+
+
+def get_version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate_authors():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def get_authors():
+    """Returns (username, count) tuples ordered by username, one query"""
+    key = AUTHORS_KEY % {"version": get_version()}
+    authors = cache.get(key)
+    if authors is None:
+        authors = list(
+            Element.objects.filter(private=False)
+            .values_list("user__username")
+            .annotate(count=Count("id"))
+            .order_by("user__username")
+        )
+        cache.set(key, authors, AUTHORS_TIMEOUT)
+    return authors
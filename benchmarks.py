@@ -0,0 +1,356 @@
+import json
+import logging
+from contextlib import contextmanager
+from copy import deepcopy
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from djgeojson.templatetags.geojson_tags import geojsonfeature
+from filebrowser.base import FileObject
+
+from .bulk import import_elements
+from .clusters import invalidate_clusters
+from .features import get_collection
+from .models import Element, ElementImage, ElementImageVersion, Family, Tag, TagValue
+from .nearby import clear_index
+from .tiles import invalidate_tiles
+from .urls import urlpatterns
+from .utils import IMAGE_VERSIONS
+
+"""
+    Query count, wall time and response size of every djeotree url, on a
+    synthetic dataset, checked against a baseline file
+"""
+
+User = get_user_model()
+
+BASELINE = Path(__file__).resolve().parent.joinpath("tests/benchmarks.json")
+# stand-ins of project templates, so that sizes don't depend on the project
+TEMPLATE_DIR = Path(__file__).resolve().parent.joinpath("tests/templates")
+DATASET = {"depth": 3, "children": 2, "elements": 3, "tags": 3, "images": 2}
+FEATURE_SIZES = (1000, 10000, 100000)
+
+
+def seed_dataset(depth=3, children=2, elements=3, tags=3, images=2):
+    """
+    Creates a family tree of given depth and children per family, with tags
+    assigned to families and elements per family (one every three of them is
+    private and belongs to the viewer). Images are created with their version
+    manifest, without files. Returns objects used to build urls.
+    """
+    author = User.objects.create(
+        username="bench.author", password="P4s5W0r6", email="author@bench.com"
+    )
+    viewer = User.objects.create(
+        username="bench.viewer", password="P4s5W0r6", email="viewer@bench.com"
+    )
+    tag_list = [Tag.objects.create(title="Tag %s" % i) for i in range(tags)]
+    families = []
+    level = [Family.add_root(title="Family 1")]
+    for i in range(depth):
+        families.extend(level)
+        if i == depth - 1:
+            break
+        level = [
+            parent.add_child(title="%s-%s" % (parent.title, j + 1))
+            for parent in level
+            for j in range(children)
+        ]
+    if tag_list:
+        TagValue.objects.bulk_create(
+            [
+                TagValue(
+                    family=family,
+                    tag=tag_list[i % len(tag_list)],
+                    value="Value %s" % i,
+                )
+                for i, family in enumerate(families)
+            ]
+        )
+    rows = {author: [], viewer: []}
+    for i, family in enumerate(families):
+        for j in range(elements):
+            n = i * elements + j
+            rows[viewer if n % 3 == 2 else author].append(
+                {
+                    "family": family.id,
+                    "intro": "Element %s" % n,
+                    "body": "<p>Body of element %s</p>" % n,
+                    "date": "2022-%02d-%02dT12:00:00" % (n % 12 + 1, n % 28 + 1),
+                    "private": n % 3 == 2,
+                    "geom": {
+                        "type": "Point",
+                        "coordinates": [12 + n % 50 * 0.01, 41 + n // 50 * 0.01],
+                    },
+                }
+            )
+    for user, user_rows in rows.items():
+        import_elements(user_rows, user)
+    image_list = ElementImage.objects.bulk_create(
+        [
+            ElementImage(
+                element_id=id,
+                description="Image %s" % i,
+                fb_image=FileObject("uploads/images/element/bench-%s-%s.jpg" % (id, i)),
+                position=i,
+            )
+            for id in Element.objects.values_list("id", flat=True)
+            for i in range(images)
+        ]
+    )
+    ElementImageVersion.objects.bulk_create(
+        [
+            ElementImageVersion(
+                image=image,
+                name=name,
+                path=image.fb_image.version_path(name),
+            )
+            for image in image_list
+            for name in IMAGE_VERSIONS
+        ]
+    )
+    Element.refresh_popups(Element.objects.all())
+    element = Element.objects.filter(user=author, private=False).first()
+    own = Element.objects.filter(user=viewer).first()
+    return {
+        "author": author,
+        "viewer": viewer,
+        "family": families[0],
+        "tag": tag_list[0] if tag_list else None,
+        "element": element,
+        "own": own,
+        "image": own.element_image.last() if own else None,
+        "value": own.element_value.first() if own else None,
+    }
+
+
+def get_requests(data):
+    """Returns (url name, kwargs, query parameters) for every djeotree url"""
+    author, viewer = data["author"].username, data["viewer"].username
+    element, own = data["element"], data["own"]
+    date = element.date
+    image = data["image"].id if data["image"] else 0
+    value = data["value"].id if data["value"] else 0
+    tag = data["tag"].id if data["tag"] else 0
+    return [
+        ("base_list", {}, {}),
+        ("element_bbox", {}, {"bbox": "11,40,14,43"}),
+        ("element_clusters", {}, {"zoom": 8, "bbox": "11,40,14,43"}),
+        ("element_facets", {}, {"tag": tag}),
+        ("element_calendar", {}, {}),
+        ("family_lines", {}, {"zoom": 8}),
+        ("element_nearby", {}, {"lat": 41.9, "lon": 12.5}),
+        ("element_search", {}, {"q": "element"}),
+        ("element_search_features", {}, {"q": "element"}),
+        ("element_tile", {"zoom": 8, "x": 136, "y": 95}, {}),
+        ("family_list", {}, {}),
+        ("author_list", {}, {}),
+        ("tag_list", {}, {}),
+        ("family_detail", {"pk": data["family"].id}, {}),
+        ("family_download", {"pk": data["family"].id}, {}),
+        ("author_detail", {"username": author}, {}),
+        ("tag_detail", {"pk": tag}, {}),
+        ("element_create", {"username": viewer}, {}),
+        ("element_detail", {"username": author, "pk": element.id}, {}),
+        ("element_update", {"username": viewer, "pk": own.id}, {}),
+        ("element_delete", {"username": viewer, "pk": own.id}, {}),
+        ("year_detail", {"year": date.year}, {}),
+        ("month_detail", {"year": date.year, "month": date.month}, {}),
+        ("day_detail", {"year": date.year, "month": date.month, "day": date.day}, {}),
+        ("image_loop", {"pk": own.id}, {}),
+        ("image_create", {"pk": own.id}, {}),
+        ("image_change", {"pk": image}, {}),
+        ("image_delete", {"pk": image}, {}),
+        ("image_up", {"pk": image}, {}),
+        ("image_down", {"pk": image}, {}),
+        ("image_reorder", {"pk": own.id}, {}),
+        ("value_create", {"pk": own.id}, {}),
+        ("value_detail", {"pk": value}, {}),
+        ("value_change", {"pk": value}, {}),
+        ("value_delete", {"pk": value}, {}),
+    ]
+
+
+@contextmanager
+def isolated_environment():
+    """
+    Switches every cache to a private local memory cache, so that versions
+    and pages of the synthetic dataset don't outlive the rollback, and
+    renders pages with the stand-in project templates of TEMPLATE_DIR
+    """
+    isolated = {
+        alias: {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "djeotree-benchmarks-%s" % alias,
+        }
+        for alias in settings.CACHES
+    }
+    templates = deepcopy(settings.TEMPLATES)
+    templates[0]["DIRS"] = [TEMPLATE_DIR] + list(templates[0].get("DIRS", []))
+    with override_settings(CACHES=isolated, TEMPLATES=templates):
+        # the spatial index follows a counter of the cache in use
+        clear_index()
+        try:
+            yield
+        finally:
+            for alias in isolated:
+                caches[alias].clear()
+            clear_index()
+
+
+def benchmark(dataset):
+    """
+    Seeds dataset and runs benchmarks in an isolated environment, rolling
+    back all changes. Returns results of run_benchmarks.
+    """
+    with isolated_environment(), transaction.atomic():
+        results = run_benchmarks(seed_dataset(**dataset))
+        transaction.set_rollback(True)
+    return results
+
+
+def get_url_names():
+    return {pattern.name for pattern in urlpatterns}
+
+
+def measure(client, url, query, **headers):
+    """Returns status, query count, milliseconds and bytes of a GET request"""
+    with CaptureQueriesContext(connection) as queries:
+        start = perf_counter()
+        response = client.get(url, query, **headers)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        time = (perf_counter() - start) * 1000
+    return {
+        "status": response.status_code,
+        "queries": len(queries),
+        "time": round(time, 1),
+        "size": size,
+    }
+
+
+def run_benchmarks(data):
+    """
+    Requests every url as anonymous and authenticated user, with and without
+    htmx headers. Caches are invalidated and database changes are rolled back
+    after each request, so that all requests see the same data.
+    """
+    results = {}
+    # denied and missing urls are expected, don't log them
+    logger = logging.getLogger("django.request")
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    anonymous = Client()
+    authenticated = Client()
+    authenticated.force_login(data["viewer"])
+    for name, kwargs, query in get_requests(data):
+        url = reverse("geotree:" + name, kwargs=kwargs)
+        for user, client in (("anonymous", anonymous), ("user", authenticated)):
+            for mode, headers in (("page", {}), ("htmx", {"HTTP_HX_REQUEST": "true"})):
+                invalidate_clusters()
+                invalidate_tiles()
+                with transaction.atomic():
+                    results["%s %s %s" % (name, mode, user)] = measure(
+                        client, url, query, **headers
+                    )
+                    transaction.set_rollback(True)
+    logger.setLevel(level)
+    return results
+
+
+def load_baseline(path=BASELINE):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(dataset, results, path=BASELINE):
+    with open(path, "w") as file:
+        json.dump({"dataset": dataset, "results": results}, file, indent=2)
+        file.write("\n")
+
+
+def check_baseline(results, baseline, time_factor=3.0, time_margin=10, size_factor=1.1):
+    """
+    Returns a list of regressions against baseline results: more queries,
+    different status, response size or wall time exceeding baseline by given
+    factors (plus a margin in milliseconds, so that very fast requests don't
+    fail on noise). Timing is skipped if time_factor is None.
+    """
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if not expected:
+            regressions.append("%s: missing from baseline" % key)
+            continue
+        if result["status"] != expected["status"]:
+            regressions.append(
+                "%s: status %s, baseline %s"
+                % (key, result["status"], expected["status"])
+            )
+        if result["queries"] > expected["queries"]:
+            regressions.append(
+                "%s: %s queries, baseline %s"
+                % (key, result["queries"], expected["queries"])
+            )
+        if result["size"] > expected["size"] * size_factor:
+            regressions.append(
+                "%s: %s bytes, baseline %s" % (key, result["size"], expected["size"])
+            )
+        max_time = expected["time"] * (time_factor or 0) + time_margin
+        if time_factor and result["time"] > max_time:
+            regressions.append(
+                "%s: %sms, baseline %sms" % (key, result["time"], expected["time"])
+            )
+    return regressions
+
+
+def get_rows(start, stop):
+    for n in range(start, stop):
+        yield {
+            "family": None,
+            "intro": "Element %s" % n,
+            "body": "",
+            "date": "",
+            "private": False,
+            "geom": {
+                "type": "Point",
+                "coordinates": [12 + n % 500 * 0.001, 41 + n // 500 * 0.001],
+            },
+        }
+
+
+def compare_serializers(sizes=FEATURE_SIZES):
+    """
+    Serializes growing numbers of elements with djgeojson's geojsonfeature
+    filter and with features.get_collection, checking that outputs match.
+    Returns a list of (features, filter milliseconds, collection milliseconds).
+    """
+    user = User.objects.create(
+        username="bench.features", password="P4s5W0r6", email="features@bench.com"
+    )
+    family = Family.add_root(title="Features")
+    results = []
+    count = 0
+    for size in sorted(sizes):
+        import_elements(get_rows(count, size), user, family=family)
+        count = size
+        queryset = Element.objects.filter(family=family).order_by("id")
+        start = perf_counter()
+        expected = geojsonfeature(queryset, "popupContent")
+        filter_time = (perf_counter() - start) * 1000
+        start = perf_counter()
+        collection = get_collection(queryset)
+        collection_time = (perf_counter() - start) * 1000
+        if json.loads(collection) != json.loads(expected):
+            raise ValueError("Collections differ at %s features" % size)
+        results.append((size, round(filter_time, 1), round(collection_time, 1)))
+    return results
@@ -0,0 +1,159 @@
+import csv
+import json
+from itertools import islice
+from time import perf_counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now
+from django.utils.translation import gettext as _
+
+from .authors import invalidate_authors
+from .clusters import invalidate_clusters
+from .dates import invalidate_calendar
+from .inheritance import get_inherited_values
+from .models import Element, ElementTagValue, Family
+from .nearby import invalidate_nearby
+from .search import index_elements
+from .tiles import invalidate_tiles
+from .utils import get_coordinates
+from .versions import AUTHOR_KEY, DATA_KEY, TAG_KEY, bump_families, bump_versions
+
+"""
+    Bulk import of elements, bypassing per row signals
+"""
+
+TRUE_STRINGS = ("1", "true", "yes", "y")
+
+
+def parse_date(value):
+    if not value:
+        return now()
+    date = parse_datetime(value)
+    if not date:
+        raise ValueError(_("Invalid date: %(date)s") % {"date": value})
+    if settings.USE_TZ and is_naive(date):
+        date = make_aware(date)
+    return date
+
+
+def parse_private(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_STRINGS
+
+
+def read_geojson(file):
+    """Yields rows from a GeoJSON FeatureCollection of Points"""
+    collection = json.load(file)
+    for feature in collection["features"]:
+        properties = feature.get("properties") or {}
+        yield {
+            "family": properties.get("family"),
+            "intro": properties.get("intro"),
+            "body": properties.get("body"),
+            "date": properties.get("date"),
+            "private": properties.get("private", False),
+            "geom": feature["geometry"],
+        }
+
+
+def read_csv(file):
+    """
+    Yields rows from a csv file with family, intro, body, date, private,
+    latitude and longitude columns (only latitude and longitude are required)
+    """
+    for row in csv.DictReader(file):
+        yield {
+            "family": row.get("family"),
+            "intro": row.get("intro"),
+            "body": row.get("body"),
+            "date": row.get("date"),
+            "private": row.get("private", False),
+            "geom": {
+                "type": "Point",
+                "coordinates": [float(row["longitude"]), float(row["latitude"])],
+            },
+        }
+
+
+def import_elements(rows, user, family=None, chunk_size=1000):
+    """
+    Creates elements from an iterable of rows (see read_geojson and
+    read_csv) in chunks, bulk creating inherited tag values, popups and
+    search documents for each chunk. Family lines are rebuilt once per
+    affected family, clusters, tiles, authors, calendar, spatial index and
+    data versions are invalidated at the end.
+    family is used for rows without one. Returns number of elements and
+    elapsed seconds.
+    """
+    start = perf_counter()
+    rows = iter(rows)
+    inherited = {}
+    family_ids = set()
+    count = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        elements = []
+        for i, row in enumerate(chunk, start=count + 1):
+            lon, lat = get_coordinates(row["geom"])[:2]
+            family_id = row["family"] or (family.id if family else None)
+            if not family_id:
+                raise ValueError(_("Row %(row)s has no family") % {"row": i})
+            elements.append(
+                Element(
+                    user=user,
+                    family_id=int(family_id),
+                    intro=row["intro"],
+                    body=row["body"],
+                    date=parse_date(row["date"]),
+                    geom=row["geom"],
+                    lat=lat,
+                    lon=lon,
+                    private=parse_private(row["private"]),
+                )
+            )
+        missing = {e.family_id for e in elements} - set(inherited)
+        if missing:
+            inherited.update(get_inherited_values(missing))
+            unknown = missing - set(inherited)
+            if unknown:
+                raise ValueError(
+                    _("Unknown families: %(ids)s")
+                    % {"ids": ", ".join(str(id) for id in sorted(unknown))}
+                )
+        with transaction.atomic():
+            Element.objects.bulk_create(elements)
+            Element.refresh_popups(
+                Element.objects.filter(id__in=[e.id for e in elements]),
+                batch_size=chunk_size,
+            )
+            ElementTagValue.objects.bulk_create(
+                [
+                    ElementTagValue(
+                        tag_id=tag_id, element_id=e.id, value=value, inherited=True
+                    )
+                    for e in elements
+                    for tag_id, value in inherited[e.family_id].items()
+                ],
+                batch_size=chunk_size,
+            )
+            index_elements([e.id for e in elements], batch_size=chunk_size)
+        family_ids.update(e.family_id for e in elements if not e.private)
+        count += len(elements)
+    for parent in Family.objects.filter(id__in=family_ids):
+        parent.rebuild_line()
+        parent.save(update_fields=["geom"])
+    invalidate_clusters()
+    invalidate_tiles()
+    invalidate_authors()
+    invalidate_calendar()
+    transaction.on_commit(invalidate_nearby)
+    # inherited holds every family with imported elements
+    tag_ids = {tag_id for values in inherited.values() for tag_id in values}
+    bump_versions([DATA_KEY, AUTHOR_KEY % user.pk] + [TAG_KEY % id for id in tag_ids])
+    bump_families(inherited)
+    return count, perf_counter() - start
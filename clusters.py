@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext as _
+
+from .models import Element
+from .utils import in_bbox, lonlat_to_pixel
+
+"""
+    Grid clustering of elements, precomputed for all zoom levels and cached
+"""
+
+# side of the grid cell in pixels
+CLUSTER_RADIUS = getattr(settings, "DJEOTREE_CLUSTER_RADIUS", 60)
+# deepest clustered zoom level, higher levels get its clusters
+CLUSTER_MAX_ZOOM = getattr(settings, "DJEOTREE_CLUSTER_MAX_ZOOM", 16)
+CLUSTER_TIMEOUT = getattr(settings, "DJEOTREE_CLUSTER_TIMEOUT", 60 * 60 * 24)
+VERSION_KEY = "djeotree:clusters:version"
+# tag filtered pyramids also depend on tag values
+FILTERED_VERSION_KEY = "djeotree:clusters:version:filtered"
+
+
+def get_version(filtered=False):
+    version = cache.get_or_set(VERSION_KEY, 1, None)
+    if filtered:
+        version = "%s.%s" % (version, cache.get_or_set(FILTERED_VERSION_KEY, 1, None))
+    return version
+
+
+def invalidate_clusters(filtered=False):
+    """
+    Makes all cached pyramids obsolete, called when elements change, or only
+    tag filtered ones if filtered, when tag values change
+    """
+    key = FILTERED_VERSION_KEY if filtered else VERSION_KEY
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def build_pyramid(rows):
+    """
+    Clusters (id, lon, lat) rows on a grid for every zoom level. Cells of
+    a zoom level are made of four cells of the next one, so clusters are
+    computed on the deepest level and then merged going up. Each cluster is
+    a [sum of lon, sum of lat, count, representative id] list, representative
+    is the first row of the cluster. Returns a list of cluster lists by zoom.
+    """
+    cells = {}
+    for id, lon, lat in rows:
+        x, y = lonlat_to_pixel(lon, lat, CLUSTER_MAX_ZOOM)
+        key = (int(x // CLUSTER_RADIUS), int(y // CLUSTER_RADIUS))
+        cluster = cells.get(key)
+        if cluster:
+            cluster[0] += lon
+            cluster[1] += lat
+            cluster[2] += 1
+        else:
+            cells[key] = [lon, lat, 1, id]
+    pyramid = [list(cells.values())]
+    for zoom in range(CLUSTER_MAX_ZOOM - 1, -1, -1):
+        parents = {}
+        for (x, y), cluster in cells.items():
+            key = (x // 2, y // 2)
+            parent = parents.get(key)
+            if parent:
+                parent[0] += cluster[0]
+                parent[1] += cluster[1]
+                parent[2] += cluster[2]
+            else:
+                parents[key] = cluster.copy()
+        cells = parents
+        pyramid.insert(0, list(cells.values()))
+    return pyramid
+
+
+def get_clusters(queryset, visibility, zoom, filtered=False):
+    """
+    Returns clusters of queryset for zoom level as (lon, lat, count, id)
+    tuples. Pyramids are cached by visibility class (i.e. 'public' or a user
+    id), the whole pyramid is computed and stored at first cache miss.
+    Pyramids of querysets filtered by tag values must be marked as filtered.
+    """
+    zoom = max(min(zoom, CLUSTER_MAX_ZOOM), 0)
+    prefix = "djeotree:clusters:%(version)s:%(visibility)s:" % {
+        "version": get_version(filtered=filtered),
+        "visibility": visibility,
+    }
+    clusters = cache.get(prefix + str(zoom))
+    if clusters is None:
+        rows = queryset.order_by("-date").values_list("id", "lon", "lat")
+        pyramid = build_pyramid(rows.iterator())
+        cache.set_many(
+            {prefix + str(z): level for z, level in enumerate(pyramid)},
+            CLUSTER_TIMEOUT,
+        )
+        clusters = pyramid[zoom]
+    return [(lon / count, lat / count, count, id) for lon, lat, count, id in clusters]
+
+
+def get_cluster_collection(queryset, visibility, zoom, bbox=None, filtered=False):
+    """
+    Returns a GeoJSON FeatureCollection of clusters inside bbox. Properties
+    hold the count and the popup of the representative element.
+    """
+    clusters = get_clusters(queryset, visibility, zoom, filtered=filtered)
+    if bbox:
+        clusters = [c for c in clusters if in_bbox(c[0], c[1], bbox)]
+    elements = Element.objects.select_related("family", "user").in_bulk(
+        [c[3] for c in clusters]
+    )
+    features = []
+    for lon, lat, count, id in clusters:
+        if id not in elements:
+            # element deleted meanwhile
+            continue
+        popup = elements[id].popupContent
+        if count > 1:
+            title = "<h5>%(count)s %(elements)s</h5>" % {
+                "count": count,
+                "elements": _("elements"),
+            }
+            popup = {"content": title + popup["content"]}
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "properties": {"count": count, "popupContent": popup},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
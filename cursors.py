@@ -0,0 +1,85 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import FloatField, Q
+
+"""
+    Keyset (cursor) pagination of querysets ordered on unique field tuples,
+    i.e. ("family", "id") or ("date", "id"). Pages are fetched with a WHERE
+    clause on the last row of the previous page instead of an OFFSET, so
+    their cost doesn't grow with the page number. Annotations are taken as
+    floats, i.e. ("rank", "id") of search results.
+"""
+
+ELEMENTS_PER_PAGE = getattr(settings, "DJEOTREE_ELEMENTS_PER_PAGE", 100)
+
+
+def encode_cursor(values):
+    return urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(model, fields, cursor):
+    """Returns values of fields from cursor, raises ValueError if invalid"""
+    try:
+        values = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError("Wrong number of cursor values")
+        return [
+            get_field(model, field).to_python(value)
+            for field, value in zip(fields, values)
+        ]
+    except (TypeError, ValidationError, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+
+
+def get_field(model, name):
+    """Returns field of model, a float field for annotations, i.e. rank"""
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        field = FloatField()
+        field.set_attributes_from_name(name)
+        return field
+
+
+def get_values(instance, fields):
+    """Returns values of fields of instance, foreign keys as ids"""
+    return [getattr(instance, get_field(instance, field).attname) for field in fields]
+
+
+def get_cursor(values):
+    """Returns cursor pointing after values"""
+    values = list(values)
+    for i, value in enumerate(values):
+        if isinstance(value, datetime):
+            values[i] = value.isoformat()
+    return encode_cursor(values)
+
+
+def after(fields, values):
+    """Q of rows following values in ascending order of fields"""
+    q = Q(**{fields[0] + "__gt": values[0]})
+    if len(fields) == 1:
+        return q
+    return q | Q(**{fields[0]: values[0]}) & after(fields[1:], values[1:])
+
+
+def get_page(queryset, fields, cursor=None, size=ELEMENTS_PER_PAGE):
+    """
+    Returns (page, next cursor) of queryset, which must be ordered by fields.
+    page is an evaluated queryset, next cursor is None on the last page.
+    """
+    if cursor:
+        values = decode_cursor(queryset.model, fields, cursor)
+        queryset = queryset.filter(after(fields, values))
+    page = queryset[:size]
+    # evaluated here, templates and the features filter reuse the results
+    if len(page) < size:
+        return page, None
+    values = get_values(page[size - 1], fields)
+    if not queryset.filter(after(fields, values)).exists():
+        return page, None
+    return page, get_cursor(values)
@@ -0,0 +1,130 @@
+from calendar import monthrange
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+from .models import Element
+
+"""
+    Calendar of element counts per year, month and day, computed with one
+    grouped query and cached by visibility class until elements are created,
+    deleted or change date or visibility
+"""
+
+CALENDAR_TIMEOUT = getattr(settings, "DJEOTREE_CALENDAR_TIMEOUT", 60 * 60 * 24)
+VERSION_KEY = "djeotree:calendar:version"
+CALENDAR_KEY = "djeotree:calendar:%(version)s:%(visibility)s"
+# heat levels of calendar cells, 0 is empty
+LEVELS = 4
+
+
+def get_version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate_calendar():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def get_visibility(user):
+    """Returns 'public', or user id if user has private elements"""
+    if (
+        user.is_authenticated
+        and Element.objects.filter(user_id=user.uuid, private=True).exists()
+    ):
+        return str(user.uuid)
+    return "public"
+
+
+def set_levels(items):
+    """Sets heat level of items, relative to the busiest one"""
+    top = max([item["count"] for item in items], default=0)
+    for item in items:
+        # ceiling, so that any count gets at least level 1
+        item["level"] = -(-item["count"] * LEVELS // top) if top else 0
+
+
+def build_calendar(rows):
+    """
+    Nests (day, count) rows ordered by day into a list of years, each
+    {"year", "count", "level", "months"}, months hold days in the same way.
+    Levels go from 1 to LEVELS, relative to the busiest sibling.
+    """
+    years = []
+    for day, count in rows:
+        if not years or years[-1]["year"] != day.year:
+            years.append({"year": day.year, "count": 0, "months": []})
+        months = years[-1]["months"]
+        if not months or months[-1]["month"] != day.month:
+            months.append({"month": day.month, "count": 0, "days": []})
+        months[-1]["days"].append({"day": day.day, "count": count})
+        months[-1]["count"] += count
+        years[-1]["count"] += count
+    set_levels(years)
+    for year in years:
+        set_levels(year["months"])
+        for month in year["months"]:
+            set_levels(month["days"])
+    return years
+
+
+def get_calendar(user):
+    """
+    Returns the calendar of elements visible to user (see build_calendar),
+    cached by visibility class
+    """
+    key = CALENDAR_KEY % {
+        "version": get_version(),
+        "visibility": get_visibility(user),
+    }
+    calendar = cache.get(key)
+    if calendar is None:
+        rows = (
+            Element.objects.visible_to(user)
+            .annotate(day=TruncDate("date"))
+            .values_list("day")
+            .annotate(count=Count("id"))
+            .order_by("day")
+        )
+        calendar = build_calendar(rows)
+        cache.set(key, calendar, CALENDAR_TIMEOUT)
+    return calendar
+
+
+def fill(items, key, dates):
+    """
+    Returns {"date", "count", "level"} for all dates, matching items on
+    key (month or day) of date, missing ones are empty
+    """
+    found = {item[key]: item for item in items}
+    cells = []
+    for when in dates:
+        item = found.get(getattr(when, key), {})
+        cells.append(
+            {
+                "date": when,
+                "count": item.get("count", 0),
+                "level": item.get("level", 0),
+            }
+        )
+    return cells
+
+
+def get_months(calendar, year):
+    """Returns all twelve months of year in calendar, see fill"""
+    months = next((item["months"] for item in calendar if item["year"] == year), [])
+    return fill(months, "month", [date(year, month, 1) for month in range(1, 13)])
+
+
+def get_days(calendar, year, month):
+    """Returns all days of month in calendar, see fill"""
+    months = next((item["months"] for item in calendar if item["year"] == year), [])
+    days = next((item["days"] for item in months if item["month"] == month), [])
+    last = monthrange(year, month)[1]
+    return fill(days, "day", [date(year, month, day) for day in range(1, last + 1)])
@@ -0,0 +1,143 @@
+import json
+from itertools import islice
+
+from django.db.models import TextField
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Cast
+from django.utils.translation import get_language
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+    GeoJSON FeatureCollections of elements and family lines, built from
+    values rows. Geometries and stored popups are read from the database as
+    JSON text and joined without decoding, output matches the one of
+    djgeojson's geojsonfeature filter with popupContent property.
+"""
+
+CRS = {
+    "type": "link",
+    "properties": {
+        "href": "http://spatialreference.org/ref/epsg/4326/",
+        "type": "proj4",
+    },
+}
+HEADER = '{"type": "FeatureCollection", "features": ['
+FEATURE = (
+    '{"type": "Feature", "properties": {"popupContent": %(popup)s, '
+    '"model": "%(model)s"}, "id": %(id)d, "geometry": %(geom)s}'
+)
+FOOTER = '], "crs": %s}' % json.dumps(CRS)
+
+
+def dumps(value):
+    """Encodes value as JSON string, with orjson if installed"""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+def get_rows(queryset, geom=None):
+    """
+    Returns (id, geometry, popup) values of queryset, as JSON text. geom is
+    an expression replacing the geom field, i.e. a simplified family line.
+    """
+    return queryset.annotate(
+        geom_json=geom or Cast("geom", TextField()),
+        # popups are stored by language, see Element.refresh_popup
+        popup_json=Cast(KeyTransform(get_language(), "popup_cache"), TextField()),
+    ).values_list("id", "geom_json", "popup_json")
+
+
+def get_instance_rows(instances):
+    """Returns (id, geometry, popup) values of loaded instances, as JSON text"""
+    return [
+        (
+            instance.id,
+            None if instance.geom is None else dumps(instance.geom),
+            dumps(instance.popupContent),
+        )
+        for instance in instances
+    ]
+
+
+def get_geometry(geom):
+    if geom is None:
+        return "null"
+    if geom.startswith('"'):
+        # geometry was saved as a string, i.e. in tests
+        return json.loads(geom)
+    return geom
+
+
+def get_missing_popups(model, ids):
+    """
+    Returns popups missing from storage as JSON, computed from instances.
+    Rows deleted meanwhile get an empty popup.
+    """
+    if model._meta.label_lower != "djeotree.element":
+        instances = model.objects.in_bulk(ids)
+        return {
+            id: dumps(instances[id].get_popup_content() if id in instances else {})
+            for id in ids
+        }
+    # family, user and first image are in element popups
+    instances = (
+        model.objects.select_related("family", "user")
+        .defer("family__geom", "family__popup_cache")
+        .in_bulk(ids)
+    )
+    images = model.get_first_images(ids)
+    return {
+        id: dumps(
+            instances[id].get_popup_content(image=images.get(id))
+            if id in instances
+            else {}
+        )
+        for id in ids
+    }
+
+
+def iter_collection(queryset, chunk_size=1000, geom=None):
+    """
+    Yields the FeatureCollection of queryset (of Element or Family) in
+    chunks of chunk_size features. Popups missing from storage are computed,
+    instances are used if queryset was already evaluated (and geom is not
+    replaced, see get_rows).
+    """
+    model = queryset.model._meta.label_lower
+    if queryset._result_cache is not None and geom is None:
+        # already evaluated by the template, don't query again
+        rows = iter(get_instance_rows(queryset))
+    else:
+        rows = get_rows(queryset, geom=geom).iterator(chunk_size=chunk_size)
+    yield HEADER
+    separator = ""
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        missing = [id for id, geom, popup in chunk if popup is None]
+        if missing:
+            popups = get_missing_popups(queryset.model, missing)
+        features = [
+            FEATURE
+            % {
+                "popup": popups[id] if popup is None else popup,
+                "model": model,
+                "id": id,
+                "geom": get_geometry(geom),
+            }
+            for id, geom, popup in chunk
+        ]
+        yield separator + ", ".join(features)
+        separator = ", "
+    yield FOOTER
+
+
+def get_collection(queryset, chunk_size=1000, geom=None):
+    """Returns the whole FeatureCollection of queryset as a string"""
+    return "".join(iter_collection(queryset, chunk_size=chunk_size, geom=geom))
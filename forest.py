@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Family
+
+"""
+    Family forest (annotated lists of all family trees) built with a single
+    query and cached until the tree changes
+"""
+
+FOREST_TIMEOUT = getattr(settings, "DJEOTREE_FOREST_TIMEOUT", 60 * 60 * 24)
+VERSION_KEY = "djeotree:forest:version"
+FOREST_KEY = "djeotree:forest:%(version)s"
+
+
+def get_version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate_forest():
+    """Makes cached forest obsolete, called when families change"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def build_forest(rows):
+    """
+    Returns a list of annotated lists, one for each root, from (id, title,
+    depth) rows ordered by path. Items are (family, info) tuples as in
+    treebeard's get_annotated_list, family is a dictionary with id and title.
+    """
+    forest = []
+    info = {}
+    prev_depth = None
+    for id, title, depth in rows:
+        if depth == 1:
+            if prev_depth:
+                info["close"] = list(range(prev_depth))
+            forest.append([])
+            prev_depth = None
+        elif prev_depth is not None and depth < prev_depth:
+            info["close"] = list(range(prev_depth - depth))
+        info = {
+            "open": prev_depth is None or depth > prev_depth,
+            "close": [],
+            "level": depth - 1,
+        }
+        forest[-1].append(({"id": id, "title": title}, info))
+        prev_depth = depth
+    if prev_depth:
+        info["close"] = list(range(prev_depth))
+    return forest
+
+
+def get_forest():
+    """Returns the family forest from cache, building it if missing"""
+    key = FOREST_KEY % {"version": get_version()}
+    forest = cache.get(key)
+    if forest is None:
+        rows = Family.objects.order_by("path").values_list("id", "title", "depth")
+        forest = build_forest(rows)
+        cache.set(key, forest, FOREST_TIMEOUT)
+    return forest
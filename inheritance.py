@@ -0,0 +1,150 @@
+from itertools import islice
+from threading import local
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import Element, ElementTagValue, Family, TagValue
+from .versions import values_changed
+
+"""
+    Tag values inherited by elements from their family and its ancestors.
+    Inherited element tag values are kept in sync in bulk, values added or
+    changed by authors are left alone.
+"""
+
+# families waiting for the commit of the transaction that changed them
+_pending = local()
+
+
+def get_inherited_values(family_ids):
+    """
+    Returns a dictionary of {tag_id: value} inherited by elements of each
+    family. Values of a family override values of its ancestors for the same
+    tag. Two queries overall.
+    """
+    families = Family.objects.filter(id__in=family_ids).only("path", "depth")
+    paths = {}
+    for family in families:
+        paths[family.id] = [
+            family.path[0 : i * Family.steplen] for i in range(1, family.depth + 1)
+        ]
+    all_paths = {path for family_paths in paths.values() for path in family_paths}
+    by_path = {}
+    values = (
+        TagValue.objects.filter(family__path__in=all_paths)
+        .order_by("id")
+        .values_list("family__path", "tag_id", "value")
+    )
+    for path, tag_id, value in values:
+        by_path.setdefault(path, []).append((tag_id, value))
+    return {
+        id: dict(value for path in family_paths for value in by_path.get(path, []))
+        for id, family_paths in paths.items()
+    }
+
+
+def sync_elements(elements, inherited=None, batch_size=1000):
+    """
+    Creates, updates and deletes inherited tag values of elements (an
+    iterable of (id, family id) tuples), in batches. Tags with a value set
+    by the author are not inherited. inherited is the result of
+    get_inherited_values, computed if missing. Returns number of created,
+    updated and deleted values. Versions of touched tags are bumped and
+    search documents of touched elements are stored.
+    """
+    elements = iter(elements)
+    inherited = {} if inherited is None else inherited
+    created = updated = deleted = 0
+    element_ids, tag_ids = set(), set()
+    while True:
+        chunk = dict(islice(elements, batch_size))
+        if not chunk:
+            break
+        missing = set(chunk.values()) - set(inherited)
+        if missing:
+            inherited.update(get_inherited_values(missing))
+        existing = {}
+        own = set()
+        values = ElementTagValue.objects.filter(element_id__in=list(chunk))
+        values = values.order_by("id")
+        for value in values:
+            if value.inherited:
+                existing.setdefault((value.element_id, value.tag_id), []).append(value)
+            else:
+                own.add((value.element_id, value.tag_id))
+        to_create, to_update, to_delete = [], [], []
+        for id, family_id in chunk.items():
+            for tag_id, value in inherited.get(family_id, {}).items():
+                if (id, tag_id) in own:
+                    continue
+                rows = existing.pop((id, tag_id), [])
+                if not rows:
+                    to_create.append(
+                        ElementTagValue(
+                            element_id=id, tag_id=tag_id, value=value, inherited=True
+                        )
+                    )
+                    continue
+                # duplicates come from tags repeated along the tree
+                to_delete.extend(row for row in rows[1:])
+                if rows[0].value != value:
+                    rows[0].value = value
+                    to_update.append(rows[0])
+        # tags no longer inherited
+        to_delete.extend(row for rows in existing.values() for row in rows)
+        element_ids.update(row.element_id for row in to_create + to_update + to_delete)
+        tag_ids.update(row.tag_id for row in to_create + to_update + to_delete)
+        with transaction.atomic():
+            ElementTagValue.objects.bulk_create(to_create, batch_size=batch_size)
+            ElementTagValue.objects.bulk_update(
+                to_update, ["value"], batch_size=batch_size
+            )
+            ElementTagValue.objects.filter(
+                id__in=[row.id for row in to_delete]
+            ).delete()
+        created += len(to_create)
+        updated += len(to_update)
+        deleted += len(to_delete)
+    if tag_ids:
+        # bulk operations skip signals
+        values_changed(element_ids, tag_ids)
+    return created, updated, deleted
+
+
+def sync_family(family, batch_size=1000):
+    """Syncs inherited tag values of all elements of family and descendants"""
+    family_ids = family.get_subtree().values_list("id", flat=True)
+    elements = (
+        Element.objects.in_subtree(family)
+        .order_by("id")
+        .values_list("id", "family_id")
+        .iterator(chunk_size=batch_size)
+    )
+    return sync_elements(
+        elements, inherited=get_inherited_values(family_ids), batch_size=batch_size
+    )
+
+
+def sync_family_on_commit(family_id, using=DEFAULT_DB_ALIAS):
+    """
+    Syncs family after commit. Families changed in a transaction are pending
+    in this thread until the first callback syncs them all, so each family is
+    synced once however many of its values change.
+    """
+    if not hasattr(_pending, "family_ids"):
+        _pending.family_ids = {}
+    _pending.family_ids.setdefault(using, set()).add(family_id)
+    transaction.on_commit(lambda: sync_pending(using), using=using)
+
+
+def sync_pending(using=DEFAULT_DB_ALIAS):
+    """Syncs pending families, those in the subtree of another one with it"""
+    family_ids = getattr(_pending, "family_ids", {}).pop(using, None)
+    if not family_ids:
+        return
+    # families may be deleted in cascade meanwhile
+    synced = []
+    for family in Family.objects.filter(id__in=family_ids).order_by("path"):
+        if not any(family.path.startswith(path) for path in synced):
+            sync_family(family)
+            synced.append(family.path)
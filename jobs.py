@@ -0,0 +1,82 @@
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .models import Element, ElementImage, ElementImageJob, image_processed
+from .utils import generate_versions
+
+"""
+    Database backed queue of image version jobs, consumed by the
+    process_image_jobs command. Jobs are claimed with conditional updates,
+    so that more workers can run at once without a broker or row locks.
+"""
+
+# running jobs older than this are considered abandoned by a dead worker
+JOB_TIMEOUT = getattr(settings, "DJEOTREE_IMAGE_JOB_TIMEOUT", 10 * 60)
+JOB_ATTEMPTS = getattr(settings, "DJEOTREE_IMAGE_JOB_ATTEMPTS", 3)
+
+
+def claim_job():
+    """Marks next pending or abandoned job as running and returns it"""
+    abandoned = Q(
+        status=ElementImageJob.RUNNING,
+        started__lt=now() - timedelta(seconds=JOB_TIMEOUT),
+    )
+    candidates = (
+        ElementImageJob.objects.filter(Q(status=ElementImageJob.PENDING) | abandoned)
+        .order_by("id")
+        .values_list("id", "status", "started")[:10]
+    )
+    for id, status, started in candidates:
+        claimed = ElementImageJob.objects.filter(
+            id=id, status=status, started=started
+        ).update(
+            status=ElementImageJob.RUNNING,
+            started=now(),
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return ElementImageJob.objects.select_related("image").get(id=id)
+    return None
+
+
+def run_job(job):
+    """
+    Generates versions of job image and refreshes the popup of its element.
+    Failed jobs are retried up to JOB_ATTEMPTS times. Returns True on success.
+    """
+    image = job.image
+    try:
+        image.set_versions(generate_versions(image.fb_image))
+        # first image may be in element popup
+        Element.refresh_popups(Element.objects.filter(id=image.element_id))
+    except Exception:
+        job.status = ElementImageJob.PENDING
+        if job.attempts >= JOB_ATTEMPTS:
+            job.status = ElementImageJob.FAILED
+        job.error = traceback.format_exc()
+        job.save(update_fields=["status", "error"])
+        return False
+    job.status = ElementImageJob.DONE
+    job.finished = now()
+    job.error = ""
+    job.save(update_fields=["status", "finished", "error"])
+    image_processed.send(sender=ElementImage, instance=image)
+    return True
+
+
+def process_jobs(limit=None):
+    """Runs queued jobs until the queue is empty, returns (done, failed)"""
+    done = failed = 0
+    while limit is None or done + failed < limit:
+        job = claim_job()
+        if not job:
+            break
+        if run_job(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
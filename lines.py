@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.db.models import OuterRef, Subquery, TextField
+from django.db.models.functions import Cast, Coalesce
+
+from .features import get_collection
+from .models import FamilyLine
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+    Family lines simplified with the Douglas-Peucker algorithm for bands of
+    zoom levels, stored as FamilyLine rows when family lines change. Lines are
+    served in full above the last band, or if numpy is not installed.
+"""
+
+# each band holds the line for zoom levels up to its zoom
+LINE_ZOOMS = getattr(settings, "DJEOTREE_LINE_ZOOMS", [4, 8, 12])
+# maximum distance in pixels of dropped points from the simplified line
+LINE_TOLERANCE = getattr(settings, "DJEOTREE_LINE_TOLERANCE", 1.0)
+
+
+def get_band(zoom):
+    """Returns zoom of the band serving zoom level, None for full lines"""
+    for band in sorted(LINE_ZOOMS):
+        if zoom <= band:
+            return band
+    return None
+
+
+def get_tolerance(zoom):
+    """Returns LINE_TOLERANCE pixels at zoom level in degrees"""
+    return LINE_TOLERANCE * 360 / (256 * 2**zoom)
+
+
+def simplify(coords, tolerance):
+    """
+    Returns coordinates of the line farther than tolerance from their
+    simplified segment, always keeping endpoints. Each pass splits all
+    segments at once at their farthest point, with vectorised distances,
+    until every point is within tolerance.
+    """
+    if len(coords) < 3:
+        return coords
+    points = np.array([c[:2] for c in coords], dtype=float)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    while True:
+        kept = np.flatnonzero(keep)
+        starts = kept[:-1]
+        # segment of each point, the last point closes the last segment
+        segment = np.minimum(
+            np.searchsorted(kept, np.arange(len(points)), side="right") - 1,
+            len(starts) - 1,
+        )
+        a = points[starts][segment]
+        ab = points[kept[1:]][segment] - a
+        ap = points - a
+        length = np.einsum("ij,ij->i", ab, ab)
+        # projection on the segment, clipped to its endpoints
+        t = np.divide(
+            np.einsum("ij,ij->i", ap, ab),
+            length,
+            out=np.zeros(len(points)),
+            where=length > 0,
+        )
+        distances = np.hypot(*(ap - ab * np.clip(t, 0, 1)[:, None]).T)
+        farthest = np.maximum.reduceat(distances, starts)[segment]
+        split = (distances > tolerance) & (distances == farthest)
+        if not split.any():
+            break
+        # first farthest point of each segment
+        _, first = np.unique(segment[split], return_index=True)
+        keep[np.flatnonzero(split)[first]] = True
+    return [coords[i] for i in np.flatnonzero(keep)]
+
+
+def build_lines(family):
+    """
+    Stores simplified lines of family for every band, skipping bands where
+    simplification doesn't drop enough points to be worth it
+    """
+    FamilyLine.objects.filter(family_id=family.id).delete()
+    coords = line = family.get_line()
+    if np is None or len(line) < 3:
+        return
+    lines = []
+    for zoom in sorted(LINE_ZOOMS, reverse=True):
+        simplified = simplify(coords, get_tolerance(zoom))
+        if len(simplified) > len(line) * 0.8:
+            # full line is served instead, lower zooms may still pay off
+            continue
+        lines.append(
+            FamilyLine(
+                family_id=family.id,
+                zoom=zoom,
+                geom={"type": "MultiLineString", "coordinates": [simplified]},
+                points=len(simplified),
+            )
+        )
+        # next band is simplified from this one, which is much shorter
+        coords = simplified
+    FamilyLine.objects.bulk_create(lines)
+
+
+def get_line_geom(zoom):
+    """
+    Expression of family geometry as JSON text for zoom level, falls back to
+    the full line if there is no simplified one
+    """
+    band = get_band(zoom)
+    if band is None:
+        return Cast("geom", TextField())
+    simplified = FamilyLine.objects.filter(family_id=OuterRef("id"), zoom=band)
+    return Coalesce(
+        Cast(Subquery(simplified.values("geom")[:1]), TextField()),
+        Cast("geom", TextField()),
+    )
+
+
+def get_line_collection(queryset, zoom):
+    """Returns the FeatureCollection of family queryset for zoom level"""
+    return get_collection(queryset, geom=get_line_geom(zoom))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from djeotree.benchmarks import FEATURE_SIZES, compare_serializers
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares GeoJSON serialization of elements by djgeojson's filter and by "
+        "djeotree's serializer (database changes are rolled back)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=FEATURE_SIZES,
+            help="Numbers of features",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            results = compare_serializers(options["sizes"])
+            transaction.set_rollback(True)
+        self.stdout.write(
+            "%10s %12s %12s %8s" % ("features", "filter", "serializer", "speedup")
+        )
+        for size, filter_time, collection_time in results:
+            self.stdout.write(
+                "%10s %10.1fms %10.1fms %7.1fx"
+                % (size, filter_time, collection_time, filter_time / collection_time)
+            )
+        self.stdout.write(self.style.SUCCESS("Outputs match"))
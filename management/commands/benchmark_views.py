@@ -0,0 +1,91 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from djeotree.benchmarks import (
+    BASELINE,
+    DATASET,
+    benchmark,
+    check_baseline,
+    load_baseline,
+    save_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a synthetic dataset, requests every djeotree url and checks query "
+        "count, time and size against a baseline (database changes are rolled back, "
+        "caches are isolated)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--depth", type=int, default=DATASET["depth"], help="Family tree depth"
+        )
+        parser.add_argument(
+            "--children",
+            type=int,
+            default=DATASET["children"],
+            help="Children per family",
+        )
+        parser.add_argument(
+            "--elements",
+            type=int,
+            default=DATASET["elements"],
+            help="Elements per family",
+        )
+        parser.add_argument(
+            "--tags", type=int, default=DATASET["tags"], help="Number of tags"
+        )
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=DATASET["images"],
+            help="Images per element",
+        )
+        parser.add_argument("--baseline", default=BASELINE, help="Baseline file")
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Write results to baseline file instead of checking them",
+        )
+        parser.add_argument(
+            "--time-factor",
+            type=float,
+            default=3.0,
+            help="Allowed ratio to baseline time (0 skips timing)",
+        )
+
+    def handle(self, *args, **options):
+        dataset = {key: options[key] for key in DATASET}
+        baseline = None
+        if not options["update_baseline"]:
+            if not Path(options["baseline"]).exists():
+                raise CommandError("Missing baseline, use --update-baseline")
+            baseline = load_baseline(options["baseline"])
+            if baseline["dataset"] != dataset:
+                raise CommandError(
+                    "Baseline was recorded on dataset %s" % baseline["dataset"]
+                )
+        # allows test client host and keeps emails in memory
+        setup_test_environment()
+        try:
+            results = benchmark(dataset)
+        finally:
+            teardown_test_environment()
+        for key, result in results.items():
+            self.stdout.write(
+                "%(key)-40s %(status)4s %(queries)5s queries %(time)8.1fms "
+                "%(size)8s bytes" % dict(result, key=key)
+            )
+        if options["update_baseline"]:
+            save_baseline(dataset, results, options["baseline"])
+            self.stdout.write(self.style.SUCCESS("Baseline updated"))
+            return
+        regressions = check_baseline(
+            results, baseline["results"], time_factor=options["time_factor"]
+        )
+        if regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from djeotree.models import Element
+from djeotree.search import index_elements
+
+
+class Command(BaseCommand):
+    help = "Stores search documents of all elements"
+
+    def handle(self, *args, **options):
+        ids = list(Element.objects.values_list("id", flat=True))
+        index_elements(ids)
+        self.stdout.write(
+            self.style.SUCCESS("Indexed %(elements)s elements" % {"elements": len(ids)})
+        )
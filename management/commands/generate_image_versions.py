@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from djeotree.models import Element, ElementImage
+from djeotree.utils import generate_versions
+
+
+def get_versions(fb_image):
+    timings = {}
+    return generate_versions(fb_image, timings=timings), timings
+
+
+class Command(BaseCommand):
+    help = "Generates image versions and fills the version manifest"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Number of parallel workers"
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Regenerate versions of all images, not only outdated ones",
+        )
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        images = [
+            image
+            for image in ElementImage.objects.exclude(fb_image=None)
+            .exclude(fb_image="")
+            .prefetch_related("image_version")
+            if options["all"] or image.versions_outdated()
+        ]
+        timings = {}
+        # workers only deal with files, manifest is written here
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            results = executor.map(get_versions, [image.fb_image for image in images])
+            for image, (versions, image_timings) in zip(images, results):
+                image.set_versions(versions)
+                for name, seconds in image_timings.items():
+                    timings[name] = timings.get(name, 0) + seconds
+        Element.refresh_popups(
+            Element.objects.filter(id__in={image.element_id for image in images})
+        )
+        for name, seconds in timings.items():
+            self.stdout.write(
+                "%(name)-12s %(seconds).2fs" % {"name": name, "seconds": seconds}
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Generated versions of %(count)s images in %(seconds).2fs"
+                % {"count": len(images), "seconds": perf_counter() - start}
+            )
+        )
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from djeotree.bulk import import_elements, read_csv, read_geojson
+from djeotree.models import Family
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Bulk imports elements from a GeoJSON FeatureCollection or a csv file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="GeoJSON (.json, .geojson) or csv file")
+        parser.add_argument(
+            "--user", required=True, help="Username of the elements author"
+        )
+        parser.add_argument(
+            "--family", type=int, help="Family id for rows without family"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of elements created per query (default 1000)",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if path.suffix.lower() in (".json", ".geojson"):
+            reader = read_geojson
+        elif path.suffix.lower() == ".csv":
+            reader = read_csv
+        else:
+            raise CommandError("Unsupported file type: %s" % path.suffix)
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError("User %s does not exist" % options["user"])
+        family = None
+        if options["family"]:
+            try:
+                family = Family.objects.get(id=options["family"])
+            except Family.DoesNotExist:
+                raise CommandError("Family %s does not exist" % options["family"])
+        with open(path, newline="", encoding="utf-8") as file:
+            try:
+                count, seconds = import_elements(
+                    reader(file),
+                    user,
+                    family=family,
+                    chunk_size=options["chunk_size"],
+                )
+            except (KeyError, ValueError) as e:
+                raise CommandError(e)
+        rate = count / seconds if seconds else count
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Imported %(count)s elements in %(seconds).2fs (%(rate).0f rows/s)"
+                % {"count": count, "seconds": seconds, "rate": rate}
+            )
+        )
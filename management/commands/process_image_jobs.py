@@ -0,0 +1,37 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+from djeotree.jobs import process_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates versions of uploaded images queued in the database, polling "
+        "for new jobs (more workers can run at once)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty instead of polling",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds between polls of an empty queue",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = process_jobs()
+            if done or failed:
+                self.stdout.write(
+                    "Processed %(done)s images, %(failed)s failures"
+                    % {"done": done, "failed": failed}
+                )
+            if options["once"]:
+                break
+            sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS("Image queue is empty"))
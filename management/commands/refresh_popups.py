@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from djeotree.models import Element, Family
+from djeotree.tiles import invalidate_tiles
+
+
+class Command(BaseCommand):
+    help = "Regenerates stored popups of all families and elements"
+
+    def handle(self, *args, **options):
+        for family in Family.objects.all():
+            family.refresh_popup()
+        Element.refresh_popups(Element.objects.all())
+        # tiles embed popups
+        invalidate_tiles()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Refreshed popups of %(families)s families and %(elements)s elements"
+                % {
+                    "families": Family.objects.count(),
+                    "elements": Element.objects.count(),
+                }
+            )
+        )
@@ -0,0 +1,59 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import translation
+from djeotree.models import Element
+from djeotree.tiles import TILE_MAX_ZOOM, get_tile
+from djeotree.utils import get_languages, lonlat_to_tile, parse_bbox
+
+
+class Command(BaseCommand):
+    help = "Renders and caches GeoJSON tiles for a range of zoom levels"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-zoom", type=int, default=0)
+        parser.add_argument("--max-zoom", type=int, default=12)
+        parser.add_argument(
+            "--bbox",
+            help="west,south,east,north (defaults to extent of public elements)",
+        )
+
+    def handle(self, *args, **options):
+        min_zoom = options["min_zoom"]
+        max_zoom = options["max_zoom"]
+        if not 0 <= min_zoom <= max_zoom <= TILE_MAX_ZOOM:
+            raise CommandError("Zoom range must be within 0 and %s" % TILE_MAX_ZOOM)
+        if options["bbox"]:
+            try:
+                west, south, east, north = parse_bbox(options["bbox"])
+            except ValueError:
+                raise CommandError("Invalid bounding box")
+        else:
+            extent = Element.objects.filter(private=False).aggregate(
+                Min("lon"), Min("lat"), Max("lon"), Max("lat")
+            )
+            if extent["lon__min"] is None:
+                self.stdout.write("No public elements, nothing to seed")
+                return
+            west, south = extent["lon__min"], extent["lat__min"]
+            east, north = extent["lon__max"], extent["lat__max"]
+        start = perf_counter()
+        count = 0
+        # tiles are cached by language, as their popups
+        for code in get_languages():
+            with translation.override(code):
+                for zoom in range(min_zoom, max_zoom + 1):
+                    x0, y0 = lonlat_to_tile(west, north, zoom)
+                    x1, y1 = lonlat_to_tile(east, south, zoom)
+                    for x in range(x0, x1 + 1):
+                        for y in range(y0, y1 + 1):
+                            get_tile(zoom, x, y)
+                            count += 1
+        seconds = perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Seeded %(count)s tiles in %(seconds).2fs"
+                % {"count": count, "seconds": seconds}
+            )
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from djeotree.lines import LINE_ZOOMS, build_lines, np
+from djeotree.models import Family, FamilyLine
+
+
+class Command(BaseCommand):
+    help = (
+        "Stores simplified family lines for every band of zoom levels and "
+        "reports the number of points served"
+    )
+
+    def handle(self, *args, **options):
+        if np is None:
+            self.stdout.write(self.style.ERROR("Install numpy to simplify lines"))
+            return
+        full = {}
+        for family in Family.objects.all():
+            build_lines(family)
+            full[family.id] = len(family.get_line())
+        self.stdout.write(
+            "Full lines: %(points)s points" % {"points": sum(full.values())}
+        )
+        for zoom in sorted(LINE_ZOOMS):
+            # families without a simplified line are served in full
+            points = dict(full)
+            points.update(
+                FamilyLine.objects.filter(zoom=zoom).values_list("family_id", "points")
+            )
+            self.stdout.write(
+                "Up to zoom %(zoom)s: %(points)s points"
+                % {"zoom": zoom, "points": sum(points.values())}
+            )
+        self.stdout.write(self.style.SUCCESS("Family lines simplified"))
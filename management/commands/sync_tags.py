@@ -0,0 +1,36 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from djeotree.inheritance import sync_family
+from djeotree.models import Family
+
+
+class Command(BaseCommand):
+    help = "Syncs tag values inherited by elements with their family tree"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of elements processed per batch (default 1000)",
+        )
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        totals = [0, 0, 0]
+        for root in Family.get_root_nodes():
+            counts = sync_family(root, batch_size=options["batch_size"])
+            totals = [total + count for total, count in zip(totals, counts)]
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Created %(created)s, updated %(updated)s, deleted %(deleted)s "
+                "inherited values in %(seconds).2fs"
+                % {
+                    "created": totals[0],
+                    "updated": totals[1],
+                    "deleted": totals[2],
+                    "seconds": perf_counter() - start,
+                }
+            )
+        )
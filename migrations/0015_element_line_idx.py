@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0014_alter_element_body"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="element",
+            index=models.Index(
+                fields=["family", "private", "date"], name="djeotree_element_line_idx"
+            ),
+        ),
+    ]
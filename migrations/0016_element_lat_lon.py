@@ -0,0 +1,49 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:55
+
+import json
+
+from django.db import migrations, models
+
+
+def mirror_coordinates(apps, schema_editor):
+    Element = apps.get_model("djeotree", "Element")
+    elements = []
+    for element in Element.objects.only("geom").iterator(chunk_size=1000):
+        geom = element.geom
+        if isinstance(geom, str):
+            geom = json.loads(geom)
+        element.lon, element.lat = geom["coordinates"][:2]
+        elements.append(element)
+        if len(elements) == 1000:
+            Element.objects.bulk_update(elements, ["lat", "lon"])
+            elements = []
+    Element.objects.bulk_update(elements, ["lat", "lon"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0015_element_line_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="element",
+            name="lat",
+            field=models.FloatField(editable=False, null=True, verbose_name="Latitude"),
+        ),
+        migrations.AddField(
+            model_name="element",
+            name="lon",
+            field=models.FloatField(
+                editable=False, null=True, verbose_name="Longitude"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="element",
+            index=models.Index(
+                fields=["lat", "lon"], name="djeotree_element_latlon_idx"
+            ),
+        ),
+        migrations.RunPython(mirror_coordinates, migrations.RunPython.noop),
+    ]
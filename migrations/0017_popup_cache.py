@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0016_element_lat_lon"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="element",
+            name="popup_cache",
+            field=models.JSONField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="family",
+            name="popup_cache",
+            field=models.JSONField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0017_popup_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ElementImageVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=20, verbose_name="Version")),
+                ("path", models.CharField(max_length=255, verbose_name="Path")),
+                ("width", models.PositiveIntegerField(null=True, verbose_name="Width")),
+                (
+                    "height",
+                    models.PositiveIntegerField(null=True, verbose_name="Height"),
+                ),
+                (
+                    "image",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="image_version",
+                        to="djeotree.elementimage",
+                        verbose_name="Image",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Image version",
+                "verbose_name_plural": "Image versions",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="elementimageversion",
+            constraint=models.UniqueConstraint(
+                fields=("image", "name"), name="djeotree_unique_image_version"
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0018_elementimageversion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="element",
+            index=models.Index(
+                fields=["private", "user"], name="djeotree_element_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="element",
+            index=models.Index(
+                fields=["date", "private"], name="djeotree_element_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0019_element_visibility_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="elementtagvalue",
+            index=models.Index(
+                fields=["tag", "value", "element"], name="djeotree_element_facet_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+from ..utils import FAMILY_STEPLEN
+
+
+def mark_inherited(apps, schema_editor):
+    # values equal to a value of family or ancestors were copied on creation
+    Family = apps.get_model("djeotree", "Family")
+    TagValue = apps.get_model("djeotree", "TagValue")
+    ElementTagValue = apps.get_model("djeotree", "ElementTagValue")
+    by_path = {}
+    for path, tag_id, value in TagValue.objects.values_list(
+        "family__path", "tag_id", "value"
+    ):
+        by_path.setdefault(path, []).append((tag_id, value))
+    for id, path, depth in Family.objects.values_list("id", "path", "depth"):
+        for i in range(1, depth + 1):
+            for tag_id, value in by_path.get(path[0 : i * FAMILY_STEPLEN], []):
+                ElementTagValue.objects.filter(
+                    element__family_id=id, tag_id=tag_id, value=value
+                ).update(inherited=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0020_element_facet_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="elementtagvalue",
+            name="inherited",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_inherited, migrations.RunPython.noop),
+    ]
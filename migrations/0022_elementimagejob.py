@@ -0,0 +1,72 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0021_elementtagvalue_inherited"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ElementImageJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="Status",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="Attempts"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="Error")),
+                (
+                    "created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created"),
+                ),
+                ("started", models.DateTimeField(null=True, verbose_name="Started")),
+                ("finished", models.DateTimeField(null=True, verbose_name="Finished")),
+                (
+                    "image",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="image_job",
+                        to="djeotree.elementimage",
+                        verbose_name="Image",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Image job",
+                "verbose_name_plural": "Image jobs",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="elementimagejob",
+            index=models.Index(fields=["status", "id"], name="djeotree_image_job_idx"),
+        ),
+    ]
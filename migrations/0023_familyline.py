@@ -0,0 +1,50 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0022_elementimagejob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FamilyLine",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("zoom", models.PositiveSmallIntegerField(verbose_name="Up to zoom")),
+                ("geom", models.JSONField()),
+                ("points", models.PositiveIntegerField(verbose_name="Points")),
+                (
+                    "family",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="family_line",
+                        to="djeotree.family",
+                        verbose_name="Family",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Simplified family line",
+                "verbose_name_plural": "Simplified family lines",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="familyline",
+            constraint=models.UniqueConstraint(
+                fields=("family", "zoom"), name="djeotree_unique_family_line"
+            ),
+        ),
+    ]
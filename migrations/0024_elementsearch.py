@@ -0,0 +1,94 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# external content table, rows mirror djeotree_elementsearch through triggers
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE djeotree_elementsearch_fts USING fts5(
+        document,
+        content='djeotree_elementsearch',
+        content_rowid='element_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER djeotree_elementsearch_insert
+    AFTER INSERT ON djeotree_elementsearch BEGIN
+        INSERT INTO djeotree_elementsearch_fts(rowid, document)
+        VALUES (new.element_id, new.document);
+    END""",
+    """CREATE TRIGGER djeotree_elementsearch_delete
+    AFTER DELETE ON djeotree_elementsearch BEGIN
+        INSERT INTO djeotree_elementsearch_fts(
+            djeotree_elementsearch_fts, rowid, document
+        ) VALUES ('delete', old.element_id, old.document);
+    END""",
+    """CREATE TRIGGER djeotree_elementsearch_update
+    AFTER UPDATE ON djeotree_elementsearch BEGIN
+        INSERT INTO djeotree_elementsearch_fts(
+            djeotree_elementsearch_fts, rowid, document
+        ) VALUES ('delete', old.element_id, old.document);
+        INSERT INTO djeotree_elementsearch_fts(rowid, document)
+        VALUES (new.element_id, new.document);
+    END""",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS djeotree_elementsearch_update",
+    "DROP TRIGGER IF EXISTS djeotree_elementsearch_delete",
+    "DROP TRIGGER IF EXISTS djeotree_elementsearch_insert",
+    "DROP TABLE IF EXISTS djeotree_elementsearch_fts",
+]
+POSTGRESQL_INDEX = [
+    """ALTER TABLE djeotree_elementsearch ADD COLUMN vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', document)) STORED""",
+    """CREATE INDEX djeotree_elementsearch_vector_idx
+    ON djeotree_elementsearch USING GIN (vector)""",
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS djeotree_elementsearch_vector_idx",
+    "ALTER TABLE djeotree_elementsearch DROP COLUMN IF EXISTS vector",
+]
+
+
+def create_index(apps, schema_editor):
+    # other backends fall back to substring lookups
+    statements = {"sqlite": SQLITE_INDEX, "postgresql": POSTGRESQL_INDEX}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_DROP, "postgresql": POSTGRESQL_DROP}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0023_familyline"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ElementSearch",
+            fields=[
+                (
+                    "element",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search",
+                        serialize=False,
+                        to="djeotree.element",
+                        verbose_name="Element",
+                    ),
+                ),
+                ("document", models.TextField(blank=True, verbose_name="Document")),
+            ],
+            options={
+                "verbose_name": "Element search document",
+                "verbose_name_plural": "Element search documents",
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:05
+
+import json
+
+from django.db import migrations, models
+
+
+def set_extents(apps, schema_editor):
+    # extent is mirrored from geom on save
+    Family = apps.get_model("djeotree", "Family")
+    families = []
+    for family in Family.objects.exclude(geom=None).only("id", "geom"):
+        geom = family.geom
+        if isinstance(geom, str):
+            geom = json.loads(geom)
+        coords = geom["coordinates"][0] if geom and geom["coordinates"] else []
+        if not coords:
+            continue
+        family.west = min(c[0] for c in coords)
+        family.south = min(c[1] for c in coords)
+        family.east = max(c[0] for c in coords)
+        family.north = max(c[1] for c in coords)
+        families.append(family)
+    Family.objects.bulk_update(
+        families, ["west", "south", "east", "north"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djeotree", "0024_elementsearch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="family",
+            name="west",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="family",
+            name="south",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="family",
+            name="east",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="family",
+            name="north",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_extents, migrations.RunPython.noop),
+    ]
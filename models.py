@@ -2,8 +2,11 @@ import json
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Value, When
+from django.dispatch import Signal
 from django.urls import reverse
+from django.utils.functional import cached_property
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from djgeojson.fields import MultiLineStringField, PointField
@@ -12,10 +15,28 @@ from filebrowser.fields import FileBrowseField
 from tinymce.models import HTMLField
 from treebeard.mp_tree import MP_Node
 
-from .utils import cad2hex, check_wide_image
+from .utils import (
+    FAMILY_STEPLEN,
+    IMAGE_VERSIONS,
+    build_translated,
+    cad2hex,
+    generate_versions,
+    get_coordinates,
+    get_extent,
+    get_translated,
+)
 
 User = get_user_model()
 
+# line extent mirrored from Family geom, so that lines can be queried by bbox
+EXTENT_FIELDS = ["west", "south", "east", "north"]
+# treebeard moves nodes with raw updates, so no save signal is sent
+family_moved = Signal()
+# versions are generated out of band by the image job worker
+image_processed = Signal()
+# positions are updated in bulk, instance is the first image
+images_reordered = Signal()
+
 
 class Tag(models.Model):
     title = models.CharField(
@@ -35,6 +56,7 @@ class Tag(models.Model):
 
 class Family(MP_Node):
     node_order_by = ["title"]
+    steplen = FAMILY_STEPLEN
 
     title = models.CharField(
         _("Title"),
@@ -49,6 +71,12 @@ class Family(MP_Node):
         max_length=100,
     )
     geom = MultiLineStringField(null=True)
+    west = models.FloatField(null=True, editable=False)
+    south = models.FloatField(null=True, editable=False)
+    east = models.FloatField(null=True, editable=False)
+    north = models.FloatField(null=True, editable=False)
+    # popups are stored by language to avoid computing them at serialization
+    popup_cache = models.JSONField(null=True, editable=False)
 
     class Meta:
         verbose_name = _("Element Family")
@@ -56,6 +84,9 @@ class Family(MP_Node):
 
     @property
     def popupContent(self):
+        return get_translated(self.popup_cache) or self.get_popup_content()
+
+    def get_popup_content(self):
         url = reverse(
             "geotree:family_detail",
             kwargs={"pk": self.id},
@@ -73,16 +104,127 @@ class Family(MP_Node):
             prefix = prefix + "-"
         return prefix + self.title
 
-    def save(self, *args, **kwargs):
-        coords = []
-        elements = self.family_element.filter(private=False).order_by("date")
-        for e in elements:
-            # next conditional is for test to run
-            if isinstance(e.geom, str):
-                e.geom = json.loads(e.geom)
-            coords.append(e.geom["coordinates"])
+    def get_line(self):
+        """Returns the list of coordinates of the family line"""
+        geom = self.geom
+        # next conditional is for test to run
+        if isinstance(geom, str):
+            geom = json.loads(geom)
+        if not geom or not geom["coordinates"]:
+            return []
+        return geom["coordinates"][0]
+
+    def set_line(self, coords):
         self.geom = {"type": "MultiLineString", "coordinates": [coords]}
+
+    def rebuild_line(self):
+        """Rebuilds the whole line from public elements, ordered by date"""
+        geoms = (
+            self.family_element.filter(private=False)
+            .order_by("date", "id")
+            .values_list("geom", flat=True)
+        )
+        self.set_line([get_coordinates(geom) for geom in geoms])
+
+    def get_line_position(self, date, id):
+        """Returns index in the line of a public element with given date and id"""
+        return (
+            self.family_element.filter(private=False)
+            .exclude(id=id)
+            .filter(Q(date__lt=date) | Q(date=date, id__lt=id))
+            .count()
+        )
+
+    @classmethod
+    def update_line(cls, family_id, removed=None, inserted=None):
+        """
+        Incrementally updates the line of a family, removing and / or inserting
+        a single point instead of rebuilding the whole line. Removed and
+        inserted are (id, date, geom) tuples of a public element. Falls back to
+        a full rebuild if stored line is out of sync with elements.
+        """
+        with transaction.atomic():
+            family = cls.objects.select_for_update().filter(id=family_id).first()
+            if not family:
+                return
+            coords = family.get_line()
+            try:
+                if removed:
+                    index = family.get_line_position(removed[1], removed[0])
+                    if coords[index] != get_coordinates(removed[2]):
+                        raise IndexError
+                    del coords[index]
+                if inserted:
+                    index = family.get_line_position(inserted[1], inserted[0])
+                    if index > len(coords):
+                        raise IndexError
+                    coords.insert(index, get_coordinates(inserted[2]))
+            except IndexError:
+                family.rebuild_line()
+            else:
+                family.set_line(coords)
+            family.save(update_fields=["geom"])
+
+    def refresh_popup(self):
+        popups = build_translated(self.get_popup_content)
+        if popups != self.popup_cache:
+            self.popup_cache = popups
+            Family.objects.filter(id=self.id).update(popup_cache=popups)
+
+    def save(self, *args, **kwargs):
+        if not self.geom:
+            self.set_line([])
+        self.west, self.south, self.east, self.north = get_extent(self.get_line())
+        update_fields = kwargs.get("update_fields")
+        if update_fields and "geom" in update_fields:
+            update_fields = set(update_fields) | set(EXTENT_FIELDS)
+            kwargs["update_fields"] = update_fields
+        # previous title is read by post_save receivers too
+        self._previous_title = None
+        if update_fields and not {"title", "intro"} & set(update_fields):
+            super(Family, self).save(*args, **kwargs)
+            return
+        title = None
+        if self.id:
+            title = Family.objects.filter(id=self.id).values_list("title", flat=True)
+            title = title.first()
+        self._previous_title = title
         super(Family, self).save(*args, **kwargs)
+        self.refresh_popup()
+        if title is not None and title != self.title:
+            # family title is in element popups
+            Element.refresh_popups(self.family_element.all())
+
+    def get_subtree(self):
+        """Family and its descendants, in a single query"""
+        return Family.objects.filter(path__startswith=self.path).order_by("path")
+
+    def move(self, target, pos=None):
+        super(Family, self).move(target, pos=pos)
+        family_moved.send(sender=Family, instance=self)
+
+
+class FamilyLine(models.Model):
+    """Family line simplified for a band of zoom levels, see lines.py"""
+
+    family = models.ForeignKey(
+        Family,
+        on_delete=models.CASCADE,
+        related_name="family_line",
+        verbose_name=_("Family"),
+    )
+    zoom = models.PositiveSmallIntegerField(_("Up to zoom"))
+    geom = models.JSONField()
+    points = models.PositiveIntegerField(_("Points"))
+
+    class Meta:
+        verbose_name = _("Simplified family line")
+        verbose_name_plural = _("Simplified family lines")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["family", "zoom"], name="djeotree_unique_family_line"
+            ),
+        ]
 
 
 class TagValue(models.Model):
@@ -109,6 +251,42 @@ class TagValue(models.Model):
         verbose_name_plural = _("Tag values")
 
 
+class ElementQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Public elements, plus private elements of user if authenticated"""
+        if not user.is_authenticated:
+            return self.filter(private=False)
+        return self.filter(Q(private=False) | Q(private=True, user_id=user.uuid))
+
+    def in_subtree(self, family):
+        """Elements of family and of its descendants, joined on path prefix"""
+        return self.filter(family__path__startswith=family.path)
+
+    def with_tags(self, filters):
+        """
+        Elements having all (tag id, value) filters, a None value matches any
+        value of the tag. Each filter is an EXISTS subquery on tag values.
+        """
+        qs = self
+        for tag_id, value in filters:
+            values = ElementTagValue.objects.filter(
+                element_id=OuterRef("pk"), tag_id=tag_id
+            )
+            if value is not None:
+                values = values.filter(value=value)
+            qs = qs.filter(Exists(values))
+        return qs
+
+    def facets(self):
+        """(tag id, tag title, value, count) of elements tag values, one query"""
+        return (
+            ElementTagValue.objects.filter(element_id__in=self.values("id"))
+            .values_list("tag_id", "tag__title", "value")
+            .annotate(count=Count("element_id", distinct=True))
+            .order_by("tag__title", "value")
+        )
+
+
 class Element(models.Model):
     user = models.ForeignKey(
         User,
@@ -129,14 +307,34 @@ class Element(models.Model):
         default=now,
     )
     geom = PointField(_("Location"))
+    # coordinates mirrored from geom, so that they can be queried
+    lat = models.FloatField(_("Latitude"), null=True, editable=False)
+    lon = models.FloatField(_("Longitude"), null=True, editable=False)
     private = models.BooleanField(_("Private element"), default=False)
+    # popups are stored by language to avoid computing them at serialization
+    popup_cache = models.JSONField(null=True, editable=False)
+
+    objects = ElementQuerySet.as_manager()
 
     class Meta:
         verbose_name = _("Element")
         verbose_name_plural = _("Elements")
+        indexes = [
+            # also serves (family, private) lookups
+            models.Index(
+                fields=["family", "private", "date"], name="djeotree_element_line_idx"
+            ),
+            models.Index(fields=["lat", "lon"], name="djeotree_element_latlon_idx"),
+            models.Index(fields=["private", "user"], name="djeotree_element_user_idx"),
+            models.Index(fields=["date", "private"], name="djeotree_element_date_idx"),
+        ]
 
     @property
     def popupContent(self):
+        return get_translated(self.popup_cache) or self.get_popup_content()
+
+    def get_popup_content(self, image=False):
+        """Returns popup in the active language, image is looked up if False"""
         url = reverse(
             "geotree:element_detail",
             kwargs={"username": self.user.username, "pk": self.id},
@@ -146,7 +344,8 @@ class Element(models.Model):
             "url": url,
         }
         intro_str = "<small>%(intro)s</small>" % {"intro": self.intro}
-        image = self.get_first_image()
+        if image is False:
+            image = self.get_first_image()
         if not image:
             return {"content": title_str + intro_str}
         image_str = '<img src="%(image)s">' % {"image": image}
@@ -155,13 +354,63 @@ class Element(models.Model):
     def __str__(self):
         return self.family.title + "-" + str(self.id)
 
+    def save(self, *args, **kwargs):
+        self.lon, self.lat = get_coordinates(self.geom)[:2]
+        super(Element, self).save(*args, **kwargs)
+        self.refresh_popup()
+
+    def get_popups(self):
+        """Returns popups in every language, the image is looked up once"""
+        image = self.get_first_image()
+        return build_translated(lambda: self.get_popup_content(image=image))
+
+    def refresh_popup(self):
+        popups = self.get_popups()
+        if popups != self.popup_cache:
+            self.popup_cache = popups
+            Element.objects.filter(id=self.id).update(popup_cache=popups)
+
+    @classmethod
+    def refresh_popups(cls, queryset, batch_size=500):
+        """Regenerates stored popups of a queryset, in batches"""
+        # family lines grow with elements, don't decode them for each row
+        queryset = (
+            queryset.select_related("family", "user")
+            .defer("family__geom", "family__popup_cache")
+            .prefetch_related("element_image")
+        )
+        elements = []
+        for element in queryset.iterator(chunk_size=batch_size):
+            element.popup_cache = element.get_popups()
+            elements.append(element)
+            if len(elements) == batch_size:
+                cls.objects.bulk_update(elements, ["popup_cache"])
+                elements = []
+        cls.objects.bulk_update(elements, ["popup_cache"])
+
     def get_first_image(self):
-        image = self.element_image.first()
-        if not image:
+        # versions are generated when images are saved, just read manifest
+        path = (
+            ElementImageVersion.objects.filter(image__element_id=self.id, name="popup")
+            .order_by("image__position")
+            .values_list("path", flat=True)
+            .first()
+        )
+        if not path:
             return
-        path = image.fb_image.version_generate("popup").path
         return settings.MEDIA_URL + path
 
+    @classmethod
+    def get_first_images(cls, ids):
+        """Returns urls of first images of elements by id, in one query"""
+        rows = (
+            ElementImageVersion.objects.filter(image__element_id__in=ids, name="popup")
+            .order_by("-image__position")
+            .values_list("image__element_id", "path")
+        )
+        # first images come last and override the others
+        return {id: settings.MEDIA_URL + path for id, path in rows}
+
 
 class ElementTagValue(models.Model):
     tag = models.ForeignKey(
@@ -181,10 +430,48 @@ class ElementTagValue(models.Model):
         help_text=_("Tag value"),
         max_length=200,
     )
+    # inherited from family, kept in sync with family tag values
+    inherited = models.BooleanField(default=False, editable=False)
 
     class Meta:
         verbose_name = _("Tag value")
         verbose_name_plural = _("Tag values")
+        indexes = [
+            models.Index(
+                fields=["tag", "value", "element"], name="djeotree_element_facet_idx"
+            ),
+        ]
+
+
+class ElementSearch(models.Model):
+    """
+    Searchable text of an element, kept in sync by signals (see search.py).
+    Full text indexes on document are created by migrations, depending on
+    the database backend.
+    """
+
+    element = models.OneToOneField(
+        Element,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search",
+        verbose_name=_("Element"),
+    )
+    document = models.TextField(_("Document"), blank=True)
+
+    class Meta:
+        verbose_name = _("Element search document")
+        verbose_name_plural = _("Element search documents")
+
+
+class ElementImageQuerySet(models.QuerySet):
+    def with_processing(self):
+        """Annotates processing, true while versions are queued or running"""
+        jobs = ElementImageJob.objects.filter(
+            image_id=OuterRef("pk"),
+            status__in=[ElementImageJob.PENDING, ElementImageJob.RUNNING],
+        )
+        return self.annotate(processing=Exists(jobs))
 
 
 class ElementImage(models.Model):
@@ -216,11 +503,86 @@ class ElementImage(models.Model):
     )
     position = models.PositiveSmallIntegerField(_("Position"), null=True)
 
+    objects = ElementImageQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Element image")
         verbose_name_plural = _("Element images")
         ordering = ["position"]
 
+    @cached_property
+    def versions(self):
+        """Dictionary of version urls, read from manifest"""
+        return {
+            version.name: settings.MEDIA_URL + version.path
+            for version in self.image_version.all()
+        }
+
+    def versions_outdated(self):
+        if not self.fb_image:
+            return False
+        paths = {self.fb_image.version_path(name) for name in IMAGE_VERSIONS}
+        return {version.path for version in self.image_version.all()} != paths
+
+    @classmethod
+    def reorder(cls, element_id, ids):
+        """
+        Sets positions of images of an element following ids, which must list
+        all of them, with a single UPDATE. Rows are locked meanwhile, raises
+        ValueError if images were added or deleted concurrently.
+        """
+        with transaction.atomic():
+            current = cls.objects.select_for_update().filter(element_id=element_id)
+            if sorted(ids) != sorted(current.values_list("id", flat=True)):
+                raise ValueError("Images of element %s changed" % element_id)
+            cls.objects.filter(element_id=element_id).update(
+                position=Case(
+                    *[When(id=id, then=Value(i)) for i, id in enumerate(ids)],
+                    default=F("position"),
+                    output_field=models.PositiveSmallIntegerField(),
+                )
+            )
+        if ids:
+            images_reordered.send(sender=cls, instance=cls.objects.get(id=ids[0]))
+
+    def move(self, offset):
+        """Swaps image with the one offset places away, see reorder"""
+        with transaction.atomic():
+            ids = list(
+                ElementImage.objects.select_for_update()
+                .filter(element_id=self.element_id)
+                .order_by("position", "id")
+                .values_list("id", flat=True)
+            )
+            i = ids.index(self.id)
+            if not 0 <= i + offset < len(ids):
+                raise ValueError("Image %s can't be moved" % self.id)
+            ids[i], ids[i + offset] = ids[i + offset], ids[i]
+            ElementImage.reorder(self.element_id, ids)
+
+    def delete(self, *args, **kwargs):
+        # following images are shifted back, with a single UPDATE
+        with transaction.atomic():
+            result = super(ElementImage, self).delete(*args, **kwargs)
+            if self.position is not None:
+                ElementImage.objects.filter(
+                    element_id=self.element_id, position__gt=self.position
+                ).update(position=F("position") - 1)
+        return result
+
+    def set_versions(self, versions):
+        """Stores (name, path, width, height) tuples in manifest"""
+        self.image_version.all().delete()
+        ElementImageVersion.objects.bulk_create(
+            [
+                ElementImageVersion(
+                    image_id=self.id, name=name, path=path, width=width, height=height
+                )
+                for name, path, width, height in versions
+            ]
+        )
+        self.__dict__.pop("versions", None)
+
     def save(self, *args, **kwargs):
         # save and upload image
         super(ElementImage, self).save(*args, **kwargs)
@@ -229,4 +591,77 @@ class ElementImage(models.Model):
             self.fb_image = FileObject(str(self.image))
             self.image = None
             super(ElementImage, self).save(*args, **kwargs)
-            check_wide_image(self.fb_image)
+        if not self.versions_outdated():
+            return
+        if getattr(settings, "DJEOTREE_IMAGE_QUEUE", True):
+            # see process_image_jobs command
+            self.enqueue_versions()
+            return
+        self.set_versions(generate_versions(self.fb_image))
+        # first image may be in element popup
+        Element.refresh_popups(Element.objects.filter(id=self.element_id))
+
+    def enqueue_versions(self):
+        """Queues generation of versions, unless it is already pending"""
+        ElementImageJob.objects.get_or_create(
+            image_id=self.id, status=ElementImageJob.PENDING
+        )
+
+
+class ElementImageVersion(models.Model):
+    image = models.ForeignKey(
+        ElementImage,
+        on_delete=models.CASCADE,
+        related_name="image_version",
+        verbose_name=_("Image"),
+    )
+    name = models.CharField(_("Version"), max_length=20)
+    path = models.CharField(_("Path"), max_length=255)
+    width = models.PositiveIntegerField(_("Width"), null=True)
+    height = models.PositiveIntegerField(_("Height"), null=True)
+
+    class Meta:
+        verbose_name = _("Image version")
+        verbose_name_plural = _("Image versions")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["image", "name"], name="djeotree_unique_image_version"
+            ),
+        ]
+
+
+class ElementImageJob(models.Model):
+    """Version generation of an uploaded image, queued in the database"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, _("Pending")),
+        (RUNNING, _("Running")),
+        (DONE, _("Done")),
+        (FAILED, _("Failed")),
+    ]
+
+    image = models.ForeignKey(
+        ElementImage,
+        on_delete=models.CASCADE,
+        related_name="image_job",
+        verbose_name=_("Image"),
+    )
+    status = models.CharField(
+        _("Status"), max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(_("Attempts"), default=0)
+    error = models.TextField(_("Error"), blank=True)
+    created = models.DateTimeField(_("Created"), auto_now_add=True)
+    started = models.DateTimeField(_("Started"), null=True)
+    finished = models.DateTimeField(_("Finished"), null=True)
+
+    class Meta:
+        verbose_name = _("Image job")
+        verbose_name_plural = _("Image jobs")
+        indexes = [
+            models.Index(fields=["status", "id"], name="djeotree_image_job_idx"),
+        ]
@@ -0,0 +1,279 @@
+from heapq import heappop, heappush
+from math import asin, cos, radians, sin, sqrt
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Element
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+    Per process spatial index of element coordinates, answering nearest and
+    radius queries without scanning the table. The index is refreshed from a
+    change counter in cache: element changes are recorded under the counter
+    and applied to an overlay, until too many changes call for a rebuild.
+"""
+
+NEARBY_MAX = getattr(settings, "DJEOTREE_NEARBY_MAX", 100)
+# changes applied to the overlay before rebuilding the whole index
+NEARBY_REBUILD_LIMIT = getattr(settings, "DJEOTREE_NEARBY_REBUILD_LIMIT", 1000)
+COUNTER_KEY = "djeotree:nearby:counter"
+CHANGE_KEY = "djeotree:nearby:change:%s"
+CHANGE_TIMEOUT = 60 * 60 * 24
+EARTH_RADIUS = 6371008.8
+LEAF_SIZE = 32
+
+_index = None
+_lock = Lock()
+
+
+def record_change(element_id=None):
+    """Records a change of element, without id the index is rebuilt"""
+    try:
+        counter = cache.incr(COUNTER_KEY)
+    except ValueError:
+        cache.set(COUNTER_KEY, 1, None)
+        counter = 1
+    if element_id is not None:
+        cache.set(CHANGE_KEY % counter, element_id, CHANGE_TIMEOUT)
+
+
+def invalidate_nearby():
+    record_change()
+
+
+def clear_index():
+    """Drops the index of this process, i.e. when switching caches"""
+    global _index
+    with _lock:
+        _index = None
+
+
+def to_xyz(lon, lat):
+    """Returns unit vectors of coordinates in degrees"""
+    lon, lat = np.radians(lon), np.radians(lat)
+    return np.stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1
+    )
+
+
+def to_chord(meters):
+    return 2 * sin(min(meters / EARTH_RADIUS, np.pi) / 2)
+
+
+def to_meters(chord):
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord / 2, 1))
+
+
+def get_rows(queryset):
+    return queryset.exclude(lon=None).values_list(
+        "id", "lon", "lat", "private", "user_id", "family_id"
+    )
+
+
+class SpatialIndex:
+    """
+    KD-tree of unit vectors of element coordinates, so that chord distances
+    follow distances on the sphere. Leaves are contiguous slices of up to
+    LEAF_SIZE points, nodes store their bounding box and are visited nearest
+    first. Points changed after building are masked in the tree and kept in
+    an overlay which is scanned in full.
+    """
+
+    def __init__(self, rows, counter):
+        self.counter = counter
+        self.owners = {}
+        rows = list(rows)
+        ids, lons, lats, private, owners, families = (
+            zip(*rows) if rows else ([], [], [], [], [], [])
+        )
+        points = to_xyz(np.array(lons, dtype=float), np.array(lats, dtype=float))
+        points = points.reshape(-1, 3)
+        order = np.arange(len(points))
+        self.lo, self.hi, self.left, self.right, mins, maxs = [], [], [], [], [], []
+
+        def add_node(lo, hi):
+            self.lo.append(lo)
+            self.hi.append(hi)
+            self.left.append(-1)
+            self.right.append(-1)
+            mins.append(None)
+            maxs.append(None)
+            return len(self.lo) - 1
+
+        stack = [add_node(0, len(points))] if rows else []
+        while stack:
+            node = stack.pop()
+            lo, hi = self.lo[node], self.hi[node]
+            chunk = points[order[lo:hi]]
+            mins[node], maxs[node] = chunk.min(axis=0), chunk.max(axis=0)
+            if hi - lo <= LEAF_SIZE:
+                continue
+            # split at the median of the widest axis
+            axis = int(np.argmax(maxs[node] - mins[node]))
+            middle = (hi - lo) // 2
+            order[lo:hi] = order[lo:hi][np.argpartition(chunk[:, axis], middle)]
+            self.left[node] = add_node(lo, lo + middle)
+            self.right[node] = add_node(lo + middle, hi)
+            stack += [self.left[node], self.right[node]]
+        self.mins, self.maxs = np.array(mins), np.array(maxs)
+        self.points = points[order]
+        self.ids = np.array(ids, dtype=np.int64)[order]
+        self.private = np.array(private, dtype=bool)[order]
+        codes = [self.get_owner(owner) for owner in owners]
+        self.owner = np.array(codes, dtype=np.int64)[order]
+        self.family = np.array(families, dtype=np.int64)[order]
+        self.alive = np.ones(len(points), dtype=bool)
+        self.positions = {int(id): i for i, id in enumerate(self.ids)}
+        self.family_positions = {}
+        for i, family in enumerate(self.family.tolist()):
+            self.family_positions.setdefault(family, []).append(i)
+        self.extra = {}
+
+    def get_owner(self, user_id):
+        """Returns integer code of user id, for vectorised comparisons"""
+        return self.owners.setdefault(user_id, len(self.owners))
+
+    def update(self, ids, rows, counter):
+        """Applies changes of elements ids, rows hold those still existing"""
+        for id in ids:
+            if id in self.positions:
+                self.alive[self.positions[id]] = False
+            self.extra.pop(id, None)
+        for id, lon, lat, private, owner, family in rows:
+            self.extra[id] = (lon, lat, private, self.get_owner(owner), family)
+        self.counter = counter
+
+    def box_distance(self, node, q):
+        return np.linalg.norm(
+            np.maximum(0, np.maximum(self.mins[node] - q, q - self.maxs[node]))
+        )
+
+    def visible(self, positions, owner):
+        return self.alive[positions] & (
+            ~self.private[positions] | (self.owner[positions] == owner)
+        )
+
+    def search(self, q, k, bound, owner):
+        """Returns (chord distances, ids) of tree points, nearest first"""
+        found_d, found_i = np.empty(0), np.empty(0, dtype=np.int64)
+        heap = [(0.0, 0)] if len(self.lo) else []
+        while heap:
+            distance, node = heappop(heap)
+            if distance > bound:
+                break
+            if self.left[node] >= 0:
+                for child in (self.left[node], self.right[node]):
+                    heappush(heap, (self.box_distance(child, q), child))
+                continue
+            leaf = slice(self.lo[node], self.hi[node])
+            d = np.linalg.norm(self.points[leaf] - q, axis=1)
+            ok = self.visible(leaf, owner) & (d <= bound)
+            found_d = np.concatenate([found_d, d[ok]])
+            found_i = np.concatenate([found_i, self.ids[leaf][ok]])
+            if k is not None and len(found_d) >= k:
+                keep = np.argpartition(found_d, k - 1)[:k]
+                found_d, found_i = found_d[keep], found_i[keep]
+                bound = found_d.max()
+        return found_d, found_i
+
+    def scan(self, q, positions, bound, owner):
+        """Returns (chord distances, ids) of tree points at positions"""
+        positions = np.array(positions, dtype=np.int64)
+        positions = positions[self.visible(positions, owner)]
+        d = np.linalg.norm(self.points[positions] - q, axis=1)
+        return d[d <= bound], self.ids[positions][d <= bound]
+
+    def nearest(self, lon, lat, k=None, radius=None, owner=None, families=None):
+        """
+        Returns (id, meters) of the k nearest points (all of them if k is
+        None) within radius meters if given, nearest first. Private points
+        are returned only if they belong to owner, families restricts points
+        to a list of family ids.
+        """
+        q = to_xyz(lon, lat)
+        bound = np.inf if radius is None else to_chord(radius)
+        owner = self.owners.get(owner, -1)
+        if families is None:
+            d, ids = self.search(q, k, bound, owner)
+        else:
+            positions = [i for f in families for i in self.family_positions.get(f, [])]
+            d, ids = self.scan(q, positions, bound, owner)
+        extra = [
+            (id, lon, lat)
+            for id, (lon, lat, private, code, family) in self.extra.items()
+            if (not private or code == owner)
+            and (families is None or family in families)
+        ]
+        if extra:
+            extra_ids, lons, lats = zip(*extra)
+            extra_d = np.linalg.norm(to_xyz(np.array(lons), np.array(lats)) - q, axis=1)
+            d = np.concatenate([d, extra_d])
+            ids = np.concatenate([ids, np.array(extra_ids, dtype=np.int64)])
+            ids, d = ids[d <= bound], d[d <= bound]
+        order = np.argsort(d, kind="stable")[:k]
+        return list(zip(ids[order].tolist(), to_meters(d[order]).tolist()))
+
+
+def get_index():
+    """Returns the index of this process, refreshed from the change counter"""
+    global _index
+    with _lock:
+        counter = cache.get_or_set(COUNTER_KEY, 0, None)
+        if _index is not None and counter == _index.counter:
+            return _index
+        if (
+            _index is not None
+            and _index.counter < counter <= _index.counter + NEARBY_REBUILD_LIMIT
+        ):
+            keys = [CHANGE_KEY % n for n in range(_index.counter + 1, counter + 1)]
+            changes = cache.get_many(keys)
+            # missing changes were evicted or are rebuild requests
+            if len(changes) == len(keys):
+                ids = set(changes.values())
+                rows = get_rows(Element.objects.filter(id__in=ids))
+                _index.update(ids, rows, counter)
+                if len(_index.extra) <= NEARBY_REBUILD_LIMIT:
+                    return _index
+        _index = SpatialIndex(get_rows(Element.objects.all()), counter)
+        return _index
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(radians, (lon1, lat1, lon2, lat2))
+    a = (
+        sin((lat2 - lat1) / 2) ** 2
+        + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * asin(sqrt(a))
+
+
+def get_nearest(user, lon, lat, k=NEARBY_MAX, radius=None, family=None):
+    """
+    Returns (id, meters) of elements visible to user nearest to lon, lat,
+    see SpatialIndex.nearest. family restricts elements to its subtree.
+    Without numpy elements are scanned from the database.
+    """
+    families = None
+    if family:
+        families = set(family.get_subtree().values_list("id", flat=True))
+    if np is None:
+        rows = Element.objects.visible_to(user).exclude(lon=None)
+        if families is not None:
+            rows = rows.filter(family_id__in=families)
+        found = sorted(
+            (haversine(lon, lat, e_lon, e_lat), id)
+            for id, e_lon, e_lat in rows.values_list("id", "lon", "lat")
+        )
+        if radius is not None:
+            found = [(d, id) for d, id in found if d <= radius]
+        return [(id, d) for d, id in found[:k]]
+    owner = user.uuid if user.is_authenticated else None
+    return get_index().nearest(
+        lon, lat, k=k, radius=radius, owner=owner, families=families
+    )
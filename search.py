@@ -0,0 +1,115 @@
+import re
+from html import unescape
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+
+from .models import Element, ElementSearch, ElementTagValue
+from .versions import SEARCH_KEY, bump_versions
+
+"""
+    Full text search of elements on intro, text of body, family title and tag
+    values. Documents are stored as ElementSearch rows, kept in sync by
+    signals, and indexed with FTS5 on SQLite or a tsvector column on
+    PostgreSQL (see migration 0024). Other backends match substrings.
+"""
+
+# maximum number of features of search results on the map
+SEARCH_MAX = getattr(settings, "DJEOTREE_SEARCH_MAX", 1000)
+SEARCH_TERMS = 8
+FTS_TABLE = "djeotree_elementsearch_fts"
+
+
+def get_terms(query):
+    """Returns lowercase words of query, dropping any search syntax"""
+    return re.findall(r"\w+", query.lower())[:SEARCH_TERMS]
+
+
+def get_document(intro, body, title, values):
+    """Returns searchable text of element, body without markup"""
+    text = unescape(strip_tags(body or ""))
+    return " ".join(part for part in [title, intro, text, *values] if part)
+
+
+def index_elements(ids, batch_size=500):
+    """Stores documents of elements ids, three queries for each batch"""
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start : start + batch_size]
+        values = {}
+        rows = (
+            ElementTagValue.objects.filter(element_id__in=chunk)
+            .order_by("id")
+            .values_list("element_id", "value")
+        )
+        for element_id, value in rows:
+            values.setdefault(element_id, []).append(value)
+        rows = Element.objects.filter(id__in=chunk).values_list(
+            "id", "intro", "body", "family__title"
+        )
+        ElementSearch.objects.bulk_create(
+            [
+                ElementSearch(
+                    element_id=id,
+                    document=get_document(intro, body, title, values.get(id, [])),
+                )
+                for id, intro, body, title in rows
+            ],
+            update_conflicts=True,
+            unique_fields=["element"],
+            update_fields=["document"],
+        )
+    if ids:
+        bump_versions([SEARCH_KEY])
+
+
+def index_family(family_id):
+    """Stores documents of elements of family, i.e. when title changes"""
+    index_elements(
+        Element.objects.filter(family_id=family_id).values_list("id", flat=True)
+    )
+
+
+def search(queryset, query):
+    """
+    Filters element queryset on all words of query (as prefixes), annotated
+    with rank, which is lower for better matches. Index rows are joined, so
+    results and ranks come from a single indexed query.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField())).none()
+    vendor = connections[queryset.db].vendor
+    names = {
+        "fts": FTS_TABLE,
+        "search": ElementSearch._meta.db_table,
+        "table": queryset.model._meta.db_table,
+    }
+    if vendor == "sqlite":
+        match = " ".join('"%s"*' % term for term in terms)
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                "%(fts)s.rowid = %(table)s.id" % names,
+                "%(fts)s MATCH %%s" % names,
+            ],
+            params=[match],
+        )
+        # bm25 score, negative
+        rank, params = "%(fts)s.rank" % names, []
+    elif vendor == "postgresql":
+        match = " & ".join("%s:*" % term for term in terms)
+        queryset = queryset.filter(search__isnull=False).extra(
+            where=["%(search)s.vector @@ to_tsquery('simple', %%s)" % names],
+            params=[match],
+        )
+        rank = "-ts_rank(%(search)s.vector, to_tsquery('simple', %%s))" % names
+        params = [match]
+    else:
+        for term in terms:
+            queryset = queryset.filter(search__document__icontains=term)
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+    return queryset.annotate(rank=RawSQL(rank, params, output_field=FloatField()))
@@ -1,37 +1,400 @@
-from django.db.models.signals import post_delete, post_save
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from .models import Element, ElementTagValue
-
-
-@receiver(post_save, sender=Element)
-def create_element_tags(sender, instance, created, **kwargs):
-    if created:
-        parent = instance.family
-        # get parent ancestors and generate element tag values
-        ancestors = parent.get_ancestors()
-        for ancestor in ancestors:
-            fam_values = ancestor.family_value.all()
-            for fam_value in fam_values:
-                elm_value = ElementTagValue(
-                    tag_id=fam_value.tag.id,
-                    element_id=instance.id,
-                    value=fam_value.value,
-                )
-                elm_value.save()
-        # generate element tag values from parent
-        fam_values = parent.family_value.all()
-        for fam_value in fam_values:
-            elm_value = ElementTagValue(
-                tag_id=fam_value.tag.id, element_id=instance.id, value=fam_value.value
-            )
-            elm_value.save()
-        # update parent's geometry field
-        parent.save()
+from .authors import invalidate_authors
+from .clusters import invalidate_clusters
+from .dates import invalidate_calendar
+from .forest import invalidate_forest
+from .inheritance import sync_elements, sync_family, sync_family_on_commit
+from .lines import build_lines
+from .models import (
+    EXTENT_FIELDS,
+    Element,
+    ElementImage,
+    ElementTagValue,
+    Family,
+    Tag,
+    TagValue,
+    family_moved,
+    image_processed,
+    images_reordered,
+)
+from .nearby import record_change
+from .search import index_elements, index_family
+from .tiles import get_line_neighbours, invalidate_area, invalidate_tiles
+from .utils import get_coordinates
+from .versions import (
+    AUTHOR_KEY,
+    DATA_KEY,
+    FAMILIES_KEY,
+    FAMILY_KEY,
+    TAG_KEY,
+    bump_families,
+    bump_versions,
+    values_changed,
+)
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Element)
+def update_element_tags(sender, instance, created, **kwargs):
+    # tags are inherited from family
+    previous = getattr(instance, "_line_state", None)
+    if created or (previous and previous["family_id"] != instance.family_id):
+        sync_elements([(instance.id, instance.family_id)])
+
+
+@receiver(post_save, sender=TagValue)
+@receiver(post_delete, sender=TagValue)
+def update_inherited_tags(sender, instance, using, **kwargs):
+    # elements are synced after commit, once per family
+    sync_family_on_commit(instance.family_id, using=using)
+
+
+@receiver(family_moved, sender=Family)
+def update_moved_tags(sender, instance, **kwargs):
+    # moved instance is not updated by treebeard
+    sync_family(Family.objects.get(id=instance.id))
+
+
+@receiver(pre_save, sender=Element)
+def store_element_line_state(sender, instance, **kwargs):
+    # store previous state to know if family lines have to be updated
+    instance._line_state = None
+    if instance.pk:
+        instance._line_state = (
+            Element.objects.filter(id=instance.pk)
+            .values("family_id", "private", "date", "geom", "lon", "lat")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Element)
+def update_family_line(sender, instance, **kwargs):
+    previous = getattr(instance, "_line_state", None)
+    removed = inserted = None
+    if previous and not previous["private"]:
+        removed = (instance.id, previous["date"], previous["geom"])
+    if not instance.private:
+        inserted = (instance.id, instance.date, instance.geom)
+    if removed and inserted and previous["family_id"] == instance.family_id:
+        moved = get_coordinates(removed[2]) != get_coordinates(inserted[2])
+        if removed[1] == inserted[1] and not moved:
+            # element kept its place along the line
+            return
+        Family.update_line(instance.family_id, removed=removed, inserted=inserted)
+        return
+    if removed:
+        Family.update_line(previous["family_id"], removed=removed)
+    if inserted:
+        Family.update_line(instance.family_id, inserted=inserted)
 
 
 @receiver(post_delete, sender=Element)
 def update_parent_on_deletion(sender, instance, **kwargs):
-    parent = instance.family
-    # update parent's geometry field
-    parent.save()
+    if not instance.private:
+        # update parent's geometry field
+        Family.update_line(
+            instance.family_id, removed=(instance.id, instance.date, instance.geom)
+        )
+
+
+@receiver(post_save, sender=Element)
+def update_clusters(sender, instance, created, **kwargs):
+    # pyramids hold positions of visible elements, latest ones represent
+    # clusters
+    previous = getattr(instance, "_line_state", None)
+    if (
+        created
+        or not previous
+        or previous["family_id"] != instance.family_id
+        or previous["private"] != instance.private
+        or previous["date"] != instance.date
+        or (previous["lon"], previous["lat"]) != (instance.lon, instance.lat)
+    ):
+        invalidate_clusters()
+
+
+@receiver(post_delete, sender=Element)
+def update_clusters_on_deletion(sender, **kwargs):
+    invalidate_clusters()
+
+
+@receiver(post_save, sender=Element)
+def update_authors(sender, instance, created, **kwargs):
+    # only public elements are counted
+    previous = getattr(instance, "_line_state", None)
+    if created or (previous and previous["private"] != instance.private):
+        invalidate_authors()
+
+
+@receiver(post_delete, sender=Element)
+def update_authors_on_deletion(sender, **kwargs):
+    invalidate_authors()
+
+
+@receiver(post_save, sender=Element)
+def update_calendar(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_line_state", None)
+    if (
+        created
+        or not previous
+        or previous["private"] != instance.private
+        or previous["date"] != instance.date
+    ):
+        invalidate_calendar()
+
+
+@receiver(post_delete, sender=Element)
+def update_calendar_on_deletion(sender, **kwargs):
+    invalidate_calendar()
+
+
+@receiver(post_save, sender=Element)
+@receiver(post_delete, sender=Element)
+def update_nearby(sender, instance, **kwargs):
+    # other processes reload the element as soon as the change is recorded
+    element_id = instance.id
+    transaction.on_commit(lambda: record_change(element_id))
+
+
+@receiver(post_save, sender=Element)
+def update_search(sender, instance, **kwargs):
+    index_elements([instance.id])
+
+
+@receiver(pre_delete, sender=Tag)
+def store_tag_element_ids(sender, instance, **kwargs):
+    # values are gone after deletion
+    instance._element_ids = list(
+        ElementTagValue.objects.filter(tag_id=instance.id)
+        .values_list("element_id", flat=True)
+        .distinct()
+    )
+
+
+@receiver(post_delete, sender=Tag)
+def update_values_on_tag_deletion(sender, instance, **kwargs):
+    values_changed(getattr(instance, "_element_ids", []), [instance.id])
+
+
+@receiver(post_save, sender=Family)
+def update_family_search(sender, instance, **kwargs):
+    # family title is in documents of its elements, previous one is stored
+    # by Family.save
+    previous = getattr(instance, "_previous_title", None)
+    if previous is not None and previous != instance.title:
+        index_family(instance.id)
+
+
+@receiver(post_save, sender=Element)
+def update_element_tiles(sender, instance, **kwargs):
+    # invalidate tiles of element and of touched family line segments
+    previous = getattr(instance, "_line_state", None)
+    if previous and not previous["private"] and previous["lon"] is not None:
+        invalidate_area(
+            get_line_neighbours(
+                previous["family_id"],
+                instance.id,
+                previous["date"],
+                previous["lon"],
+                previous["lat"],
+            )
+        )
+    if not instance.private:
+        invalidate_area(
+            get_line_neighbours(
+                instance.family_id,
+                instance.id,
+                instance.date,
+                instance.lon,
+                instance.lat,
+            )
+        )
+
+
+@receiver(post_delete, sender=Element)
+def update_tiles_on_deletion(sender, instance, **kwargs):
+    if not instance.private and instance.lon is not None:
+        invalidate_area(
+            get_line_neighbours(
+                instance.family_id,
+                instance.id,
+                instance.date,
+                instance.lon,
+                instance.lat,
+            )
+        )
+
+
+@receiver(post_save, sender=ElementImage)
+@receiver(post_delete, sender=ElementImage)
+@receiver(image_processed, sender=ElementImage)
+@receiver(images_reordered, sender=ElementImage)
+def update_image_tiles(sender, instance, **kwargs):
+    # first image is shown in element popup
+    point = (
+        Element.objects.filter(id=instance.element_id, private=False)
+        .values_list("lon", "lat")
+        .first()
+    )
+    if point and None not in point:
+        invalidate_area([point])
+
+
+@receiver(post_save, sender=Family)
+def update_family_tiles(sender, instance, update_fields=None, **kwargs):
+    # lines are already covered by element signals
+    if update_fields and set(update_fields) <= {"geom", *EXTENT_FIELDS}:
+        return
+    invalidate_tiles()
+
+
+@receiver(post_delete, sender=Family)
+def update_tiles_on_family_deletion(sender, **kwargs):
+    invalidate_tiles()
+
+
+@receiver(post_save, sender=Family)
+def update_forest(sender, instance, update_fields=None, **kwargs):
+    # only titles and tree structure are in the forest
+    if update_fields and "title" not in update_fields:
+        return
+    invalidate_forest()
+
+
+@receiver(post_delete, sender=Family)
+@receiver(family_moved, sender=Family)
+def update_forest_on_change(sender, **kwargs):
+    invalidate_forest()
+
+
+@receiver(post_save, sender=Family)
+def update_simplified_lines(sender, instance, update_fields=None, **kwargs):
+    if update_fields and "geom" not in update_fields:
+        return
+    build_lines(instance)
+
+
+@receiver(post_save, sender=ElementImage)
+@receiver(post_delete, sender=ElementImage)
+@receiver(images_reordered, sender=ElementImage)
+def update_element_popup(sender, instance, **kwargs):
+    # first image is shown in element popup
+    element = (
+        Element.objects.filter(id=instance.element_id)
+        .select_related("family", "user")
+        .first()
+    )
+    if element:
+        element.refresh_popup()
+
+
+@receiver(pre_delete, sender=Element)
+def store_element_tag_ids(sender, instance, **kwargs):
+    # values are gone after deletion
+    instance._tag_ids = list(instance.element_value.values_list("tag_id", flat=True))
+
+
+@receiver(post_save, sender=Element)
+@receiver(post_delete, sender=Element)
+def update_element_versions(sender, instance, **kwargs):
+    previous = getattr(instance, "_line_state", None)
+    tag_ids = getattr(instance, "_tag_ids", None)
+    if tag_ids is None:
+        tag_ids = instance.element_value.values_list("tag_id", flat=True)
+    bump_versions(
+        [DATA_KEY, AUTHOR_KEY % instance.user_id] + [TAG_KEY % id for id in tag_ids]
+    )
+    family_ids = {instance.family_id}
+    if previous:
+        family_ids.add(previous["family_id"])
+    bump_families(family_ids)
+
+
+@receiver(post_save, sender=ElementImage)
+@receiver(post_delete, sender=ElementImage)
+@receiver(image_processed, sender=ElementImage)
+@receiver(images_reordered, sender=ElementImage)
+def update_image_versions(sender, instance, **kwargs):
+    # first image is shown in element popup, one row per tag of the element
+    rows = list(
+        Element.objects.filter(id=instance.element_id).values_list(
+            "user_id", "family_id", "element_value__tag_id"
+        )
+    )
+    if rows:
+        user_id, family_id = rows[0][:2]
+        bump_versions(
+            [DATA_KEY, AUTHOR_KEY % user_id]
+            + [TAG_KEY % row[2] for row in rows if row[2] is not None]
+        )
+        bump_families([family_id])
+
+
+@receiver(post_save, sender=ElementTagValue)
+def update_values(sender, instance, **kwargs):
+    # no post_delete receiver, see versions.values_changed
+    values_changed([instance.element_id], [instance.tag_id])
+
+
+@receiver(post_save, sender=Family)
+def update_family_versions(sender, instance, update_fields=None, **kwargs):
+    # lines are already covered by element signals
+    if update_fields and set(update_fields) <= {"geom", *EXTENT_FIELDS}:
+        return
+    bump_versions([DATA_KEY, FAMILIES_KEY, FAMILY_KEY % instance.id])
+
+
+@receiver(post_delete, sender=Family)
+@receiver(family_moved, sender=Family)
+def update_versions_on_family_change(sender, **kwargs):
+    bump_versions([DATA_KEY, FAMILIES_KEY])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def update_tag_versions(sender, instance, **kwargs):
+    bump_versions([DATA_KEY, TAG_KEY % instance.id])
+
+
+@receiver(pre_save, sender=User)
+def store_username(sender, instance, update_fields=None, **kwargs):
+    instance._previous_username = None
+    if instance.pk and (not update_fields or "username" in update_fields):
+        instance._previous_username = (
+            User.objects.filter(pk=instance.pk)
+            .values_list("username", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=User)
+def update_author_popups(sender, instance, **kwargs):
+    # username is in element urls
+    previous = getattr(instance, "_previous_username", None)
+    if previous and previous != instance.username:
+        Element.refresh_popups(Element.objects.filter(user_id=instance.pk))
+        invalidate_authors()
+        points = Element.objects.filter(user_id=instance.pk, private=False)
+        points = [p for p in points.values_list("lon", "lat") if None not in p]
+        if points:
+            invalidate_area(points)
+        # family and tag pages embed the popups
+        rows = (
+            Element.objects.filter(user_id=instance.pk)
+            .values_list("family_id", "element_value__tag_id")
+            .distinct()
+        )
+        family_ids, tag_ids = set(), set()
+        for family_id, tag_id in rows:
+            family_ids.add(family_id)
+            if tag_id is not None:
+                tag_ids.add(tag_id)
+        bump_versions(
+            [DATA_KEY, AUTHOR_KEY % instance.pk] + [TAG_KEY % id for id in tag_ids]
+        )
+        bump_families(family_ids)
@@ -6,6 +6,20 @@ function map_init(map, options) {
     }
   }
 
+  function pointToLayer(feature, latlng) {
+    // clusters are drawn as circles showing the number of elements
+    if (feature.properties && feature.properties.count > 1) {
+      return L.marker(latlng, {
+        icon: L.divIcon({
+          html: "<span>" + feature.properties.count + "</span>",
+          className: "marker-cluster",
+          iconSize: [40, 40]
+        })
+      });
+    }
+    return L.marker(latlng);
+  }
+
   function setLineStyle(feature) {
     return {"color": feature.properties.popupContent.color, "weight": 5 };
   }
@@ -43,15 +57,70 @@ function map_init(map, options) {
 
   L.control.layers(baseMaps, overlayMaps).addTo(map);
 
-  let collection = JSON.parse(document.getElementById("marker_data").textContent);
-  let markers = L.geoJson(collection, {onEachFeature: onEachFeature});
-  markers.addTo(mk_layer);
-  map.fitBounds(markers.getBounds(), {padding: [30,30]});
-  collection = JSON.parse(document.getElementById("line_data").textContent);
+  const marker_url = document.getElementById("marker_url");
+  let request_count = 0;
+
+  function loadMarkers() {
+    // markers inside visible bounds, stale responses are discarded
+    const request_id = ++request_count;
+    const url = JSON.parse(marker_url.textContent) + "?bbox=" + map.getBounds().toBBoxString() +
+      "&zoom=" + map.getZoom();
+    fetch(url)
+      .then(response => response.json())
+      .then(collection => {
+        if (request_id !== request_count) {
+          return;
+        }
+        mk_layer.clearLayers();
+        L.geoJson(collection, {pointToLayer: pointToLayer, onEachFeature: onEachFeature}).addTo(mk_layer);
+      });
+  }
+
+  if (marker_url) {
+    map.on("moveend", loadMarkers);
+    loadMarkers();
+  } else {
+    let collection = JSON.parse(document.getElementById("marker_data").textContent);
+    let markers = L.geoJson(collection, {onEachFeature: onEachFeature});
+    markers.addTo(mk_layer);
+    map.fitBounds(markers.getBounds(), {padding: [30,30]});
+  }
+  const line_data = document.getElementById("line_data");
+  let collection = JSON.parse(line_data.textContent);
   let lines = L.geoJson(collection, {style: setLineStyle, onEachFeature: onEachFeature});
   lines.addTo(ln_layer);
 
+  // embedded lines are the most simplified ones, see lines.py
+  let line_url = line_data.dataset.url;
+  let line_count = 0;
+
+  function loadLines() {
+    // lines simplified for current zoom, stale responses are discarded
+    if (!line_url) {
+      return;
+    }
+    const request_id = ++line_count;
+    const separator = line_url.includes("?") ? "&" : "?";
+    fetch(line_url + separator + "zoom=" + map.getZoom())
+      .then(response => response.json())
+      .then(collection => {
+        if (request_id !== line_count) {
+          return;
+        }
+        ln_layer.clearLayers();
+        L.geoJson(collection, {style: setLineStyle, onEachFeature: onEachFeature}).addTo(ln_layer);
+      });
+  }
+
+  map.on("zoomend", loadLines);
+  loadLines();
+
   addEventListener("getMarkerCollection", function(evt){
+    // collection comes from htmx navigation, stop loading by bounds
+    map.off("moveend", loadMarkers);
+    request_count++;
+    line_url = null;
+    line_count++;
     mk_layer.clearLayers();
     ln_layer.clearLayers();
     let collection = JSON.parse(document.getElementById(evt.detail.value).textContent);
@@ -60,9 +129,18 @@ function map_init(map, options) {
     map.fitBounds(markers.getBounds(), {padding: [30,30]});
   })
 
-  addEventListener("getLineCollection", function(evt){
+  addEventListener("appendMarkerCollection", function(evt){
+    // next page of a list, markers are added to the ones already shown
     let collection = JSON.parse(document.getElementById(evt.detail.value).textContent);
+    L.geoJson(collection, {onEachFeature: onEachFeature}).addTo(mk_layer);
+  })
+
+  addEventListener("getLineCollection", function(evt){
+    const data = document.getElementById(evt.detail.value);
+    let collection = JSON.parse(data.textContent);
     let lines = L.geoJson(collection, {style: setLineStyle, onEachFeature: onEachFeature});
     lines.addTo(ln_layer);
+    line_url = data.dataset.url;
+    loadLines();
   })
 }
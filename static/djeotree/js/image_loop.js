@@ -0,0 +1,45 @@
+// drag and drop of images in the image loop, the new order is posted once
+// on drop by the htmx "reorder" trigger of the #image-order form
+let dragged = null;
+let moved = false;
+
+document.addEventListener("dragstart", function (event) {
+  const card = event.target.closest && event.target.closest("#image-order [draggable]");
+  if (!card) {
+    return;
+  }
+  dragged = card;
+  moved = false;
+  event.dataTransfer.effectAllowed = "move";
+});
+
+document.addEventListener("dragover", function (event) {
+  if (!dragged) {
+    return;
+  }
+  const card = event.target.closest("#image-order [draggable]");
+  if (!card || card === dragged) {
+    return;
+  }
+  event.preventDefault();
+  const box = card.getBoundingClientRect();
+  const after = event.clientY > box.top + box.height / 2;
+  card.parentNode.insertBefore(dragged, after ? card.nextSibling : card);
+  moved = true;
+});
+
+document.addEventListener("drop", function (event) {
+  if (dragged) {
+    event.preventDefault();
+  }
+});
+
+document.addEventListener("dragend", function () {
+  if (!dragged) {
+    return;
+  }
+  dragged = null;
+  if (moved) {
+    htmx.trigger("#image-order", "reorder");
+  }
+});
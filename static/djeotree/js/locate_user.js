@@ -8,6 +8,30 @@ window.addEventListener("map:init", function (event) {
 
   function userFound(e) {
     map.setView( e.latlng , 19 );
+    showNearby(e.latlng);
+  };
+
+  function showNearby(latlng) {
+    // elements near the user, to avoid duplicates
+    const nearby_url = document.getElementById("nearby_url");
+    if (!nearby_url) {
+      return;
+    }
+    const url = JSON.parse(nearby_url.textContent) + "?lat=" + latlng.lat +
+      "&lon=" + latlng.lng + "&radius=500";
+    fetch(url)
+      .then(response => response.json())
+      .then(collection => {
+        L.geoJson(collection, {
+          pointToLayer: function(feature, latlng) {
+            return L.circleMarker(latlng, {radius: 8});
+          },
+          onEachFeature: function(feature, layer) {
+            layer.bindPopup(feature.properties.popupContent.content +
+              "<br>" + feature.properties.distance + " m", {minWidth: 256});
+          }
+        }).addTo(map);
+      });
   };
 
 });
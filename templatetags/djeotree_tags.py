@@ -0,0 +1,23 @@
+from django import template
+from django.db.models import QuerySet
+from django.utils.safestring import mark_safe
+from djeotree.features import get_collection
+from djeotree.lines import get_line_collection
+from djeotree.models import Family
+from djgeojson.templatetags.geojson_tags import geojsonfeature
+
+register = template.Library()
+
+
+@register.filter
+def features(source, zoom=None):
+    """
+    FeatureCollection of elements or families with popupContent property,
+    faster replacement of geojsonfeature:"popupContent" for querysets.
+    Family lines are simplified for zoom level if present.
+    """
+    if not isinstance(source, QuerySet):
+        return mark_safe(geojsonfeature(source, "popupContent"))
+    if zoom is not None and source.model is Family:
+        return mark_safe(get_line_collection(source, zoom))
+    return mark_safe(get_collection(source))
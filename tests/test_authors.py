@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from djeotree.authors import get_authors
+from djeotree.models import Element, Family
+
+User = get_user_model()
+
+
+class AuthorIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree author index")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        User.objects.create(username="raw.ydna56", email="ydna@raw.com")
+        f = Family.add_root(title="Family title")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        Element.objects.create(user=u, family=f, intro="foo", geom=point)
+        Element.objects.create(user=u, family=f, intro="bar", geom=point)
+
+    def test_author_index(self):
+        self.assertEquals(get_authors(), [("andy.war65", 2)])
+        print("\n-Tested author counts")
+        e = Element.objects.get(intro="foo")
+        e.private = True
+        e.save()
+        self.assertEquals(get_authors(), [("andy.war65", 1)])
+        print("\n-Tested author index after visibility change")
+        other = User.objects.get(username="raw.ydna56")
+        Element.objects.create(user=other, family=e.family, intro="baz", geom=e.geom)
+        self.assertEquals(get_authors(), [("andy.war65", 1), ("raw.ydna56", 1)])
+        print("\n-Tested author index after creation")
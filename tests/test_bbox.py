@@ -0,0 +1,67 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.models import Element, Family
+from djeotree.utils import parse_bbox
+
+User = get_user_model()
+
+
+@override_settings(USE_I18N=False)
+class BboxTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree bbox view")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Family title")
+        for intro, lon, lat, private in [
+            ("rome", 12.5, 41.9, False),
+            ("fiji", 179.5, -17.7, False),
+            ("samoa", -171.8, -13.8, False),
+            ("secret", 12.6, 41.8, True),
+        ]:
+            point = '{"type": "Point","coordinates": [%s,%s]}' % (lon, lat)
+            Element.objects.create(
+                user=u, family=f, intro=intro, private=private, geom=point
+            )
+
+    def get_intros(self, bbox=None):
+        params = {"bbox": bbox} if bbox else {}
+        response = self.client.get(reverse("geotree:element_bbox"), params)
+        self.assertEquals(response.status_code, 200)
+        features = json.loads(b"".join(response.streaming_content))["features"]
+        elements = Element.objects.in_bulk([f["id"] for f in features])
+        return sorted(e.intro for e in elements.values())
+
+    def test_parse_bbox(self):
+        self.assertEquals(parse_bbox("170,-20,190,-10"), (170, -20, -170, -10))
+        self.assertEquals(parse_bbox("-200,0,200,10"), (-180, 0, 180, 10))
+        for bbox in ["1,2,3", "a,0,1,1", "0,10,1,0", "0,-91,1,0", "nan,0,1,1"]:
+            with self.assertRaises(ValueError):
+                parse_bbox(bbox)
+        print("\n-Tested bbox parsing")
+
+    def test_view(self):
+        self.assertEquals(self.get_intros(), ["fiji", "rome", "samoa"])
+        self.assertEquals(self.get_intros("12,41,13,42"), ["rome"])
+        print("\n-Tested elements in bbox")
+        self.assertEquals(self.get_intros("170,-20,190,-10"), ["fiji", "samoa"])
+        self.assertEquals(self.get_intros("170,-20,180,-10"), ["fiji"])
+        print("\n-Tested bbox across the antimeridian")
+        self.client.force_login(User.objects.get(username="andy.war65"))
+        self.assertEquals(self.get_intros("12,41,13,42"), ["rome", "secret"])
+        self.client.logout()
+        self.assertEquals(self.get_intros("12,41,13,42"), ["rome"])
+        print("\n-Tested private elements in bbox")
+        url = reverse("geotree:element_bbox")
+        for bbox in ["12,41,13", "x,41,13,42", "12,42,13,41", "12,41,13,95"]:
+            response = self.client.get(url, {"bbox": bbox})
+            self.assertEquals(response.status_code, 400)
+        print("\n-Tested invalid bbox")
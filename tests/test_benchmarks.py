@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.benchmarks import (
+    DATASET,
+    benchmark,
+    check_baseline,
+    get_requests,
+    get_url_names,
+    isolated_environment,
+    load_baseline,
+    run_benchmarks,
+    seed_dataset,
+)
+from djeotree.models import Element, Family
+
+User = get_user_model()
+
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree view benchmarks")
+        cls.data = seed_dataset(**DATASET)
+
+    def test_benchmark_urls(self):
+        names = {name for name, kwargs, query in get_requests(self.data)}
+        self.assertEquals(names, get_url_names())
+        print("\n-Tested benchmarks cover every url")
+
+    def test_benchmark_baseline(self):
+        baseline = load_baseline()
+        self.assertEquals(baseline["dataset"], DATASET)
+        with isolated_environment():
+            results = run_benchmarks(self.data)
+        # wall time depends on the machine, see benchmark_views command
+        regressions = check_baseline(results, baseline["results"], time_factor=None)
+        self.assertEquals(regressions, [])
+        print("\n-Tested query count and size against baseline")
+
+
+@override_settings(USE_I18N=False)
+class BenchmarkCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree benchmark isolation")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Real family")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        Element.objects.create(user=u, family=f, intro="foo", geom=point)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_live_pages(self):
+        urls = [reverse("geotree:family_list"), reverse("geotree:author_list")]
+        before = [self.client.get(url).content for url in urls]
+        benchmark(DATASET)
+        for url, content in zip(urls, before):
+            response = self.client.get(url)
+            self.assertEquals(response.content, content)
+            self.assertNotContains(response, "Family 1-1")
+            self.assertNotContains(response, "bench.author")
+        self.assertEquals(Family.objects.count(), 1)
+        print("\n-Tested live pages after benchmarks")
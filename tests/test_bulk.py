@@ -0,0 +1,85 @@
+import json
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from djeotree.bulk import import_elements, read_csv
+from djeotree.models import Element, ElementTagValue, Family, Tag, TagValue
+from djeotree.nearby import invalidate_nearby
+
+User = get_user_model()
+
+
+@override_settings(USE_I18N=False)
+class BulkImportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree bulk import")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.objects.create(
+            title="Family title",
+            path="0001",
+            depth=1,
+            numchild=1,
+        )
+        Family.objects.create(
+            title="Child title",
+            path="00010001",
+            depth=2,
+            numchild=0,
+        )
+        t = Tag.objects.create(title="Tag title")
+        TagValue.objects.create(family_id=f.id, tag_id=t.id, value="Tag value")
+        cls.user = u
+
+    def test_import_elements(self):
+        c = Family.objects.get(title="Child title")
+        file = StringIO(
+            "intro,date,private,latitude,longitude\n"
+            "foo,2022-01-02T10:00:00,,41.9,12.5\n"
+            "bar,2022-01-01T10:00:00,,41.8,12.4\n"
+            "baz,2022-01-03T10:00:00,true,41.7,12.3\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            count, seconds = import_elements(
+                read_csv(file), self.user, family=c, chunk_size=2
+            )
+        self.assertEquals(count, 3)
+        self.assertIn(invalidate_nearby, callbacks)
+        self.assertEquals(Element.objects.filter(family_id=c.id).count(), 3)
+        print("\n-Tested bulk element creation")
+        values = ElementTagValue.objects.filter(element__family_id=c.id)
+        self.assertEquals(values.count(), 3)
+        print("\n-Tested bulk tag inheritance")
+        c.refresh_from_db()
+        self.assertEquals(c.get_line(), [[12.4, 41.8], [12.5, 41.9]])
+        print("\n-Tested bulk family line")
+
+    def test_import_command(self):
+        c = Family.objects.get(title="Child title")
+        collection = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [12.5, 41.9]},
+                    "properties": {"family": c.id, "intro": "foo"},
+                }
+            ],
+        }
+        with TemporaryDirectory() as dir:
+            path = Path(dir).joinpath("elements.geojson")
+            path.write_text(json.dumps(collection))
+            out = StringIO()
+            call_command("import_elements", str(path), user="andy.war65", stdout=out)
+        self.assertEquals(Element.objects.get(family_id=c.id).intro, "foo")
+        self.assertIn("rows/s", out.getvalue())
+        print("\n-Tested import command")
@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.clusters import CLUSTER_MAX_ZOOM, build_pyramid, get_version
+from djeotree.models import Element, ElementTagValue, Family, Tag, TagValue
+
+User = get_user_model()
+
+
+class ClusterTest(TestCase):
+    def test_build_pyramid(self):
+        print("\nTest djeotree clusters")
+        rows = [(1, 12.49, 41.86), (2, 12.4901, 41.8601), (3, -70, 0)]
+        pyramid = build_pyramid(rows)
+        self.assertEquals(len(pyramid), CLUSTER_MAX_ZOOM + 1)
+        counts = sorted(cluster[2] for cluster in pyramid[0])
+        self.assertEquals(counts, [1, 2])
+        print("\n-Tested top level clusters")
+        counts = sorted(cluster[2] for cluster in pyramid[CLUSTER_MAX_ZOOM])
+        self.assertEquals(counts, [1, 2])
+        print("\n-Tested deepest level clusters")
+        self.assertEquals(
+            sum(c[2] for level in pyramid for c in level), 3 * len(pyramid)
+        )
+        print("\n-Tested cluster counts")
+
+
+@override_settings(USE_I18N=False)
+class ClusterViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree cluster view")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Aqueduct")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        Element.objects.create(user=u, family=f, intro="foo", geom=point)
+        Tag.objects.create(title="Material")
+
+    def setUp(self):
+        cache.clear()
+
+    def get_count(self, tag):
+        response = self.client.get(
+            reverse("geotree:element_clusters"), {"zoom": 0, "tag": tag}
+        )
+        return sum(f["properties"]["count"] for f in response.json()["features"])
+
+    def test_tag_filter(self):
+        t = Tag.objects.get(title="Material")
+        e = Element.objects.get(intro="foo")
+        tag = "%s:stone" % t.id
+        self.assertEquals(self.get_count(tag), 0)
+        value = ElementTagValue.objects.create(tag=t, element=e, value="stone")
+        self.assertEquals(self.get_count(tag), 1)
+        print("\n-Tested filtered clusters after value creation")
+        self.client.force_login(e.user)
+        self.client.get(
+            reverse("geotree:value_delete", kwargs={"pk": value.id}),
+            HTTP_HX_REQUEST="true",
+        )
+        self.client.logout()
+        self.assertEquals(self.get_count(tag), 0)
+        print("\n-Tested filtered clusters after value deletion")
+        with self.captureOnCommitCallbacks(execute=True):
+            TagValue.objects.create(family=e.family, tag=t, value="stone")
+        self.assertEquals(self.get_count(tag), 1)
+        print("\n-Tested filtered clusters after inherited value sync")
+
+    def test_invalidation(self):
+        e = Element.objects.get(intro="foo")
+        version, filtered = get_version(), get_version(filtered=True)
+        e.intro = "bar"
+        e.save()
+        self.assertEquals(get_version(filtered=True), filtered)
+        print("\n-Tested clusters kept after unrelated change")
+        ElementTagValue.objects.create(
+            tag=Tag.objects.get(title="Material"), element=e, value="stone"
+        )
+        self.assertEquals(get_version(), version)
+        self.assertNotEquals(get_version(filtered=True), filtered)
+        print("\n-Tested filtered clusters invalidated by value change")
+        e.geom = '{"type": "Point","coordinates": [12.5,41.9]}'
+        e.save()
+        self.assertNotEquals(get_version(), version)
+        print("\n-Tested clusters invalidated by position change")
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.cursors import ELEMENTS_PER_PAGE, decode_cursor, get_page
+from djeotree.models import Element, Family
+from djeotree.views import FamilyDetailView
+
+User = get_user_model()
+
+
+@override_settings(USE_I18N=False)
+class KeysetPageTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree keyset pages")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Family title")
+        c = f.add_child(title="Child title")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        start = datetime(2022, 5, 12, 10, tzinfo=timezone.utc)
+        for i in range(5):
+            Element.objects.create(
+                user=u,
+                family=c if i % 2 else f,
+                intro="foo%s" % i,
+                # two elements share each date
+                date=start + timedelta(hours=i // 2),
+                geom=point,
+            )
+
+    def test_pages(self):
+        for fields in [("family", "id"), ("date", "id")]:
+            queryset = Element.objects.order_by(*fields)
+            expected = list(queryset)
+            found = []
+            cursor = None
+            while True:
+                page, cursor = get_page(queryset, fields, cursor, size=2)
+                found += list(page)
+                if not cursor:
+                    break
+            self.assertEquals(found, expected)
+            print("\n-Tested pages on %s" % ", ".join(fields))
+
+    def test_bad_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor(Element, ("date", "id"), "foo")
+        with self.assertRaises(ValueError):
+            decode_cursor(Element, ("date", "id"), "WzFd")
+        print("\n-Tested bad cursors")
+
+    def test_load_more(self):
+        family = Family.objects.get(title="Family title")
+        url = reverse("geotree:family_detail", kwargs={"pk": family.id})
+        FamilyDetailView.page_size = 2
+        self.addCleanup(setattr, FamilyDetailView, "page_size", ELEMENTS_PER_PAGE)
+        response = self.client.get(url, HTTP_HX_REQUEST="true")
+        self.assertEquals(response.status_code, 200)
+        cursor = response.context["cursor"]
+        self.assertEquals(len(response.context["elements"]), 2)
+        self.assertIsNotNone(cursor)
+        response = self.client.get(url, {"cursor": cursor}, HTTP_HX_REQUEST="true")
+        self.assertIn("appendMarkerCollection", response["HX-Trigger-After-Swap"])
+        self.assertTemplateUsed(response, "djeotree/htmx/element_page.html")
+        print("\n-Tested load more")
+        response = self.client.get(url, {"cursor": "foo"})
+        self.assertEquals(response.status_code, 400)
+        print("\n-Tested load more with bad cursor")
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.dates import get_calendar, get_days, get_months
+from djeotree.models import Element, Family
+
+User = get_user_model()
+
+
+@override_settings(USE_I18N=False)
+class CalendarTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree calendar")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Family title")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        for intro, day, private in [
+            ("foo", datetime(2022, 5, 12, 10, tzinfo=timezone.utc), False),
+            ("bar", datetime(2022, 5, 12, 11, tzinfo=timezone.utc), False),
+            ("baz", datetime(2022, 7, 3, 10, tzinfo=timezone.utc), False),
+            ("qux", datetime(2023, 1, 1, 10, tzinfo=timezone.utc), True),
+        ]:
+            Element.objects.create(
+                user=u, family=f, intro=intro, date=day, private=private, geom=point
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_calendar(self):
+        anonymous = self.client.get("/").wsgi_request.user
+        with self.assertNumQueries(1):
+            calendar = get_calendar(anonymous)
+        self.assertEquals(len(calendar), 1)
+        self.assertEquals(calendar[0]["count"], 3)
+        months = calendar[0]["months"]
+        self.assertEquals([m["month"] for m in months], [5, 7])
+        self.assertEquals(months[0]["days"], [{"day": 12, "count": 2, "level": 4}])
+        self.assertEquals(months[1]["level"], 2)
+        print("\n-Tested public calendar")
+        with self.assertNumQueries(0):
+            get_calendar(anonymous)
+        print("\n-Tested cached calendar")
+        user = User.objects.get(username="andy.war65")
+        years = [item["year"] for item in get_calendar(user)]
+        self.assertEquals(years, [2022, 2023])
+        print("\n-Tested calendar with private elements")
+        Element.objects.filter(intro="foo").first().delete()
+        self.assertEquals(get_calendar(anonymous)[0]["count"], 2)
+        print("\n-Tested calendar invalidation")
+
+    def test_calendar_cells(self):
+        calendar = get_calendar(User.objects.get(username="andy.war65"))
+        months = get_months(calendar, 2022)
+        self.assertEquals(len(months), 12)
+        self.assertEquals([m["count"] for m in months][4:7], [2, 0, 1])
+        days = get_days(calendar, 2023, 1)
+        self.assertEquals(len(days), 31)
+        self.assertEquals(days[0]["count"], 1)
+        print("\n-Tested calendar cells")
+
+    def test_calendar_view(self):
+        url = reverse("geotree:element_calendar")
+        response = self.client.get(url, {"year": 2022, "month": 7})
+        calendar = response.json()["calendar"]
+        self.assertEquals(len(calendar[0]["months"]), 1)
+        self.assertEquals(calendar[0]["months"][0]["count"], 1)
+        print("\n-Tested calendar view")
+        response = self.client.get(url, {"year": "foo"})
+        self.assertEquals(response.status_code, 400)
+        print("\n-Tested calendar view with bad parameters")
@@ -0,0 +1,91 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import translation
+from djgeojson.templatetags.geojson_tags import geojsonfeature
+
+from djeotree.features import get_collection, get_missing_popups, iter_collection
+from djeotree.models import Element, ElementImage, ElementImageVersion, Family
+
+User = get_user_model()
+
+
+@override_settings(USE_I18N=False)
+class FeatureCollectionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree feature collections")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Family title")
+        f.add_child(title="Child title")
+        point = {"type": "Point", "coordinates": [12.493652, 41.866288]}
+        Element.objects.create(user=u, family=f, intro="foo", geom=point)
+        point = '{"type": "Point","coordinates": [12.5,41.9]}'
+        Element.objects.create(user=u, family=f, intro="bar", geom=point)
+
+    def test_element_collection(self):
+        queryset = Element.objects.order_by("id")
+        expected = json.loads(geojsonfeature(queryset, "popupContent"))
+        with self.assertNumQueries(1):
+            collection = get_collection(queryset.all())
+        self.assertEquals(json.loads(collection), expected)
+        print("\n-Tested Element collection")
+        queryset = queryset.all()
+        list(queryset)
+        with self.assertNumQueries(0):
+            self.assertEquals(json.loads(get_collection(queryset)), expected)
+        print("\n-Tested Element collection of evaluated queryset")
+        Element.objects.update(popup_cache=None)
+        # rows, elements with family and user, first images
+        with self.assertNumQueries(3):
+            collection = get_collection(queryset.all())
+        self.assertEquals(json.loads(collection), expected)
+        print("\n-Tested Element collection with missing popups")
+        popups = get_missing_popups(Element, [0])
+        self.assertEquals(popups, {0: "{}"})
+        print("\n-Tested missing popup of deleted Element")
+        e = Element.objects.get(intro="foo")
+        images = ElementImage.objects.bulk_create(
+            [ElementImage(element=e, position=i) for i in (1, 0)]
+        )
+        ElementImageVersion.objects.bulk_create(
+            [
+                ElementImageVersion(image=image, name="popup", path="%s.jpg" % i)
+                for i, image in enumerate(images)
+            ]
+        )
+        self.assertEquals(
+            Element.get_first_images([e.id]), {e.id: settings.MEDIA_URL + "1.jpg"}
+        )
+        print("\n-Tested first images of Elements")
+
+    def test_collection_language(self):
+        with self.settings(USE_I18N=True):
+            Element.refresh_popups(Element.objects.all())
+            for code in ("it", "en"):
+                with translation.override(code):
+                    queryset = Element.objects.order_by("id")
+                    expected = json.loads(geojsonfeature(queryset, "popupContent"))
+                    collection = json.loads(get_collection(queryset.all()))
+                    self.assertEquals(collection, expected)
+                    popup = collection["features"][0]["properties"]["popupContent"]
+                    self.assertIn('href="/%s/' % code, popup["content"])
+        print("\n-Tested Element collection by language")
+
+    def test_family_collection(self):
+        queryset = Family.objects.order_by("id")
+        expected = json.loads(geojsonfeature(queryset, "popupContent"))
+        self.assertEquals(json.loads(get_collection(queryset)), expected)
+        print("\n-Tested Family collection")
+
+    def test_collection_chunks(self):
+        chunks = list(iter_collection(Element.objects.order_by("id"), chunk_size=1))
+        self.assertEquals(len(chunks), 4)
+        self.assertEquals(len(json.loads("".join(chunks))["features"]), 2)
+        print("\n-Tested streamed collection")
@@ -0,0 +1,42 @@
+from django.test import TestCase
+
+from djeotree.forest import get_forest
+from djeotree.models import Family
+
+
+class ForestTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree family forest")
+        a = Family.add_root(title="A")
+        b = a.add_child(title="B")
+        b.add_child(title="C")
+        a.add_child(title="D")
+        Family.add_root(title="E")
+
+    def annotated(self):
+        return [
+            [
+                ({"id": item.id, "title": item.title}, info)
+                for item, info in Family.get_annotated_list(parent=root)
+            ]
+            for root in Family.get_root_nodes()
+        ]
+
+    def test_forest(self):
+        self.assertEquals(get_forest(), self.annotated())
+        print("\n-Tested forest matches annotated lists")
+
+    def test_forest_invalidation(self):
+        get_forest()
+        Family.objects.get(title="D").add_child(title="F")
+        self.assertEquals(get_forest(), self.annotated())
+        print("\n-Tested forest after add")
+        Family.objects.get(title="C").move(
+            Family.objects.get(title="E"), pos="sorted-child"
+        )
+        self.assertEquals(get_forest(), self.annotated())
+        print("\n-Tested forest after move")
+        Family.objects.get(title="B").delete()
+        self.assertEquals(get_forest(), self.annotated())
+        print("\n-Tested forest after delete")
@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from djeotree.models import Element, ElementImage, Family
+
+User = get_user_model()
+
+
+@override_settings(USE_I18N=False)
+class ImageOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree image order")
+        u = User.objects.create(
+            username="andy.war65", password="P4s5W0r6", email="andy@war.com"
+        )
+        f = Family.add_root(title="Family title")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        e = Element.objects.create(user=u, family=f, intro="foo", geom=point)
+        # no files, versions are not needed
+        ElementImage.objects.bulk_create(
+            [ElementImage(element=e, description=str(i), position=i) for i in range(4)]
+        )
+
+    def get_order(self):
+        return list(
+            ElementImage.objects.order_by("position").values_list(
+                "description", flat=True
+            )
+        )
+
+    def test_image_reorder(self):
+        e = Element.objects.get(intro="foo")
+        ids = list(e.element_image.values_list("id", flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            ElementImage.reorder(e.id, ids[::-1])
+        updates = [
+            q for q in queries if q["sql"].startswith('UPDATE "djeotree_elementimage"')
+        ]
+        self.assertEquals(len(updates), 1)
+        self.assertEquals(self.get_order(), ["3", "2", "1", "0"])
+        print("\n-Tested image reorder")
+        with self.assertRaises(ValueError):
+            ElementImage.reorder(e.id, ids[1:])
+        self.assertEquals(self.get_order(), ["3", "2", "1", "0"])
+        print("\n-Tested image reorder with missing image")
+        ElementImage.objects.get(description="1").move(-1)
+        self.assertEquals(self.get_order(), ["3", "1", "2", "0"])
+        print("\n-Tested image move")
+        ElementImage.objects.get(description="3").delete()
+        self.assertEquals(self.get_order(), ["1", "2", "0"])
+        positions = ElementImage.objects.values_list("position", flat=True)
+        self.assertEquals(sorted(positions), [0, 1, 2])
+        print("\n-Tested image deletion shift")
+
+    def test_image_reorder_view(self):
+        e = Element.objects.get(intro="foo")
+        ids = list(e.element_image.values_list("id", flat=True))
+        url = reverse("geotree:image_reorder", kwargs={"pk": e.id})
+        self.client.force_login(e.user)
+        response = self.client.post(
+            url, {"image": [ids[2], ids[0], ids[1], ids[3]]}, HTTP_HX_REQUEST="true"
+        )
+        self.assertEquals(response.status_code, 302)
+        self.assertEquals(self.get_order(), ["2", "0", "1", "3"])
+        print("\n-Tested image reorder view")
+        self.assertEquals(self.client.get(url).status_code, 405)
+        print("\n-Tested image reorder view method")
@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from djeotree.inheritance import sync_family
+from djeotree.models import Element, ElementTagValue, Family, Tag, TagValue
+
+User = get_user_model()
+
+
+class InheritanceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree tag inheritance")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        a = Family.add_root(title="A")
+        b = a.add_child(title="B")
+        Family.add_root(title="C")
+        t = Tag.objects.create(title="Material")
+        s = Tag.objects.create(title="Condition")
+        TagValue.objects.create(family=a, tag=t, value="stone")
+        TagValue.objects.create(family=b, tag=t, value="wood")
+        TagValue.objects.create(family=b, tag=s, value="poor")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        Element.objects.create(user=u, family=a, intro="foo", geom=point)
+        Element.objects.create(user=u, family=b, intro="bar", geom=point)
+
+    def values(self, intro):
+        values = ElementTagValue.objects.filter(element__intro=intro)
+        return sorted(values.values_list("tag__title", "value"))
+
+    def test_element_creation(self):
+        self.assertEquals(self.values("foo"), [("Material", "stone")])
+        self.assertEquals(
+            self.values("bar"), [("Condition", "poor"), ("Material", "wood")]
+        )
+        print("\n-Tested inherited values without duplicates")
+
+    def test_tag_value_change(self):
+        value = TagValue.objects.get(value="stone")
+        value.value = "brick"
+        with self.captureOnCommitCallbacks(execute=True):
+            value.save()
+        self.assertEquals(self.values("foo"), [("Material", "brick")])
+        self.assertEquals(
+            self.values("bar"), [("Condition", "poor"), ("Material", "wood")]
+        )
+        print("\n-Tested family value update")
+        with self.captureOnCommitCallbacks(execute=True):
+            TagValue.objects.get(value="wood").delete()
+        self.assertEquals(
+            self.values("bar"), [("Condition", "poor"), ("Material", "brick")]
+        )
+        print("\n-Tested family value deletion")
+
+    def test_sync_once(self):
+        b = Family.objects.get(title="B")
+        with self.captureOnCommitCallbacks() as callbacks:
+            TagValue.objects.filter(value="stone").update(value="brick")
+            TagValue.objects.get(value="brick").save()
+            TagValue.objects.get(value="poor").delete()
+            TagValue.objects.create(
+                family=b, tag=Tag.objects.create(title="Era"), value="Roman"
+            )
+        # first callback syncs all pending families
+        callbacks[0]()
+        with self.assertNumQueries(0):
+            for callback in callbacks[1:]:
+                callback()
+        self.assertEquals(self.values("foo"), [("Material", "brick")])
+        self.assertEquals(self.values("bar"), [("Era", "Roman"), ("Material", "wood")])
+        print("\n-Tested single sync per transaction")
+
+    def test_own_values(self):
+        value = ElementTagValue.objects.get(element__intro="foo")
+        value.value = "marble"
+        value.inherited = False
+        value.save()
+        created, updated, deleted = sync_family(Family.objects.get(title="A"))
+        self.assertEquals((created, updated, deleted), (0, 0, 0))
+        self.assertEquals(self.values("foo"), [("Material", "marble")])
+        print("\n-Tested author values are kept")
+
+    def test_family_move(self):
+        TagValue.objects.filter(value="wood").delete()
+        b = Family.objects.get(title="B")
+        b.move(Family.objects.get(title="C"), pos="sorted-child")
+        self.assertEquals(self.values("bar"), [("Condition", "poor")])
+        print("\n-Tested family move")
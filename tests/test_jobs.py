@@ -0,0 +1,76 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.jobs import JOB_ATTEMPTS, claim_job, process_jobs
+from djeotree.models import Element, ElementImage, ElementImageJob, Family
+
+User = get_user_model()
+
+
+@override_settings(
+    MEDIA_ROOT=Path(settings.MEDIA_ROOT).joinpath("temp"), USE_I18N=False
+)
+class ImageJobTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree image jobs")
+        u = User.objects.create(
+            username="andy.war65", password="P4s5W0r6", email="andy@war.com"
+        )
+        f = Family.add_root(title="Family title")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        Element.objects.create(user=u, family=f, intro="foo", geom=point)
+
+    def setUp(self):
+        # uploaded files are removed after each test
+        e = Element.objects.get(intro="foo")
+        img = ElementImage(element_id=e.id, description="taz", position=0)
+        img_path = Path(settings.STATIC_ROOT).joinpath("tests/image.jpg")
+        with open(img_path, "rb") as file:
+            content = file.read()
+        img.image = SimpleUploadedFile("image.jpg", content, "image/jpg")
+        img.save()
+
+    def tearDown(self):
+        """Removes uploaded files"""
+        path = Path(settings.MEDIA_ROOT).joinpath("uploads/images/element/")
+        for file in [e for e in path.iterdir() if e.is_file()]:
+            Path(file).unlink()
+
+    def test_image_job(self):
+        img = ElementImage.objects.get(description="taz")
+        self.assertEquals(img.image_version.count(), 0)
+        job = ElementImageJob.objects.get(image=img)
+        self.assertEquals(job.status, ElementImageJob.PENDING)
+        print("\n-Tested queued image job")
+        self.client.force_login(img.element.user)
+        url = reverse("geotree:image_loop", kwargs={"pk": img.element_id})
+        response = self.client.get(url, HTTP_HX_REQUEST="true")
+        self.assertTrue(response.context["processing"])
+        print("\n-Tested processing image")
+        self.assertEquals(process_jobs(), (1, 0))
+        job.refresh_from_db()
+        self.assertEquals(job.status, ElementImageJob.DONE)
+        self.assertFalse(img.versions_outdated())
+        self.assertIn(
+            "_popup", Element.objects.get(intro="foo").popupContent["content"]
+        )
+        print("\n-Tested processed image job")
+        response = self.client.get(url, HTTP_HX_REQUEST="true")
+        self.assertFalse(response.context["processing"])
+        self.assertEquals(claim_job(), None)
+        print("\n-Tested empty queue")
+
+    def test_failed_image_job(self):
+        img = ElementImage.objects.get(description="taz")
+        ElementImage.objects.filter(id=img.id).update(fb_image=None)
+        self.assertEquals(process_jobs(), (0, JOB_ATTEMPTS))
+        job = ElementImageJob.objects.get(image=img)
+        self.assertEquals(job.status, ElementImageJob.FAILED)
+        self.assertEquals(job.attempts, JOB_ATTEMPTS)
+        print("\n-Tested failed image job")
@@ -0,0 +1,66 @@
+import json
+import math
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.lines import LINE_ZOOMS, get_band, get_tolerance, simplify
+from djeotree.models import Family, FamilyLine
+
+
+@override_settings(USE_I18N=False)
+class FamilyLineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree simplified lines")
+        f = Family.add_root(title="Family title")
+        # a wiggly line with 2000 points over one degree
+        f.set_line(
+            [
+                [12 + i / 2000, 41 + math.sin(i / 100) / 10 + math.sin(i) / 1e5]
+                for i in range(2000)
+            ]
+        )
+        f.save(update_fields=["geom"])
+
+    def test_simplify(self):
+        line = [[0, 0], [1, 0.001], [2, 0], [3, 1], [4, 0]]
+        self.assertEquals(simplify(line, 0.01), [[0, 0], [2, 0], [3, 1], [4, 0]])
+        self.assertEquals(simplify(line, 2), [[0, 0], [4, 0]])
+        print("\n-Tested Douglas-Peucker simplification")
+        loop = [[0, 0], [1, 1], [0, 0]]
+        self.assertEquals(simplify(loop, 0.1), loop)
+        print("\n-Tested simplification of closed line")
+
+    def test_bands(self):
+        self.assertEquals(get_band(0), min(LINE_ZOOMS))
+        self.assertIsNone(get_band(max(LINE_ZOOMS) + 1))
+        self.assertGreater(get_tolerance(0), get_tolerance(1))
+        print("\n-Tested zoom bands")
+
+    def test_stored_lines(self):
+        f = Family.objects.get(title="Family title")
+        points = dict(f.family_line.values_list("zoom", "points"))
+        self.assertEquals(sorted(points), sorted(LINE_ZOOMS))
+        self.assertLess(points[min(LINE_ZOOMS)], 50)
+        print("\n-Tested stored simplified lines")
+        f.set_line(f.get_line()[:2])
+        f.save(update_fields=["geom"])
+        self.assertFalse(FamilyLine.objects.exists())
+        print("\n-Tested short lines")
+
+    def test_line_view(self):
+        f = Family.objects.get(title="Family title")
+        url = reverse("geotree:family_lines")
+        for zoom, points in [(0, None), (max(LINE_ZOOMS) + 1, 2000)]:
+            response = self.client.get(url, {"zoom": zoom, "family": f.id})
+            feature = json.loads(response.content)["features"][0]
+            line = feature["geometry"]["coordinates"][0]
+            if points:
+                self.assertEquals(len(line), points)
+            else:
+                self.assertLess(len(line), 50)
+        print("\n-Tested lines for zoom")
+        response = self.client.get(url, {"zoom": "foo"})
+        self.assertEquals(response.status_code, 400)
+        print("\n-Tested lines with bad parameters")
@@ -2,10 +2,14 @@ from pathlib import Path
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, override_settings
+from django.utils import translation
 
+from djeotree.jobs import process_jobs
 from djeotree.models import Element, ElementImage, Family, Tag, TagValue
+from djeotree.utils import get_draft_size
 
 User = get_user_model()
 
@@ -58,6 +62,51 @@ class DjeotreeModelTest(TestCase):
         self.assertEquals(values.count(), 1)
         print("\n-Tested Element tag creation")
 
+    def test_element_lat_lon(self):
+        e = Element.objects.get(intro="foo")
+        self.assertEquals((e.lat, e.lon), (41.866288, 12.493652))
+        print("\n-Tested Element latitude and longitude")
+
+    def test_element_visible_to(self):
+        u = User.objects.get(username="andy.war65")
+        other = User.objects.create(username="other", email="other@war.com")
+        c = Family.objects.get(title="Child title")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        Element.objects.create(
+            user_id=u.uuid, family_id=c.id, intro="secret", geom=point, private=True
+        )
+        self.assertEquals(Element.objects.visible_to(u).count(), 2)
+        print("\n-Tested Element visible to author")
+        self.assertEquals(Element.objects.visible_to(other).count(), 1)
+        print("\n-Tested Element visible to other user")
+        self.assertEquals(Element.objects.visible_to(AnonymousUser()).count(), 1)
+        print("\n-Tested Element visible to anonymous user")
+
+    def test_family_subtree(self):
+        f = Family.objects.get(title="Family title")
+        c = Family.objects.get(title="Child title")
+        self.assertEquals(list(f.get_subtree()), [f, c])
+        print("\n-Tested Family subtree")
+        self.assertEquals(Element.objects.in_subtree(f).count(), 1)
+        Family.objects.create(title="Other title", path="0002", depth=1)
+        other = Family.objects.get(title="Other title")
+        self.assertEquals(Element.objects.in_subtree(other).count(), 0)
+        print("\n-Tested Element in Family subtree")
+
+    def test_element_tag_filters(self):
+        t = Tag.objects.get(title="Tag title")
+        other = Tag.objects.create(title="Other tag")
+        self.assertEquals(Element.objects.with_tags([(t.id, "Tag value")]).count(), 1)
+        self.assertEquals(Element.objects.with_tags([(t.id, "Other")]).count(), 0)
+        self.assertEquals(Element.objects.with_tags([(t.id, None)]).count(), 1)
+        self.assertEquals(
+            Element.objects.with_tags([(t.id, None), (other.id, None)]).count(), 0
+        )
+        print("\n-Tested Element tag filters")
+        facets = list(Element.objects.all().facets())
+        self.assertEquals(facets, [(t.id, "Tag title", "Tag value", 1)])
+        print("\n-Tested Element tag facets")
+
     def test_family_popup(self):
         f = Family.objects.get(title="Family title")
         content = '<h5><a href="/it/geotree/famiglia/1/">Family title</a>'
@@ -75,6 +124,34 @@ class DjeotreeModelTest(TestCase):
         self.assertEquals(f.geom, line)
         print("\n-Tested Family MultiLine")
 
+    def test_family_line_update(self):
+        u = User.objects.get(username="andy.war65")
+        f = Family.objects.create(title="Line title", path="0002", depth=1)
+        point = '{"type": "Point","coordinates": [%s, 0]}'
+        last = Element.objects.create(
+            user_id=u.uuid, family_id=f.id, geom=point % 3, date="2022-01-03"
+        )
+        first = Element.objects.create(
+            user_id=u.uuid, family_id=f.id, geom=point % 1, date="2022-01-01"
+        )
+        middle = Element.objects.create(
+            user_id=u.uuid, family_id=f.id, geom=point % 2, date="2022-01-02"
+        )
+        f.refresh_from_db()
+        self.assertEquals(f.get_line(), [[1, 0], [2, 0], [3, 0]])
+        print("\n-Tested Family line insertion")
+        first.date = "2022-01-04"
+        first.save()
+        middle.private = True
+        middle.save()
+        f.refresh_from_db()
+        self.assertEquals(f.get_line(), [[3, 0], [1, 0]])
+        print("\n-Tested Family line update")
+        last.delete()
+        f.refresh_from_db()
+        self.assertEquals(f.get_line(), [[1, 0]])
+        print("\n-Tested Family line deletion")
+
     def test_element_popup(self):
         e = Element.objects.get(intro="foo")
         content = '<h5><a href="/it/geotree/autore/andy.war65/elemento/1/">'
@@ -83,6 +160,27 @@ class DjeotreeModelTest(TestCase):
         self.assertEquals(e.popupContent, popup)
         print("\n-Tested Element Popup")
 
+    def test_popup_cache(self):
+        e = Element.objects.get(intro="foo")
+        self.assertEquals(e.popup_cache, {"it": e.get_popup_content()})
+        print("\n-Tested Element stored popup")
+        c = Family.objects.get(title="Child title")
+        self.assertEquals(c.popup_cache, {"it": c.get_popup_content()})
+        print("\n-Tested Family stored popup")
+        c.title = "Renamed"
+        c.save()
+        e.refresh_from_db()
+        self.assertIn("Renamed-" + str(e.id), e.popup_cache["it"]["content"])
+        print("\n-Tested Element popup refresh")
+        with self.settings(USE_I18N=True):
+            e.refresh_popup()
+            self.assertEquals(set(e.popup_cache), {"it", "en"})
+            with translation.override("en"):
+                self.assertIn('href="/en/', e.popupContent["content"])
+            with translation.override("it"):
+                self.assertIn('href="/it/', e.popupContent["content"])
+        print("\n-Tested Element popups by language")
+
 
 @override_settings(MEDIA_ROOT=Path(settings.MEDIA_ROOT).joinpath("temp"))
 class ElementImageModelTest(TestCase):
@@ -109,6 +207,8 @@ class ElementImageModelTest(TestCase):
             content = file.read()
         img.image = SimpleUploadedFile("image.jpg", content, "image/jpg")
         img.save()
+        # versions are generated by the worker
+        process_jobs()
 
     def tearDown(self):
         """Checks existing files, then removes them"""
@@ -126,6 +226,20 @@ class ElementImageModelTest(TestCase):
 
     def test_element_first_image(self):
         e = Element.objects.get(intro="bar")
-        # this test is not working, should be "/media/_versions...etc"
-        self.assertEquals(e.get_first_image(), "/media/")
+        img = ElementImage.objects.get(description="taz")
+        popup = img.image_version.get(name="popup")
+        self.assertEquals(e.get_first_image(), settings.MEDIA_URL + popup.path)
         print("\n-Tested Element first image")
+
+    def test_element_image_versions(self):
+        img = ElementImage.objects.get(description="taz")
+        self.assertFalse(img.versions_outdated())
+        wide = img.image_version.get(name="wide")
+        self.assertEquals((wide.width, wide.height), (1600, 800))
+        print("\n-Tested Element Image version manifest")
+
+    def test_element_image_draft_size(self):
+        specs = [{"width": 256, "height": 144, "opts": "crop"}, {"width": 640}]
+        self.assertEquals(get_draft_size((4000, 3000), specs), (640, 480))
+        self.assertEquals(get_draft_size((400, 300), specs), None)
+        print("\n-Tested Element Image draft size")
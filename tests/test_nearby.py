@@ -0,0 +1,103 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.models import Element, Family
+from djeotree.nearby import get_nearest
+
+User = get_user_model()
+
+
+@override_settings(USE_I18N=False)
+class NearbyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree nearby elements")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Family title")
+        c = f.add_child(title="Child title")
+        for intro, family, lon, private in [
+            ("foo", f, 12.5, False),
+            ("bar", c, 12.501, False),
+            ("baz", f, 12.51, False),
+            ("qux", f, 12.5005, True),
+        ]:
+            point = '{"type": "Point","coordinates": [%s,41.9]}' % lon
+            Element.objects.create(
+                user=u, family=family, intro=intro, private=private, geom=point
+            )
+        # enough elements for a tree with more than one leaf
+        for i in range(100):
+            point = '{"type": "Point","coordinates": [%s,45.0]}' % (10 + i / 100)
+            Element.objects.create(user=u, family=c, intro="far", geom=point)
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = self.client.get("/").wsgi_request.user
+        self.user = User.objects.get(username="andy.war65")
+
+    def get_intros(self, found):
+        elements = Element.objects.in_bulk([id for id, distance in found])
+        return [elements[id].intro for id, distance in found]
+
+    def test_nearest(self):
+        found = get_nearest(self.anonymous, 12.5, 41.9, k=3)
+        self.assertEquals(self.get_intros(found), ["foo", "bar", "baz"])
+        self.assertAlmostEqual(found[1][1], 82.9, delta=0.5)
+        print("\n-Tested nearest elements")
+        found = get_nearest(self.user, 12.5, 41.9, k=3)
+        self.assertEquals(self.get_intros(found), ["foo", "qux", "bar"])
+        print("\n-Tested nearest private elements")
+        found = get_nearest(self.anonymous, 12.5, 41.9, radius=100)
+        self.assertEquals(self.get_intros(found), ["foo", "bar"])
+        print("\n-Tested elements within radius")
+        child = Family.objects.get(title="Child title")
+        found = get_nearest(self.anonymous, 12.5, 41.9, k=2, family=child)
+        self.assertEquals(self.get_intros(found), ["bar", "far"])
+        found = get_nearest(self.anonymous, 10.5, 45.0, k=104)
+        self.assertEquals(len(found), 103)
+        self.assertEquals([d for id, d in found], sorted(d for id, d in found))
+        print("\n-Tested elements of family subtree")
+
+    def test_changes(self):
+        f = Family.objects.get(title="Family title")
+        get_nearest(self.anonymous, 12.5, 41.9, k=1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            e = Element.objects.create(
+                user=self.user,
+                family=f,
+                intro="new",
+                geom='{"type": "Point","coordinates": [12.4999,41.9]}',
+            )
+        found = get_nearest(self.anonymous, 12.4999, 41.9, k=1)
+        self.assertEquals(self.get_intros(found), ["foo"])
+        print("\n-Tested change recorded after commit")
+        for callback in callbacks:
+            callback()
+        found = get_nearest(self.anonymous, 12.4999, 41.9, k=1)
+        self.assertEquals(self.get_intros(found), ["new"])
+        with self.captureOnCommitCallbacks(execute=True):
+            e.delete()
+            Element.objects.filter(intro="foo").update(private=True)
+            Element.objects.get(intro="foo").save()
+        found = get_nearest(self.anonymous, 12.4999, 41.9, k=1)
+        self.assertEquals(self.get_intros(found), ["bar"])
+        print("\n-Tested index after element changes")
+
+    def test_view(self):
+        url = reverse("geotree:element_nearby")
+        response = self.client.get(url, {"lat": 41.9, "lon": 12.5, "k": 2})
+        self.assertEquals(response.status_code, 200)
+        features = response.json()["features"]
+        self.assertEquals(len(features), 2)
+        self.assertEquals(features[0]["properties"]["distance"], 0)
+        print("\n-Tested nearby view")
+        for params in [{"lat": 41.9}, {"lat": 91, "lon": 12.5}, {"lat": "x", "lon": 1}]:
+            response = self.client.get(url, params)
+            self.assertEquals(response.status_code, 400)
+        print("\n-Tested nearby view with bad parameters")
@@ -0,0 +1,120 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.cursors import ELEMENTS_PER_PAGE
+from djeotree.models import Element, ElementTagValue, Family, Tag
+from djeotree.search import get_terms, search
+from djeotree.versions import values_changed
+from djeotree.views import ElementSearchView
+
+User = get_user_model()
+
+
+@override_settings(USE_I18N=False)
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree search")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Aqueduct")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        for intro, body, private in [
+            ("Stone bridge", "<p>Built with <b>travertine</b></p>", False),
+            ("Wooden bridge", "<p>Bridge over bridge &amp; river</p>", False),
+            ("Old mill", None, False),
+            ("Secret bridge", None, True),
+        ]:
+            Element.objects.create(
+                user=u, family=f, intro=intro, body=body, private=private, geom=point
+            )
+        t = Tag.objects.create(title="Material")
+        ElementTagValue.objects.create(
+            tag=t, element=Element.objects.get(intro="Old mill"), value="Granite"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_intros(self, query, user=None):
+        queryset = Element.objects.visible_to(user or self.anonymous)
+        return [e.intro for e in search(queryset, query).order_by("rank", "id")]
+
+    def test_search(self):
+        self.anonymous = self.client.get("/").wsgi_request.user
+        self.assertEquals(get_terms('bridge* "OR" -river'), ["bridge", "or", "river"])
+        self.assertEquals(self.get_intros('"'), [])
+        self.assertEquals(self.get_intros("travertine"), ["Stone bridge"])
+        self.assertEquals(self.get_intros("granite"), ["Old mill"])
+        self.assertEquals(self.get_intros("aqued mill"), ["Old mill"])
+        print("\n-Tested search of body, tag values and family title")
+        self.assertEquals(self.get_intros("bridge"), ["Wooden bridge", "Stone bridge"])
+        u = User.objects.get(username="andy.war65")
+        self.assertEquals(len(self.get_intros("bridge", u)), 3)
+        print("\n-Tested ranked and private results")
+
+    def test_sync(self):
+        self.anonymous = self.client.get("/").wsgi_request.user
+        e = Element.objects.get(intro="Old mill")
+        e.intro = "Old forge"
+        e.save()
+        self.assertEquals(self.get_intros("forge"), ["Old forge"])
+        value = ElementTagValue.objects.get(value="Granite")
+        self.client.force_login(e.user)
+        self.client.get(
+            reverse("geotree:value_delete", kwargs={"pk": value.id}),
+            HTTP_HX_REQUEST="true",
+        )
+        self.assertEquals(self.get_intros("granite"), [])
+        t = Tag.objects.create(title="Era")
+        t2 = Tag.objects.create(title="Style")
+        ElementTagValue.objects.create(tag=t, element=e, value="Roman")
+        self.assertEquals(self.get_intros("roman"), ["Old forge"])
+        t.delete()
+        self.assertEquals(self.get_intros("roman"), [])
+        value = ElementTagValue.objects.create(tag=t2, element=e, value="Gothic")
+        ElementTagValue.objects.filter(id=value.id).delete()
+        self.assertEquals(self.get_intros("gothic"), ["Old forge"])
+        values_changed([e.id], [t2.id])
+        self.assertEquals(self.get_intros("gothic"), [])
+        f = Family.objects.get(title="Aqueduct")
+        f.title = "Viaduct"
+        f.save()
+        self.assertEquals(len(self.get_intros("viaduct")), 3)
+        self.assertEquals(self.get_intros("aqueduct"), [])
+        e.delete()
+        self.assertEquals(len(self.get_intros("viaduct")), 2)
+        print("\n-Tested search documents in sync")
+
+    def test_views(self):
+        url = reverse("geotree:element_search")
+        # full pages extend the base template of the project
+        response = self.client.get(url, {"q": "bridge"}, HTTP_HX_REQUEST="true")
+        self.assertEquals(response.status_code, 200)
+        self.assertContains(response, "Stone bridge")
+        self.assertNotContains(response, "Secret bridge")
+        print("\n-Tested search page")
+        response = self.client.get(
+            reverse("geotree:element_search_features"), {"q": "bridge"}
+        )
+        features = response.json()["features"]
+        self.assertEquals(len(features), 2)
+        print("\n-Tested search features")
+
+    def test_pages(self):
+        url = reverse("geotree:element_search")
+        ElementSearchView.page_size = 1
+        self.addCleanup(setattr, ElementSearchView, "page_size", ELEMENTS_PER_PAGE)
+        response = self.client.get(url, {"q": "bridge"})
+        cursor = response.context["cursor"]
+        response = self.client.get(
+            url, {"q": "bridge", "cursor": cursor}, HTTP_HX_REQUEST="true"
+        )
+        self.assertContains(response, "Stone bridge")
+        self.assertEquals(response.context["cursor"], None)
+        print("\n-Tested search pages")
@@ -0,0 +1,111 @@
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import translation
+
+from djeotree.lines import LINE_ZOOMS
+from djeotree.models import Element, Family
+from djeotree.tiles import get_tile, invalidate_tiles, render_tile
+from djeotree.utils import clip_line, lonlat_to_tile, tile_bbox
+
+User = get_user_model()
+
+
+class TileTest(TestCase):
+    def test_tile_bbox(self):
+        print("\nTest djeotree tiles")
+        x, y = lonlat_to_tile(12.493652, 41.866288, 10)
+        west, south, east, north = tile_bbox(10, x, y)
+        self.assertTrue(west <= 12.493652 < east)
+        self.assertTrue(south <= 41.866288 < north)
+        print("\n-Tested tile bounds")
+
+    def test_clip_line(self):
+        coords = [[-2, 0], [0, 0], [0.5, 0.5], [2, 0.5], [2, 2], [0.5, 0.8]]
+        parts = clip_line(coords, (-1, -1, 1, 1))
+        self.assertEquals(
+            parts, [[[-1, 0], [0, 0], [0.5, 0.5], [1, 0.5]], [[0.75, 1], [0.5, 0.8]]]
+        )
+        print("\n-Tested line clipping")
+
+
+@override_settings(USE_I18N=False)
+class TileRenderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree tile rendering")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Aqueduct")
+        Family.add_root(title="Empty")
+        for lon, lat in [(12.49, 41.86), (12.51, 41.88)]:
+            point = '{"type": "Point","coordinates": [%s,%s]}' % (lon, lat)
+            Element.objects.create(user=u, family=f, intro="foo", geom=point)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_lines(self, zoom, lon, lat):
+        x, y = lonlat_to_tile(lon, lat, zoom)
+        features = json.loads(render_tile(zoom, x, y))["features"]
+        return [f for f in features if f["geometry"]["type"] == "MultiLineString"]
+
+    def test_extent(self):
+        f = Family.objects.get(title="Aqueduct")
+        self.assertEquals(
+            (f.west, f.south, f.east, f.north), (12.49, 41.86, 12.51, 41.88)
+        )
+        self.assertIsNone(Family.objects.get(title="Empty").west)
+        print("\n-Tested family line extent")
+        self.assertEquals(len(self.get_lines(14, 12.5, 41.87)), 1)
+        self.assertEquals(self.get_lines(14, -70, 0), [])
+        print("\n-Tested lines of tiles")
+        # elements, families and simplified lines of the band
+        with self.assertNumQueries(3):
+            self.assertEquals(len(self.get_lines(10, 12.5, 41.87)), 1)
+        with self.assertNumQueries(2):
+            self.assertEquals(len(self.get_lines(max(LINE_ZOOMS) + 1, 12.5, 41.87)), 1)
+        with self.assertNumQueries(2):
+            self.get_lines(10, -70, 0)
+        print("\n-Tested simplified line queries")
+        Element.objects.get(lon=12.51).delete()
+        f.refresh_from_db()
+        self.assertEquals((f.west, f.east), (12.49, 12.49))
+        print("\n-Tested extent after line change")
+
+    def test_tile_language(self):
+        x, y = lonlat_to_tile(12.5, 41.87, 14)
+        with self.settings(USE_I18N=True):
+            Element.refresh_popups(Element.objects.all())
+            for family in Family.objects.all():
+                family.refresh_popup()
+            for code in ("it", "en", "it"):
+                with translation.override(code):
+                    features = json.loads(get_tile(14, x, y))["features"]
+                for feature in features:
+                    popup = feature["properties"]["popupContent"]["content"]
+                    self.assertIn('href="/%s/' % code, popup)
+        print("\n-Tested tiles by language")
+
+    def test_popup_changes(self):
+        x, y = lonlat_to_tile(12.49, 41.86, 14)
+        self.assertIn("andy.war65", get_tile(14, x, y))
+        user = User.objects.get(username="andy.war65")
+        user.username = "andy.war66"
+        user.save()
+        self.assertIn("andy.war66", get_tile(14, x, y))
+        print("\n-Tested tiles after username change")
+        # popups stored in an old format are cached in tiles
+        Element.objects.update(popup_cache={"it": {"content": "stale"}})
+        invalidate_tiles()
+        self.assertIn("stale", get_tile(14, x, y))
+        call_command("refresh_popups", stdout=StringIO())
+        self.assertNotIn("stale", get_tile(14, x, y))
+        print("\n-Tested tiles after popups refresh")
@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from djeotree.models import Element, ElementImage, ElementTagValue, Family, Tag
+
+User = get_user_model()
+
+
+@override_settings(USE_I18N=False)
+class DataVersionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        print("\nTest djeotree data versions")
+        u = User.objects.create(
+            username="andy.war65",
+            password="P4s5W0r6",
+            email="andy@war.com",
+        )
+        f = Family.add_root(title="Family title")
+        f.add_child(title="Child title")
+        point = '{"type": "Point","coordinates": [12.493652,41.866288]}'
+        Element.objects.create(user=u, family=f, intro="foo", geom=point)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_conditional_get(self):
+        url = reverse("geotree:family_list")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+        print("\n-Tested not modified response")
+        f = Family.objects.get(title="Family title")
+        Element.objects.create(
+            user=User.objects.get(username="andy.war65"),
+            family=f,
+            intro="bar",
+            geom='{"type": "Point","coordinates": [12.5,41.9]}',
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(response["ETag"], etag)
+        print("\n-Tested ETag after data change")
+
+    def test_family_versions(self):
+        f = Family.objects.get(title="Family title")
+        c = Family.objects.get(title="Child title")
+        parent_etag = self.client.get(
+            reverse("geotree:family_detail", kwargs={"pk": f.id})
+        )["ETag"]
+        e = Element.objects.get(intro="foo")
+        e.family = c
+        e.save()
+        response = self.client.get(
+            reverse("geotree:family_detail", kwargs={"pk": f.id}),
+            HTTP_IF_NONE_MATCH=parent_etag,
+        )
+        self.assertEquals(response.status_code, 200)
+        print("\n-Tested ancestor family version after element change")
+
+    def test_value_versions(self):
+        e = Element.objects.get(intro="foo")
+        t = Tag.objects.create(title="Material")
+        value = ElementTagValue.objects.create(tag=t, element=e, value="stone")
+        for name, params in [
+            ("element_facets", {}),
+            ("element_clusters", {"zoom": 0, "tag": "%s:stone" % t.id}),
+        ]:
+            url = reverse("geotree:%s" % name)
+            etag = self.client.get(url, params)["ETag"]
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEquals(response.status_code, 304)
+            value.value = "wood" if value.value == "stone" else "stone"
+            value.save()
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEquals(response.status_code, 200)
+        print("\n-Tested facet and cluster versions after value change")
+        etag = self.client.get(reverse("geotree:element_facets"))["ETag"]
+        self.client.force_login(e.user)
+        self.client.get(
+            reverse("geotree:value_delete", kwargs={"pk": value.id}),
+            HTTP_HX_REQUEST="true",
+        )
+        self.client.logout()
+        response = self.client.get(
+            reverse("geotree:element_facets"), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEquals(response.status_code, 200)
+        print("\n-Tested facet versions after value deletion")
+
+    def test_popup_versions(self):
+        e = Element.objects.get(intro="foo")
+        t = Tag.objects.create(title="Material")
+        ElementTagValue.objects.create(tag=t, element=e, value="stone")
+        url = reverse("geotree:tag_detail", kwargs={"pk": t.id})
+        etag = self.client.get(url)["ETag"]
+        ElementImage.objects.create(element=e, description="first", position=0)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        print("\n-Tested tag version after image change")
+        urls = [url, reverse("geotree:family_detail", kwargs={"pk": e.family_id})]
+        etags = [self.client.get(url)["ETag"] for url in urls]
+        e.user.username = "andy.war66"
+        e.user.save()
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEquals(response.status_code, 200)
+            self.assertContains(response, "andy.war66")
+        print("\n-Tested tag and family versions after username change")
+
+    def test_anonymous_page_cache(self):
+        url = reverse("geotree:tag_list")
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEquals(first.content, second.content)
+        print("\n-Tested cached anonymous page")
@@ -0,0 +1,168 @@
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils.crypto import get_random_string
+from django.utils.translation import get_language
+
+from .lines import get_band
+from .models import Element, Family, FamilyLine
+from .utils import clip_line, lonlat_to_tile, tile_bbox
+
+"""
+    GeoJSON slippy map tiles of public elements and family lines, cached with
+    versioned keys. Tile content key is made of a global version, a zoom level
+    version and a tile version, so tiles can be invalidated one by one, by
+    zoom level or all together.
+"""
+
+# a FileBasedCache alias stores tiles on the local filesystem
+TILE_CACHE = getattr(settings, "DJEOTREE_TILE_CACHE", "default")
+TILE_TIMEOUT = getattr(settings, "DJEOTREE_TILE_TIMEOUT", 60 * 60 * 24 * 7)
+TILE_MAX_ZOOM = getattr(settings, "DJEOTREE_TILE_MAX_ZOOM", 18)
+# above this number of tiles the whole zoom level is invalidated
+TILE_INVALIDATION_LIMIT = getattr(settings, "DJEOTREE_TILE_INVALIDATION_LIMIT", 64)
+VERSION_KEY = "djeotree:tiles:version"
+ZOOM_VERSION_KEY = "djeotree:tiles:version:%(zoom)s"
+TILE_VERSION_KEY = "djeotree:tiles:version:%(zoom)s/%(x)s/%(y)s"
+# popups in tiles are translated
+TILE_KEY = "djeotree:tiles:%(versions)s:%(language)s:%(zoom)s/%(x)s/%(y)s"
+
+
+def get_versions(keys):
+    """
+    Returns versions stored in cache. Missing versions are created random, so
+    that tiles cached before an eviction of their version are never served.
+    """
+    cache = caches[TILE_CACHE]
+    versions = cache.get_many(keys)
+    missing = {key: get_random_string(7) for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(keys):
+    caches[TILE_CACHE].set_many({key: get_random_string(7) for key in keys}, None)
+
+
+def invalidate_tiles():
+    bump_versions([VERSION_KEY])
+
+
+def invalidate_area(points):
+    """Invalidates tiles covering the bounds of a list of points at all zooms"""
+    west = min(p[0] for p in points)
+    east = max(p[0] for p in points)
+    south = min(p[1] for p in points)
+    north = max(p[1] for p in points)
+    keys = []
+    for zoom in range(TILE_MAX_ZOOM + 1):
+        x0, y0 = lonlat_to_tile(west, north, zoom)
+        x1, y1 = lonlat_to_tile(east, south, zoom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > TILE_INVALIDATION_LIMIT:
+            keys.append(ZOOM_VERSION_KEY % {"zoom": zoom})
+            continue
+        keys.extend(
+            TILE_VERSION_KEY % {"zoom": zoom, "x": x, "y": y}
+            for x in range(x0, x1 + 1)
+            for y in range(y0, y1 + 1)
+        )
+    bump_versions(keys)
+
+
+def get_line_neighbours(family_id, id, date, lon, lat):
+    """
+    Returns the point of a public element along with previous and next
+    points of the family line, i.e. the segments touched by the element
+    """
+    points = [(lon, lat)]
+    elements = Element.objects.filter(family_id=family_id, private=False).exclude(id=id)
+    previous = (
+        elements.filter(Q(date__lt=date) | Q(date=date, id__lt=id))
+        .order_by("-date", "-id")
+        .values_list("lon", "lat")
+        .first()
+    )
+    next = (
+        elements.filter(Q(date__gt=date) | Q(date=date, id__gt=id))
+        .order_by("date", "id")
+        .values_list("lon", "lat")
+        .first()
+    )
+    return points + [p for p in (previous, next) if p and None not in p]
+
+
+def render_tile(zoom, x, y):
+    """
+    Returns GeoJSON of public elements and clipped family lines of a tile,
+    lines are simplified for tile zoom (see lines.py)
+    """
+    bbox = tile_bbox(zoom, x, y)
+    west, south, east, north = bbox
+    features = []
+    elements = Element.objects.filter(
+        private=False, lon__gte=west, lon__lt=east, lat__gte=south, lat__lt=north
+    ).select_related("family", "user")
+    for e in elements:
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [e.lon, e.lat]},
+                "properties": {"popupContent": e.popupContent},
+            }
+        )
+    # lines not reaching the tile are skipped before clipping
+    families = list(
+        Family.objects.filter(
+            west__lte=east, east__gte=west, south__lte=north, north__gte=south
+        )
+    )
+    band = get_band(zoom)
+    simplified = {}
+    if families and band is not None:
+        simplified = dict(
+            FamilyLine.objects.filter(
+                zoom=band, family_id__in=[f.id for f in families]
+            ).values_list("family_id", "geom")
+        )
+    for family in families:
+        line = simplified.get(family.id)
+        line = line["coordinates"][0] if line else family.get_line()
+        parts = clip_line(line, bbox)
+        if not parts:
+            continue
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "MultiLineString", "coordinates": parts},
+                "properties": {"popupContent": family.popupContent},
+            }
+        )
+    return json.dumps({"type": "FeatureCollection", "features": features})
+
+
+def get_tile(zoom, x, y):
+    """Returns a tile from cache, rendering it if missing"""
+    versions = get_versions(
+        [
+            VERSION_KEY,
+            ZOOM_VERSION_KEY % {"zoom": zoom},
+            TILE_VERSION_KEY % {"zoom": zoom, "x": x, "y": y},
+        ]
+    )
+    key = TILE_KEY % {
+        "versions": "-".join(versions),
+        "language": get_language(),
+        "zoom": zoom,
+        "x": x,
+        "y": y,
+    }
+    cache = caches[TILE_CACHE]
+    tile = cache.get(key)
+    if tile is None:
+        tile = render_tile(zoom, x, y)
+        cache.set(key, tile, TILE_TIMEOUT)
+    return tile
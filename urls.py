@@ -5,20 +5,29 @@ from .views import (
     AuthorDetailView,
     AuthorListView,
     BaseListView,
+    ElementBboxView,
+    ElementCalendarView,
+    ElementClusterView,
     ElementCreateView,
     ElementDayArchiveView,
     ElementDeleteView,
     ElementDetailView,
+    ElementFacetView,
     ElementMonthArchiveView,
+    ElementNearbyView,
+    ElementSearchFeatureView,
+    ElementSearchView,
     ElementUpdateView,
     ElementYearArchiveView,
     FamilyDetailView,
+    FamilyLineView,
     FamilyListView,
     ImageCreateView,
     ImageDeleteView,
     ImageLoopView,
     ImageMoveDownView,
     ImageMoveUpView,
+    ImageReorderView,
     ImageUpdateView,
     TagDetailView,
     TagListView,
@@ -26,12 +35,36 @@ from .views import (
     ValueDeleteView,
     ValueDetailView,
     ValueUpdateView,
+    element_tile,
     family_element_download,
 )
 
 app_name = "geotree"
 urlpatterns = [
     path("", BaseListView.as_view(), name="base_list"),
+    path(_("elements/bbox/"), ElementBboxView.as_view(), name="element_bbox"),
+    path(
+        _("elements/clusters/"), ElementClusterView.as_view(), name="element_clusters"
+    ),
+    path(_("elements/facets/"), ElementFacetView.as_view(), name="element_facets"),
+    path(_("elements/nearby/"), ElementNearbyView.as_view(), name="element_nearby"),
+    path(_("search/"), ElementSearchView.as_view(), name="element_search"),
+    path(
+        _("search/features/"),
+        ElementSearchFeatureView.as_view(),
+        name="element_search_features",
+    ),
+    path(_("families/lines/"), FamilyLineView.as_view(), name="family_lines"),
+    path(
+        _("elements/calendar/"),
+        ElementCalendarView.as_view(),
+        name="element_calendar",
+    ),
+    path(
+        _("tiles/<int:zoom>/<int:x>/<int:y>.geojson"),
+        element_tile,
+        name="element_tile",
+    ),
     path(_("families/"), FamilyListView.as_view(), name="family_list"),
     path(_("authors/"), AuthorListView.as_view(), name="author_list"),
     path(_("tags/"), TagListView.as_view(), name="tag_list"),
@@ -85,6 +118,11 @@ urlpatterns = [
     ),
     path(_("element/image/<pk>/up/"), ImageMoveUpView.as_view(), name="image_up"),
     path(_("element/image/<pk>/down/"), ImageMoveDownView.as_view(), name="image_down"),
+    path(
+        _("element/<pk>/images/order/"),
+        ImageReorderView.as_view(),
+        name="image_reorder",
+    ),
     path(_("element/<pk>/value/add/"), ValueCreateView.as_view(), name="value_create"),
     path(_("element/value/<pk>/"), ValueDetailView.as_view(), name="value_detail"),
     path(
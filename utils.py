@@ -1,12 +1,55 @@
-from pathlib import Path
+import json
+import math
+import os
+from io import BytesIO
+from time import perf_counter
 
-from django.conf import settings
+from django.conf import global_settings, settings
+from django.core.files.base import ContentFile
+from django.utils import translation
+from filebrowser.settings import VERSION_QUALITY
+from filebrowser.settings import VERSIONS as FB_VERSIONS
+from filebrowser.utils import process_image
 from PIL import Image
 
 """
     Collection of utilities
 """
 
+# path step of Family nodes, historical models in migrations lack steplen
+FAMILY_STEPLEN = 4
+# versions generated when images are saved, used by templates and popups
+IMAGE_VERSIONS = getattr(
+    settings, "DJEOTREE_IMAGE_VERSIONS", ["popup", "wide", "big", "thumbnail"]
+)
+
+
+def get_languages():
+    """
+    Returns codes of languages stored popups are built for: LANGUAGES, or
+    just LANGUAGE_CODE without translations or with Django's default list
+    """
+    if settings.USE_I18N and settings.LANGUAGES is not global_settings.LANGUAGES:
+        return [code for code, name in settings.LANGUAGES]
+    return [settings.LANGUAGE_CODE]
+
+
+def build_translated(build):
+    """
+    Returns {language code: build()} for every language, popups hold urls
+    with translated paths and language prefixes
+    """
+    built = {}
+    for code in get_languages():
+        with translation.override(code):
+            built[code] = build()
+    return built
+
+
+def get_translated(built):
+    """Returns the value of the active language in build_translated output"""
+    return (built or {}).get(translation.get_language())
+
 
 def cad2hex(id):
     while id > 255:
@@ -276,20 +319,261 @@ def cad2hex(id):
     return hex
 
 
-def check_wide_image(fb_image):
+def get_coordinates(geom):
+    """
+    Returns coordinates of a Point geometry. geom may still be a json string
+    if the instance has not been reloaded from the database.
+    """
+    if isinstance(geom, str):
+        geom = json.loads(geom)
+    return geom["coordinates"]
+
+
+def get_extent(coords):
+    """Returns west, south, east and north bounds of a list of coordinates"""
+    if not coords:
+        return None, None, None, None
+    lons = [c[0] for c in coords]
+    lats = [c[1] for c in coords]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def parse_bbox(bbox):
+    """
+    Parses a 'west,south,east,north' string (as in Leaflet's toBBoxString).
+    Longitudes are brought back to [-180, 180), so west may be greater than
+    east if bbox crosses the antimeridian. Raises ValueError if string is
+    malformed or latitudes are out of range.
+    """
+    west, south, east, north = [float(c) for c in bbox.split(",")]
+    if not all(math.isfinite(c) for c in (west, east)):
+        raise ValueError("Longitudes must be finite")
+    if not -90 <= south <= north <= 90:
+        raise ValueError("Latitudes must be ordered within -90 and 90")
+    if east - west >= 360:
+        return (-180, south, 180, north)
+    west = (west + 180) % 360 - 180
+    east = (east + 180) % 360 - 180
+    return (west, south, east, north)
+
+
+def parse_tags(tags):
     """
-    Checks if image is suitable for wide version. Performs 'version_generate',
-    then controls dimensions. If small, pastes the image on a 1600x800 black
-    background replacing original wide version. fb_image is a Fileobject.
+    Parses a list of 'tag_id:value' strings into (tag id, value) tuples, a
+    bare tag id gives a None value (any value). Raises ValueError if a tag id
+    is not an integer.
     """
-    img = fb_image.version_generate("wide")
-    if img.width < 1600 or img.height < 800:
-        path = Path(settings.MEDIA_ROOT).joinpath(fb_image.version_path("wide"))
-        img = Image.open(path)
-        back = Image.new(img.mode, (1600, 800))
-        position = (
-            int((back.width - img.width) / 2),
-            int((back.height - img.height) / 2),
+    filters = []
+    for tag in tags:
+        tag_id, sep, value = tag.partition(":")
+        filters.append((int(tag_id), value if sep else None))
+    return filters
+
+
+def in_bbox(lon, lat, bbox):
+    west, south, east, north = bbox
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lon <= east
+    return lon >= west or lon <= east
+
+
+def lonlat_to_pixel(lon, lat, zoom):
+    """Returns Web Mercator pixel coordinates of a point at given zoom level"""
+    # clamp latitude to the limits of the Mercator projection
+    lat = max(min(lat, 85.0511), -85.0511)
+    size = 256 * 2**zoom
+    x = (lon + 180) / 360 * size
+    sin = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * size
+    return x, y
+
+
+def lonlat_to_tile(lon, lat, zoom):
+    """Returns x and y of the slippy map tile containing a point"""
+    x, y = lonlat_to_pixel(lon, lat, zoom)
+    last = 2**zoom - 1
+    return min(int(x // 256), last), min(int(y // 256), last)
+
+
+def tile_bbox(zoom, x, y):
+    """Returns (west, south, east, north) bounds of a slippy map tile"""
+    n = 2**zoom
+
+    def lat(y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+    return (x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y))
+
+
+def clip_segment(a, b, bbox):
+    """
+    Clips segment from a to b to bbox (Liang-Barsky algorithm). Returns
+    clipped endpoints or None if segment lies outside.
+    """
+    west, south, east, north = bbox
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    t0, t1 = 0, 1
+    for p, q in (
+        (-dx, a[0] - west),
+        (dx, east - a[0]),
+        (-dy, a[1] - south),
+        (dy, north - a[1]),
+    ):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return None
+    # keep original vertices, so that consecutive parts can be joined
+    start = list(a) if t0 == 0 else [a[0] + t0 * dx, a[1] + t0 * dy]
+    end = list(b) if t1 == 1 else [a[0] + t1 * dx, a[1] + t1 * dy]
+    return start, end
+
+
+def clip_line(coords, bbox):
+    """Clips a list of coordinates to bbox, returns a list of line parts"""
+    parts = []
+    part = None
+    for a, b in zip(coords, coords[1:]):
+        clipped = clip_segment(a, b, bbox)
+        if not clipped:
+            part = None
+            continue
+        if part and part[-1] == clipped[0]:
+            part.append(clipped[1])
+        else:
+            part = list(clipped)
+            parts.append(part)
+    return parts
+
+
+def get_draft_size(size, specs):
+    """
+    Returns the smallest size the source can be decoded at, so that every
+    version is still downscaled (see filebrowser's scale_and_crop), or None
+    if some version needs the full size
+    """
+    x, y = size
+    draft = (0, 0)
+    for spec in specs:
+        width = float(spec.get("width") or 0)
+        height = float(spec.get("height") or 0)
+        if not width and not height:
+            return None
+        xr = width or x * height / y
+        yr = height or y * width / x
+        ratio = (
+            max(xr / x, yr / y)
+            if "crop" in spec.get("opts", "")
+            else min(xr / x, yr / y)
+        )
+        if ratio >= 1.0:
+            return None
+        draft = (
+            max(draft[0], math.ceil(x * ratio)),
+            max(draft[1], math.ceil(y * ratio)),
         )
-        back.paste(img, position)
-        back.save(path)
+    return draft
+
+
+def get_reduced(image, target, reduced):
+    """
+    Returns image reduced by the largest integer factor keeping it at least
+    twice the target size, so that resampling is cheap and still sharp.
+    reduced caches images by factor.
+    """
+    width, height = target
+    if image.mode not in ("L", "RGB", "RGBA"):
+        # i.e. palette images, which reduce doesn't support
+        return image
+    factors = []
+    if width:
+        factors.append(image.width // (2 * width))
+    if height:
+        factors.append(image.height // (2 * height))
+    factor = min(factors) if factors else 1
+    if factor < 2:
+        return image
+    if factor not in reduced:
+        reduced[factor] = image.reduce(factor)
+    return reduced[factor]
+
+
+def pad_image(image, width, height):
+    """Pastes image on the center of a black width x height background"""
+    if image.width >= width and image.height >= height:
+        return image
+    back = Image.new(image.mode, (width, height))
+    back.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+    return back
+
+
+def save_version(storage, image, path, quality):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jpg", ".jpeg") and image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    content = BytesIO()
+    image.save(
+        content,
+        format=Image.EXTENSION[ext],
+        quality=quality,
+        optimize=ext != ".gif",
+    )
+    if storage.exists(path):
+        storage.delete(path)
+    storage.save(path, ContentFile(content.getvalue()))
+
+
+def generate_versions(fb_image, names=None, timings=None):
+    """
+    Generates versions of fb_image, padding the wide one. The original is
+    decoded once (JPEGs at the smallest size fitting every version, thanks
+    to draft) and each version is resampled from an integer reduction of it
+    and written once. Returns a list of (name, path, width, height) tuples.
+    Seconds spent decoding and on each version are added to timings if
+    given. Only deals with files and not with the database, so it is safe
+    to run in worker threads.
+    """
+    timings = {} if timings is None else timings
+    names = names or IMAGE_VERSIONS
+    storage = fb_image.site.storage
+    start = perf_counter()
+    try:
+        file = storage.open(fb_image.path)
+    except (IOError, ValueError):
+        # original file is missing
+        return []
+    with file:
+        image = Image.open(file)
+        specs = [FB_VERSIONS.get(name, {}) for name in names]
+        draft = get_draft_size(image.size, specs)
+        if draft:
+            image.draft(image.mode, draft)
+        image.load()
+    timings["decode"] = timings.get("decode", 0) + perf_counter() - start
+    versions = []
+    reduced = {}
+    for name, spec in zip(names, specs):
+        start = perf_counter()
+        width, height = spec.get("width") or 0, spec.get("height") or 0
+        version = process_image(get_reduced(image, (width, height), reduced), spec)
+        for method in spec.get("methods", []):
+            if callable(method):
+                version = method(version)
+        if name == "wide":
+            # wide version fills its box, small images are centered
+            version = pad_image(version, width or 1600, height or 800)
+        path = fb_image.version_path(name)
+        save_version(storage, version, path, spec.get("quality", VERSION_QUALITY))
+        versions.append((name, path, version.width, version.height))
+        timings[name] = timings.get(name, 0) + perf_counter() - start
+    return versions
@@ -0,0 +1,74 @@
+from hashlib import md5
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .clusters import invalidate_clusters
+from .models import Family
+
+"""
+    Data versions, stored in cache as timestamps of last change. Pages
+    depending on them get ETag and Last-Modified headers, and anonymous
+    responses are cached until a version changes.
+"""
+
+PAGE_TIMEOUT = getattr(settings, "DJEOTREE_PAGE_TIMEOUT", 60 * 60)
+# any element, family, tag or tag value
+DATA_KEY = "djeotree:data"
+# family tree structure and titles
+FAMILIES_KEY = "djeotree:data:families"
+FAMILY_KEY = "djeotree:data:family:%s"
+TAG_KEY = "djeotree:data:tag:%s"
+AUTHOR_KEY = "djeotree:data:author:%s"
+# element search documents
+SEARCH_KEY = "djeotree:data:search"
+PAGE_KEY = "djeotree:pages:%s"
+
+
+def get_versions(keys):
+    """
+    Returns versions stored in cache. Missing versions are set to now, so
+    that pages cached before an eviction of their version are never served.
+    """
+    versions = cache.get_many(keys)
+    missing = {key: time() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(keys):
+    now = time()
+    cache.set_many({key: now for key in keys}, None)
+
+
+def bump_families(family_ids):
+    """Bumps versions of families and of their ancestors, two queries"""
+    paths = Family.objects.filter(id__in=family_ids).values_list("path", flat=True)
+    prefixes = {
+        path[0:i]
+        for path in paths
+        for i in range(Family.steplen, len(path) + 1, Family.steplen)
+    }
+    ids = Family.objects.filter(path__in=prefixes).values_list("id", flat=True)
+    bump_versions([FAMILY_KEY % id for id in ids])
+
+
+def values_changed(element_ids, tag_ids):
+    """
+    Syncs search documents, clusters and data versions after tag values of
+    elements change. Values have no post_delete receiver, which would prevent
+    fast deletes in bulk, so every path deleting values calls this.
+    """
+    # search imports this module to bump its own version
+    from .search import index_elements
+
+    index_elements(element_ids)
+    invalidate_clusters(filtered=True)
+    bump_versions([DATA_KEY] + [TAG_KEY % id for id in tag_ids])
+
+
+def get_etag(*parts):
+    return '"%s"' % md5(repr(parts).encode()).hexdigest()
@@ -1,15 +1,21 @@
 import csv
+import hashlib
 import json
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.exceptions import PermissionDenied
-from django.http import Http404, HttpResponse
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, SuspiciousOperation
+from django.core.paginator import Paginator
+from django.db.models import Prefetch, Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from django.utils.crypto import get_random_string
+from django.utils.http import http_date
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import (
     CreateView,
@@ -19,9 +25,16 @@ from django.views.generic import (
     RedirectView,
     TemplateView,
     UpdateView,
+    View,
 )
 from django.views.generic.dates import DayArchiveView, MonthArchiveView, YearArchiveView
 
+from .authors import AUTHORS_PER_PAGE, get_authors
+from .clusters import get_cluster_collection
+from .cursors import ELEMENTS_PER_PAGE, get_page
+from .dates import get_calendar, get_days, get_months
+from .features import dumps, get_collection, iter_collection
+from .forest import get_forest
 from .forms import (
     ElementCreateForm,
     ElementDeleteForm,
@@ -29,7 +42,25 @@ from .forms import (
     ImageCreateForm,
     ValueCreateForm,
 )
+from .lines import get_line_collection
 from .models import Element, ElementImage, ElementTagValue, Family, Tag
+from .nearby import NEARBY_MAX, get_nearest
+from .search import SEARCH_MAX, search
+from .tiles import TILE_MAX_ZOOM, get_tile
+from .utils import parse_bbox, parse_tags
+from .versions import (
+    AUTHOR_KEY,
+    DATA_KEY,
+    FAMILIES_KEY,
+    FAMILY_KEY,
+    PAGE_KEY,
+    PAGE_TIMEOUT,
+    SEARCH_KEY,
+    TAG_KEY,
+    get_etag,
+    get_versions,
+    values_changed,
+)
 
 User = get_user_model()
 
@@ -54,47 +85,306 @@ class HxOnlyTemplateMixin:
             return [self.template_name]
 
 
-class BaseListView(HxPageTemplateMixin, ListView):
+class DataVersionMixin:
+    """
+    Answers conditional GET requests with data versions (see versions.py),
+    full responses to anonymous users are cached until versions change
+    """
+
+    version_keys = [DATA_KEY]
+    cache_anonymous = True
+
+    def get_version_keys(self):
+        return self.version_keys
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return super().dispatch(request, *args, **kwargs)
+        versions = get_versions(self.get_version_keys())
+        user = request.user.pk if request.user.is_authenticated else None
+        etag = get_etag(request.get_full_path(), bool(request.htmx), user, versions)
+        last_modified = int(max(versions))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        cacheable = user is None and self.cache_anonymous
+        if response is None and cacheable:
+            response = cache.get(PAGE_KEY % etag.strip('"'))
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+            # pages with a csrf token belong to a single session
+            if (
+                cacheable
+                and response.status_code == 200
+                and not response.streaming
+                and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+            ):
+                cache.set(PAGE_KEY % etag.strip('"'), response, PAGE_TIMEOUT)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ("Cookie", "HX-Request"))
+        return response
+
+
+class KeysetPageMixin:
+    """
+    Paginates object list on page_fields with cursor parameter (see
+    cursors.py). htmx requests of further pages get page_template_name,
+    which appends elements and markers to the ones already shown.
+    """
+
+    page_fields = ("family", "id")
+    page_size = ELEMENTS_PER_PAGE
+    page_template_name = "djeotree/htmx/element_page.html"
+
+    def is_next_page(self):
+        return bool(self.request.htmx and self.request.GET.get("cursor"))
+
+    def get_template_names(self):
+        if self.is_next_page():
+            return [self.page_template_name]
+        return super().get_template_names()
+
+    def get_context_data(self, **kwargs):
+        queryset = kwargs.pop("object_list", self.object_list)
+        try:
+            page, cursor = get_page(
+                queryset,
+                self.page_fields,
+                self.request.GET.get("cursor"),
+                size=self.page_size,
+            )
+        except ValueError:
+            raise SuspiciousOperation(_("Invalid cursor"))
+        self.object_list = page
+        context = super().get_context_data(object_list=page, **kwargs)
+        context["cursor"] = cursor
+        if self.is_next_page():
+            context["page_crypto"] = get_random_string(7)
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        if self.is_next_page():
+            dict = {"appendMarkerCollection": context["page_crypto"]}
+            response["HX-Trigger-After-Swap"] = json.dumps(dict)
+        return response
+
+
+class BaseListView(DataVersionMixin, HxPageTemplateMixin, ListView):
     model = Element
     context_object_name = "elements"
     template_name = "djeotree/base_list.html"
 
     def get_queryset(self):
-        qs = Element.objects.filter(private=False)
-        if self.request.user.is_authenticated:
-            qs2 = Element.objects.filter(user_id=self.request.user.uuid, private=True)
-            qs = qs | qs2
-        return qs
+        try:
+            # i.e. ?tag=1:stone&tag=2:poor, a bare tag id matches any value
+            self.tags = parse_tags(self.request.GET.getlist("tag"))
+        except ValueError:
+            raise SuspiciousOperation(_("Invalid tag filter"))
+        return Element.objects.visible_to(self.request.user).with_tags(self.tags)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["lines"] = Family.objects.all()
+        context["line_url"] = reverse("geotree:family_lines")
         context["mapbox_token"] = settings.MAPBOX_TOKEN
+        # markers are loaded by the map, only inside visible bounds
+        context["marker_url"] = reverse("geotree:element_clusters")
         return context
 
 
-class FamilyListView(HxPageTemplateMixin, ListView):
+class ElementBboxView(BaseListView):
+    """
+    Returns visible elements as GeoJSON, restricted to bbox parameter if
+    present (west,south,east,north, as in Leaflet's toBBoxString). Output is
+    streamed in chunks of features.
+    """
+
+    cache_anonymous = False
+
+    def render_to_response(self, context, **response_kwargs):
+        return StreamingHttpResponse(
+            iter_collection(self.object_list), content_type="application/json"
+        )
+
+    def get_queryset(self):
+        qs = super(ElementBboxView, self).get_queryset()
+        bbox = self.request.GET.get("bbox")
+        if not bbox:
+            return qs
+        try:
+            west, south, east, north = parse_bbox(bbox)
+        except ValueError:
+            raise SuspiciousOperation(_("Invalid bounding box"))
+        qs = qs.filter(lat__gte=south, lat__lte=north)
+        if west <= east:
+            return qs.filter(lon__gte=west, lon__lte=east)
+        # bbox crosses the antimeridian
+        return qs.filter(Q(lon__gte=west) | Q(lon__lte=east))
+
+
+class ElementClusterView(BaseListView):
+    """
+    Returns visible elements clustered for zoom parameter as GeoJSON,
+    restricted to bbox parameter if present
+    """
+
+    cache_anonymous = False
+
+    def get(self, request, *args, **kwargs):
+        try:
+            zoom = int(request.GET.get("zoom", 0))
+            bbox = request.GET.get("bbox")
+            bbox = parse_bbox(bbox) if bbox else None
+        except ValueError:
+            raise SuspiciousOperation(_("Invalid zoom or bounding box"))
+        queryset = self.get_queryset()
+        visibility = "public"
+        if (
+            request.user.is_authenticated
+            and Element.objects.filter(user_id=request.user.uuid, private=True).exists()
+        ):
+            visibility = request.user.uuid
+        if self.tags:
+            # filtered pyramids are cached apart
+            tags = json.dumps(sorted(self.tags, key=str))
+            visibility = "%s:%s" % (visibility, hashlib.md5(tags.encode()).hexdigest())
+        collection = get_cluster_collection(
+            queryset, visibility, zoom, bbox=bbox, filtered=bool(self.tags)
+        )
+        return HttpResponse(dumps(collection), content_type="application/json")
+
+
+class ElementFacetView(BaseListView):
+    """
+    Returns counts of tag values of visible elements as JSON, restricted to
+    tag parameters if present
+    """
+
+    cache_anonymous = False
+
+    def get(self, request, *args, **kwargs):
+        facets = {}
+        for tag_id, title, value, count in self.get_queryset().facets():
+            facet = facets.setdefault(
+                tag_id, {"tag": tag_id, "title": title, "values": []}
+            )
+            facet["values"].append({"value": value, "count": count})
+        return JsonResponse({"facets": list(facets.values())})
+
+
+class ElementCalendarView(DataVersionMixin, View):
+    """
+    Returns counts of visible elements per year, month and day as JSON,
+    restricted to year and month parameters if present
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            year = int(request.GET.get("year", 0))
+            month = int(request.GET.get("month", 0))
+        except ValueError:
+            raise SuspiciousOperation(_("Invalid year or month"))
+        calendar = get_calendar(request.user)
+        if year:
+            calendar = [item for item in calendar if item["year"] == year]
+        if year and month:
+            calendar = [
+                dict(item, months=[m for m in item["months"] if m["month"] == month])
+                for item in calendar
+            ]
+        return JsonResponse({"calendar": calendar})
+
+
+class ElementNearbyView(View):
+    """
+    Returns visible elements nearest to lat and lon parameters as GeoJSON,
+    with distance in meters. Optional parameters are k (number of elements),
+    radius (in meters) and family (restricting elements to its subtree).
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            lat = float(request.GET["lat"])
+            lon = float(request.GET["lon"])
+            k = min(int(request.GET.get("k", 10)), NEARBY_MAX)
+            radius = request.GET.get("radius")
+            radius = float(radius) if radius else None
+            family = request.GET.get("family")
+            family = get_object_or_404(Family, id=int(family)) if family else None
+        except (KeyError, ValueError):
+            raise SuspiciousOperation(_("Invalid coordinates or parameters"))
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or k < 1:
+            raise SuspiciousOperation(_("Invalid coordinates or parameters"))
+        found = get_nearest(request.user, lon, lat, k=k, radius=radius, family=family)
+        elements = Element.objects.select_related("family", "user").in_bulk(
+            [id for id, distance in found]
+        )
+        features = [
+            {
+                "type": "Feature",
+                "id": id,
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [elements[id].lon, elements[id].lat],
+                },
+                "properties": {
+                    "popupContent": elements[id].popupContent,
+                    "distance": round(distance, 1),
+                },
+            }
+            for id, distance in found
+            # deleted meanwhile
+            if id in elements
+        ]
+        collection = {"type": "FeatureCollection", "features": features}
+        return HttpResponse(dumps(collection), content_type="application/json")
+
+
+class FamilyLineView(DataVersionMixin, View):
+    """
+    Returns family lines as GeoJSON, simplified for zoom parameter (see
+    lines.py) and restricted to the subtree of family parameter if present
+    """
+
+    def setup(self, request, *args, **kwargs):
+        super(FamilyLineView, self).setup(request, *args, **kwargs)
+        try:
+            self.zoom = int(request.GET.get("zoom", 0))
+            family = request.GET.get("family")
+            self.family = get_object_or_404(Family, id=int(family)) if family else None
+        except ValueError:
+            raise SuspiciousOperation(_("Invalid zoom or family"))
+
+    def get_version_keys(self):
+        if self.family:
+            return [FAMILIES_KEY, FAMILY_KEY % self.family.id]
+        return [DATA_KEY]
+
+    def get(self, request, *args, **kwargs):
+        lines = self.family.get_subtree() if self.family else Family.objects.all()
+        return HttpResponse(
+            get_line_collection(lines, self.zoom), content_type="application/json"
+        )
+
+
+class FamilyListView(DataVersionMixin, HxPageTemplateMixin, ListView):
     model = Element
     context_object_name = "elements"
     template_name = "djeotree/htmx/family_list.html"
 
     def get_queryset(self):
-        qs = Element.objects.filter(private=False)
-        if self.request.user.is_authenticated:
-            qs2 = Element.objects.filter(user_id=self.request.user.uuid, private=True)
-            qs = qs | qs2
-        return qs
+        return Element.objects.visible_to(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        families = Family.objects.all()
-        roots = families.filter(depth=1)
-        list = []
-        for root in roots:
-            annotated = Family.get_annotated_list(parent=root)
-            list.append(annotated)
-        context["families"] = list
-        context["lines"] = families
+        context["families"] = get_forest()
+        context["lines"] = Family.objects.all()
+        context["line_url"] = reverse("geotree:family_lines")
         context["mapbox_token"] = settings.MAPBOX_TOKEN
         if self.request.htmx:
             self.m_crypto = get_random_string(7)
@@ -103,9 +393,11 @@ class FamilyListView(HxPageTemplateMixin, ListView):
             context["l_crypto"] = self.l_crypto
         return context
 
-    def dispatch(self, request, *args, **kwargs):
-        response = super(FamilyListView, self).dispatch(request, *args, **kwargs)
-        if request.htmx:
+    def render_to_response(self, context, **response_kwargs):
+        response = super(FamilyListView, self).render_to_response(
+            context, **response_kwargs
+        )
+        if self.request.htmx:
             dict = {
                 "getMarkerCollection": self.m_crypto,
                 "getLineCollection": self.l_crypto,
@@ -114,68 +406,68 @@ class FamilyListView(HxPageTemplateMixin, ListView):
         return response
 
 
-class AuthorListView(HxPageTemplateMixin, ListView):
+class AuthorListView(DataVersionMixin, HxPageTemplateMixin, ListView):
     model = Element
     context_object_name = "elements"
     template_name = "djeotree/htmx/author_list.html"
 
     def get_queryset(self):
-        qs = Element.objects.filter(private=False)
-        if self.request.user.is_authenticated:
-            qs2 = Element.objects.filter(user_id=self.request.user.uuid, private=True)
-            qs = qs | qs2
-        return qs
+        return Element.objects.visible_to(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        authors = Element.objects.values_list("user__username", flat=True)
-        context["authors"] = list(dict.fromkeys(authors))
+        paginator = Paginator(get_authors(), AUTHORS_PER_PAGE)
+        context["authors"] = paginator.get_page(self.request.GET.get("page"))
         context["lines"] = Family.objects.all()
+        context["line_url"] = reverse("geotree:family_lines")
         context["mapbox_token"] = settings.MAPBOX_TOKEN
         if self.request.htmx:
             self.crypto = get_random_string(7)
             context["crypto"] = self.crypto
         return context
 
-    def dispatch(self, request, *args, **kwargs):
-        response = super(AuthorListView, self).dispatch(request, *args, **kwargs)
-        if request.htmx:
+    def render_to_response(self, context, **response_kwargs):
+        response = super(AuthorListView, self).render_to_response(
+            context, **response_kwargs
+        )
+        if self.request.htmx:
             dict = {"getMarkerCollection": self.crypto}
             response["HX-Trigger-After-Swap"] = json.dumps(dict)
         return response
 
 
-class TagListView(HxPageTemplateMixin, ListView):
+class TagListView(DataVersionMixin, HxPageTemplateMixin, ListView):
     model = Element
     context_object_name = "elements"
     template_name = "djeotree/htmx/tag_list.html"
 
     def get_queryset(self):
-        qs = Element.objects.filter(private=False)
-        if self.request.user.is_authenticated:
-            qs2 = Element.objects.filter(user_id=self.request.user.uuid, private=True)
-            qs = qs | qs2
-        return qs
+        return Element.objects.visible_to(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["tags"] = Tag.objects.all()
         context["lines"] = Family.objects.all()
+        context["line_url"] = reverse("geotree:family_lines")
         context["mapbox_token"] = settings.MAPBOX_TOKEN
         if self.request.htmx:
             self.crypto = get_random_string(7)
             context["crypto"] = self.crypto
         return context
 
-    def dispatch(self, request, *args, **kwargs):
-        response = super(TagListView, self).dispatch(request, *args, **kwargs)
-        if request.htmx:
+    def render_to_response(self, context, **response_kwargs):
+        response = super(TagListView, self).render_to_response(
+            context, **response_kwargs
+        )
+        if self.request.htmx:
             dict = {"getMarkerCollection": self.crypto}
             response["HX-Trigger-After-Swap"] = json.dumps(dict)
         return response
 
 
-class AuthorDetailView(HxPageTemplateMixin, ListView):
+class AuthorDetailView(
+    KeysetPageMixin, DataVersionMixin, HxPageTemplateMixin, ListView
+):
     model = Element
     context_object_name = "elements"
     template_name = "djeotree/htmx/author_detail.html"
@@ -184,12 +476,18 @@ class AuthorDetailView(HxPageTemplateMixin, ListView):
         super(AuthorDetailView, self).setup(request, *args, **kwargs)
         self.author = get_object_or_404(User, username=self.kwargs["username"])
 
+    def get_version_keys(self):
+        return [FAMILIES_KEY, AUTHOR_KEY % self.author.uuid]
+
     def get_queryset(self):
-        self.qs = Element.objects.filter(user_id=self.author.uuid, private=False)
-        if self.request.user.is_authenticated:
-            qs2 = Element.objects.filter(user_id=self.request.user.uuid, private=True)
-            self.qs = self.qs | qs2
-        return self.qs.order_by("family", "id")
+        self.qs = Element.objects.visible_to(self.request.user).filter(
+            user_id=self.author.uuid
+        )
+        return (
+            self.qs.select_related("family", "user")
+            .defer("family__geom", "family__popup_cache")
+            .order_by("family", "id")
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -200,15 +498,19 @@ class AuthorDetailView(HxPageTemplateMixin, ListView):
             context["crypto"] = self.crypto
         return context
 
-    def dispatch(self, request, *args, **kwargs):
-        response = super(AuthorDetailView, self).dispatch(request, *args, **kwargs)
-        if request.htmx:
+    def render_to_response(self, context, **response_kwargs):
+        response = super(AuthorDetailView, self).render_to_response(
+            context, **response_kwargs
+        )
+        if self.request.htmx and not self.is_next_page():
             dict = {"getMarkerCollection": self.crypto}
             response["HX-Trigger-After-Swap"] = json.dumps(dict)
         return response
 
 
-class FamilyDetailView(HxPageTemplateMixin, ListView):
+class FamilyDetailView(
+    KeysetPageMixin, DataVersionMixin, HxPageTemplateMixin, ListView
+):
     model = Element
     context_object_name = "elements"
     template_name = "djeotree/htmx/family_detail.html"
@@ -217,25 +519,26 @@ class FamilyDetailView(HxPageTemplateMixin, ListView):
         super(FamilyDetailView, self).setup(request, *args, **kwargs)
         self.family = get_object_or_404(Family, id=self.kwargs["pk"])
 
+    def get_version_keys(self):
+        # elements of descendants bump the family too
+        return [FAMILIES_KEY, FAMILY_KEY % self.family.id]
+
     def get_queryset(self):
-        list = [self.family.id]
-        children = self.family.get_descendants()
-        for child in children:
-            list.append(child.id)
-        self.qs = Element.objects.filter(family_id__in=list, private=False)
-        if self.request.user.is_authenticated:
-            qs2 = Element.objects.filter(
-                user_id=self.request.user.uuid, family_id__in=list, private=True
-            )
-            self.qs = self.qs | qs2
-        return self.qs.order_by("family", "id")
+        self.qs = Element.objects.visible_to(self.request.user).in_subtree(self.family)
+        # family and user are in element links, family lines aren't needed
+        return (
+            self.qs.select_related("family", "user")
+            .defer("family__geom", "family__popup_cache")
+            .order_by("family", "id")
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["family"] = self.family
-        # combine descendants and self family querysets
-        context["lines"] = self.family.get_descendants() | Family.objects.filter(
-            id=self.family.id
+        context["lines"] = self.family.get_subtree()
+        context["line_url"] = "%s?family=%s" % (
+            reverse("geotree:family_lines"),
+            self.family.id,
         )
         if self.request.htmx:
             self.m_crypto = get_random_string(7)
@@ -245,9 +548,11 @@ class FamilyDetailView(HxPageTemplateMixin, ListView):
         context["mapbox_token"] = settings.MAPBOX_TOKEN
         return context
 
-    def dispatch(self, request, *args, **kwargs):
-        response = super(FamilyDetailView, self).dispatch(request, *args, **kwargs)
-        if request.htmx:
+    def render_to_response(self, context, **response_kwargs):
+        response = super(FamilyDetailView, self).render_to_response(
+            context, **response_kwargs
+        )
+        if self.request.htmx and not self.is_next_page():
             dict = {
                 "getMarkerCollection": self.m_crypto,
                 "getLineCollection": self.l_crypto,
@@ -256,7 +561,7 @@ class FamilyDetailView(HxPageTemplateMixin, ListView):
         return response
 
 
-class TagDetailView(HxPageTemplateMixin, ListView):
+class TagDetailView(KeysetPageMixin, DataVersionMixin, HxPageTemplateMixin, ListView):
     model = Element
     context_object_name = "elements"
     template_name = "djeotree/htmx/tag_detail.html"
@@ -265,34 +570,96 @@ class TagDetailView(HxPageTemplateMixin, ListView):
         super(TagDetailView, self).setup(request, *args, **kwargs)
         self.tag = get_object_or_404(Tag, id=self.kwargs["pk"])
 
+    def get_version_keys(self):
+        return [FAMILIES_KEY, TAG_KEY % self.tag.id]
+
     def get_queryset(self):
-        e_values = self.tag.element_tag_value
-        list = e_values.values_list("element_id", flat=True)
-        self.qs = Element.objects.filter(id__in=list, private=False)
-        if self.request.user.is_authenticated:
-            qs2 = Element.objects.filter(
-                user_id=self.request.user.uuid, id__in=list, private=True
-            )
-            self.qs = self.qs | qs2
-        return self.qs.order_by("family", "id")
+        self.qs = Element.objects.visible_to(self.request.user).with_tags(
+            [(self.tag.id, None)]
+        )
+        # family and user are in element links, family lines aren't needed
+        return (
+            self.qs.select_related("family", "user")
+            .defer("family__geom", "family__popup_cache")
+            .order_by("family", "id")
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["tag"] = self.tag
+        context["values"] = self.qs.facets().filter(tag_id=self.tag.id)
         context["mapbox_token"] = settings.MAPBOX_TOKEN
         if self.request.htmx:
             self.crypto = get_random_string(7)
             context["crypto"] = self.crypto
         return context
 
-    def dispatch(self, request, *args, **kwargs):
-        response = super(TagDetailView, self).dispatch(request, *args, **kwargs)
-        if request.htmx:
+    def render_to_response(self, context, **response_kwargs):
+        response = super(TagDetailView, self).render_to_response(
+            context, **response_kwargs
+        )
+        if self.request.htmx and not self.is_next_page():
+            dict = {"getMarkerCollection": self.crypto}
+            response["HX-Trigger-After-Swap"] = json.dumps(dict)
+        return response
+
+
+class ElementSearchView(
+    KeysetPageMixin, DataVersionMixin, HxPageTemplateMixin, ListView
+):
+    """Lists visible elements matching q parameter, best matches first"""
+
+    model = Element
+    page_fields = ("rank", "id")
+    context_object_name = "elements"
+    template_name = "djeotree/htmx/element_search.html"
+    version_keys = [DATA_KEY, SEARCH_KEY]
+
+    def get_queryset(self):
+        self.query = self.request.GET.get("q", "")
+        qs = search(Element.objects.visible_to(self.request.user), self.query)
+        # family and user are in element links, family lines aren't needed
+        return (
+            qs.select_related("family", "user")
+            .defer("family__geom", "family__popup_cache")
+            .order_by("rank", "id")
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.query
+        context["mapbox_token"] = settings.MAPBOX_TOKEN
+        if self.request.htmx:
+            self.crypto = get_random_string(7)
+            context["crypto"] = self.crypto
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super(ElementSearchView, self).render_to_response(
+            context, **response_kwargs
+        )
+        if self.request.htmx and not self.is_next_page():
             dict = {"getMarkerCollection": self.crypto}
             response["HX-Trigger-After-Swap"] = json.dumps(dict)
         return response
 
 
+class ElementSearchFeatureView(DataVersionMixin, View):
+    """
+    Returns up to SEARCH_MAX visible elements matching q parameter as
+    GeoJSON, best matches first
+    """
+
+    version_keys = [DATA_KEY, SEARCH_KEY]
+
+    def get(self, request, *args, **kwargs):
+        qs = search(Element.objects.visible_to(request.user), request.GET.get("q", ""))
+        return HttpResponse(
+            get_collection(qs.order_by("rank", "id")[:SEARCH_MAX]),
+            content_type="application/json",
+        )
+
+
 class ElementDetailView(DetailView):
     model = Element
     context_object_name = "element"
@@ -313,12 +680,13 @@ class ElementDetailView(DetailView):
         context["author"] = self.object.user
         context["mapbox_token"] = settings.MAPBOX_TOKEN
         context["main_gal_slug"] = get_random_string(7)
-        context["images"] = self.object.element_image.all()
+        context["images"] = self.object.element_image.prefetch_related("image_version")
         return context
 
 
-class ElementDayArchiveView(DayArchiveView):
+class ElementDayArchiveView(KeysetPageMixin, DataVersionMixin, DayArchiveView):
     model = Element
+    page_fields = ("date", "id")
     date_field = "date"
     context_object_name = "elements"
     year_format = "%Y"
@@ -328,12 +696,13 @@ class ElementDayArchiveView(DayArchiveView):
     template_name = "djeotree/day_detail.html"
 
     def get_queryset(self):
-        original = super(ElementDayArchiveView, self).get_queryset()
-        qs = original.filter(private=False)
-        if self.request.user.is_authenticated:
-            qs2 = original.filter(user_id=self.request.user.uuid, private=True)
-            qs = qs | qs2
-        return qs.order_by("family", "id")
+        qs = super(ElementDayArchiveView, self).get_queryset()
+        return (
+            qs.visible_to(self.request.user)
+            .select_related("family", "user")
+            .defer("family__geom", "family__popup_cache")
+            .order_by("date", "id")
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -341,8 +710,9 @@ class ElementDayArchiveView(DayArchiveView):
         return context
 
 
-class ElementMonthArchiveView(MonthArchiveView):
+class ElementMonthArchiveView(KeysetPageMixin, DataVersionMixin, MonthArchiveView):
     model = Element
+    page_fields = ("date", "id")
     date_field = "date"
     context_object_name = "elements"
     year_format = "%Y"
@@ -351,21 +721,27 @@ class ElementMonthArchiveView(MonthArchiveView):
     template_name = "djeotree/month_detail.html"
 
     def get_queryset(self):
-        original = super(ElementMonthArchiveView, self).get_queryset()
-        qs = original.filter(private=False)
-        if self.request.user.is_authenticated:
-            qs2 = original.filter(user_id=self.request.user.uuid, private=True)
-            qs = qs | qs2
-        return qs.order_by("family", "id")
+        qs = super(ElementMonthArchiveView, self).get_queryset()
+        return (
+            qs.visible_to(self.request.user)
+            .select_related("family", "user")
+            .defer("family__geom", "family__popup_cache")
+            .order_by("date", "id")
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["mapbox_token"] = settings.MAPBOX_TOKEN
+        month = context["month"]
+        context["days"] = get_days(
+            get_calendar(self.request.user), month.year, month.month
+        )
         return context
 
 
-class ElementYearArchiveView(YearArchiveView):
+class ElementYearArchiveView(KeysetPageMixin, DataVersionMixin, YearArchiveView):
     model = Element
+    page_fields = ("date", "id")
     date_field = "date"
     make_object_list = True
     context_object_name = "elements"
@@ -374,16 +750,20 @@ class ElementYearArchiveView(YearArchiveView):
     template_name = "djeotree/year_detail.html"
 
     def get_queryset(self):
-        original = super(ElementYearArchiveView, self).get_queryset()
-        qs = original.filter(private=False)
-        if self.request.user.is_authenticated:
-            qs2 = original.filter(user_id=self.request.user.uuid, private=True)
-            qs = qs | qs2
-        return qs.order_by("family", "id")
+        qs = super(ElementYearArchiveView, self).get_queryset()
+        return (
+            qs.visible_to(self.request.user)
+            .select_related("family", "user")
+            .defer("family__geom", "family__popup_cache")
+            .order_by("date", "id")
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["mapbox_token"] = settings.MAPBOX_TOKEN
+        context["months"] = get_months(
+            get_calendar(self.request.user), context["year"].year
+        )
         return context
 
 
@@ -392,6 +772,12 @@ class ElementCreateView(LoginRequiredMixin, CreateView):
     form_class = ElementCreateForm
     template_name = "djeotree/includes/element_create.html"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # elements near the user are shown once located
+        context["nearby_url"] = reverse("geotree:element_nearby")
+        return context
+
     def form_valid(self, form):
         form.instance.user = self.request.user
         return super(ElementCreateView, self).form_valid(form)
@@ -415,6 +801,13 @@ class ElementUpdateView(LoginRequiredMixin, UpdateView):
             raise Http404(_("Element does not belong to User"))
         return self.object
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        images = self.object.element_image.with_processing()
+        context["images"] = images.prefetch_related("image_version")
+        context["processing"] = any(image.processing for image in context["images"])
+        return context
+
     def form_valid(self, form):
         if form.instance.user != self.request.user:
             raise PermissionDenied
@@ -459,6 +852,10 @@ class ImageLoopView(LoginRequiredMixin, HxOnlyTemplateMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["element"] = self.element
+        # images with queued versions are shown as processing, and polled
+        images = self.element.element_image.with_processing()
+        context["images"] = images.prefetch_related("image_version")
+        context["processing"] = any(image.processing for image in context["images"])
         return context
 
 
@@ -517,50 +914,57 @@ class ImageDeleteView(LoginRequiredMixin, HxOnlyTemplateMixin, RedirectView):
         self.element = image.element
         if self.element.user != self.request.user:
             raise PermissionDenied
-        next = self.element.element_image.filter(position__gt=image.position)
         messages.error(request, _('Image "%s" deleted') % image.id)
+        # following images are shifted back
         image.delete()
-        for img in next:
-            img.position -= 1
-            img.save()
 
     def get_redirect_url(self, *args, **kwargs):
         return reverse("geotree:image_loop", kwargs={"pk": self.element.id})
 
 
 class ImageMoveUpView(LoginRequiredMixin, HxOnlyTemplateMixin, RedirectView):
+    offset = -1
+
     def setup(self, request, *args, **kwargs):
         super(ImageMoveUpView, self).setup(request, *args, **kwargs)
         image = get_object_or_404(ElementImage, id=self.kwargs["pk"])
-        previous = get_object_or_404(
-            ElementImage, element_id=image.element.id, position=image.position - 1
-        )
         self.element = image.element
         if self.element.user != self.request.user:
             raise PermissionDenied
-        image.position -= 1
-        image.save()
-        previous.position += 1
-        previous.save()
+        try:
+            image.move(self.offset)
+        except ValueError:
+            raise Http404(_("Image can't be moved"))
 
     def get_redirect_url(self, *args, **kwargs):
         return reverse("geotree:image_loop", kwargs={"pk": self.element.id})
 
 
-class ImageMoveDownView(LoginRequiredMixin, HxOnlyTemplateMixin, RedirectView):
+class ImageMoveDownView(ImageMoveUpView):
+    offset = 1
+
+
+class ImageReorderView(LoginRequiredMixin, HxOnlyTemplateMixin, RedirectView):
+    """Sets order of all images of an element, i.e. after drag and drop"""
+
+    http_method_names = ["post"]
+
     def setup(self, request, *args, **kwargs):
-        super(ImageMoveDownView, self).setup(request, *args, **kwargs)
-        image = get_object_or_404(ElementImage, id=self.kwargs["pk"])
-        next = get_object_or_404(
-            ElementImage, element_id=image.element.id, position=image.position + 1
-        )
-        self.element = image.element
+        super(ImageReorderView, self).setup(request, *args, **kwargs)
+        self.element = get_object_or_404(Element, id=self.kwargs["pk"])
+
+    def post(self, request, *args, **kwargs):
         if self.element.user != self.request.user:
             raise PermissionDenied
-        image.position += 1
-        image.save()
-        next.position -= 1
-        next.save()
+        try:
+            ids = [int(id) for id in request.POST.getlist("image")]
+        except ValueError:
+            raise SuspiciousOperation(_("Invalid image list"))
+        try:
+            ElementImage.reorder(self.element.id, ids)
+        except ValueError:
+            messages.error(request, _("Images changed meanwhile, order not saved"))
+        return super(ImageReorderView, self).post(request, *args, **kwargs)
 
     def get_redirect_url(self, *args, **kwargs):
         return reverse("geotree:image_loop", kwargs={"pk": self.element.id})
@@ -605,6 +1009,8 @@ class ValueUpdateView(LoginRequiredMixin, HxOnlyTemplateMixin, UpdateView):
     def form_valid(self, form):
         if self.object.element.user != self.request.user:
             raise PermissionDenied
+        # value set by the author is no more synced with family
+        form.instance.inherited = False
         return super(ValueUpdateView, self).form_valid(form)
 
     def get_success_url(self):
@@ -622,23 +1028,40 @@ class ValueDeleteView(LoginRequiredMixin, HxOnlyTemplateMixin, TemplateView):
             raise PermissionDenied
         messages.error(request, _('Tag "%s" deleted') % self.value.tag.title)
         self.value.delete()
-
-
-def csv_writer(writer, qs):
-    writer.writerow(
-        [
-            _("ID"),
-            _("Family"),
-            _("Images"),
-            _("Description"),
-            _("Latitude"),
-            _("Longitude"),
-            _("Date"),
-            _("Text"),
-            _("Data sheet"),
-        ]
+        # no post_delete receiver for values, see versions.values_changed
+        values_changed([self.value.element_id], [self.value.tag_id])
+
+
+class Echo:
+    """Pseudo buffer that returns written rows instead of storing them"""
+
+    def write(self, value):
+        return value
+
+
+def csv_rows(qs, chunk_size=500):
+    """
+    Yields csv rows of elements, fetching them in chunks with related family,
+    images and tag values, so only a few queries are performed per chunk
+    """
+    yield [
+        _("ID"),
+        _("Family"),
+        _("Images"),
+        _("Description"),
+        _("Latitude"),
+        _("Longitude"),
+        _("Date"),
+        _("Text"),
+        _("Data sheet"),
+    ]
+    qs = qs.select_related("family").prefetch_related(
+        "element_image",
+        Prefetch(
+            "element_value", queryset=ElementTagValue.objects.select_related("tag")
+        ),
     )
-    for e in qs:
+    for e in qs.iterator(chunk_size=chunk_size):
         image_list = []
         images = e.element_image.all()
         for image in images:
@@ -658,33 +1081,30 @@ def csv_writer(writer, qs):
         for value in values:
             row.append(value.tag.title)
             row.append(value.value)
-        writer.writerow(row)
-    return writer
+        yield row
 
 
 def family_element_download(request, pk):
-    # Create the HttpResponse object with the appropriate CSV header.
-    response = HttpResponse(content_type="text/csv")
+    family = get_object_or_404(Family, id=pk)
+    qs = Element.objects.visible_to(request.user).in_subtree(family)
+    qs = qs.order_by("family", "id")
+
+    # Stream the csv, so that memory doesn't grow with number of elements
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in csv_rows(qs)), content_type="text/csv"
+    )
     response[
         "Content-Disposition"
     ] = 'attachment; filename="%(family)s-%(id)s-elements.csv"' % {
         "family": _("Family"),
         "id": pk,
     }
-    family = get_object_or_404(Family, id=pk)
-    list = [pk]
-    children = family.get_descendants()
-    for child in children:
-        list.append(child.id)
-    qs = Element.objects.filter(family_id__in=list, private=False)
-    if request.user.is_authenticated:
-        qs2 = Element.objects.filter(
-            user_id=request.user.uuid, family_id__in=list, private=True
-        )
-        qs = qs | qs2
-    qs.order_by("family", "id")
+    return response
 
-    writer = csv.writer(response)
-    writer = csv_writer(writer, qs)
 
-    return response
+def element_tile(request, zoom, x, y):
+    """Returns cached GeoJSON of public elements and family lines of a tile"""
+    if zoom > TILE_MAX_ZOOM or x >= 2**zoom or y >= 2**zoom:
+        raise Http404(_("Tile does not exist"))
+    return HttpResponse(get_tile(zoom, x, y), content_type="application/json")